@@ -1,113 +1,81 @@
 from django.contrib import admin
+from django.http import JsonResponse
+from django.urls import path
 from django.utils.html import format_html
-import pandas as pd
-from zipfile import ZipFile
-from django.core.files.base import ContentFile
-import io
-import os
+from collections import Counter
+from django.conf import settings
 from django.db import transaction
 from django.contrib import messages
 from .models import (
-    MasterCategory, MasterProduct, MasterProductUpload, Merchant, Product,
-    PendingProduct, Notification # Added new models
+    MasterCategory, MasterProduct, MasterProductUpload, Product,
+    PendingProduct, Notification, NotificationBroadcast # Added new models
 )
+from .jobs import enqueue_uploads, run_after_commit
+from .moderation import approve_pending_products, move_pending_images, reject_pending_products
+from .notifications import mark_read, mark_unread, send_broadcast_by_id, sendable_broadcasts
+from .pagination import EstimatedCountPaginator
+from .suggestions import suggest_categories
 import logging
 
 logger = logging.getLogger(__name__)
 
 @admin.register(MasterProductUpload)
 class MasterProductUploadAdmin(admin.ModelAdmin):
-    list_display = ['uploaded_at']
+    list_display = ['uploaded_at', 'status', 'progress', 'throughput_display', 'eta_display']
+    list_filter = ['status']
+    readonly_fields = [
+        'status', 'queued_at', 'started_at', 'heartbeat_at', 'finished_at', 'rows_total', 'rows_done', 'rows_failed',
+        'throughput_display', 'eta_display', 'last_error', 'error_report',
+    ]
     actions = ['process_upload']
 
     def save_model(self, request, obj, form, change):
         """Only save the upload instance, processing happens via action"""
         super().save_model(request, obj, form, change)
 
+    def get_urls(self):
+        urls = [
+            path('<path:object_id>/progress/', self.admin_site.admin_view(self.progress_view),
+                 name='merchant_masterproductupload_progress'),
+        ]
+        return urls + super().get_urls()
+
+    def progress_view(self, request, object_id):
+        """JSON progress snapshot for polling while the worker runs"""
+        upload = self.get_object(request, object_id)
+        if upload is None:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+        return JsonResponse({
+            'id': upload.pk,
+            'status': upload.status,
+            'rows_total': upload.rows_total,
+            'rows_done': upload.rows_done,
+            'rows_failed': upload.rows_failed,
+            'throughput': upload.throughput,
+            'eta_seconds': upload.eta_seconds,
+            'last_error': upload.last_error,
+            'error_count': len(upload.error_report),
+        })
+
     def process_upload(self, request, queryset):
-        """Custom admin action to process uploads"""
-        for upload in queryset:
-            try:
-                self._process_upload_file(upload)
-                self.message_user(request, f"Successfully processed {upload.excel_file.name}")
-            except Exception as e:
-                self.message_user(request, f"Error processing {upload.excel_file.name}: {str(e)}", level='error')
+        """Custom admin action to queue uploads for the background worker"""
+        queued = enqueue_uploads(queryset)
+        self.message_user(request, f"Queued {queued} upload(s). Run 'manage.py process_master_uploads' to process them.")
     process_upload.short_description = "Process selected uploads"
 
-    def _process_upload_file(self, upload):
-        excel_file = upload.excel_file
-        zip_file = upload.image_zip
-
-        # Read Excel file
-        try:
-            df = pd.read_excel(excel_file)
-            required_columns = {'name', 'category', 'business_category', 'image_name'}
-            if not required_columns.issubset(df.columns):
-                raise ValueError(f"Excel missing required columns: {required_columns - set(df.columns)}")
-        except Exception as e:
-            raise ValueError(f"Invalid Excel file: {str(e)}")
-
-        # Process ZIP file
-        zip_data = zip_file.read()
-        zip_io = io.BytesIO(zip_data)
-
-        with ZipFile(zip_io, 'r') as archive:
-            image_files = {name: archive.read(name) for name in archive.namelist()}
-
-        # Process rows
-        success_count = 0
-        for index, row in df.iterrows():
-            try:
-                name = str(row['name']).strip()
-                brand = str(row.get('brand', '')).strip()
-                description = str(row.get('description', '')).strip()
-                category_name = str(row['category']).strip()
-                business_category = str(row['business_category']).strip()
-                image_name = str(row['image_name']).strip()
-
-                # Validate business category
-                if business_category not in dict(Merchant.CATEGORY_CHOICES).keys():
-                    print(f"⚠️ Invalid business category: {business_category} for product {name}")
-                    continue
-
-                # Get or create category
-                category_obj, _ = MasterCategory.objects.get_or_create(
-                    name=category_name,
-                    defaults={'business_category': business_category}
-                )
-
-                # Check for duplicates
-                if MasterProduct.objects.filter(name=name, brand=brand, category=category_obj).exists():
-                    print(f"⏩ Skipping duplicate: {name} ({brand})")
-                    continue
-
-                # Create product
-                product = MasterProduct(
-                    name=name,
-                    brand=brand if brand else None,
-                    description=description if description else None,
-                    category=category_obj
-                )
-
-                # Handle image
-                if image_name in image_files:
-                    product.image.save(
-                        image_name,
-                        ContentFile(image_files[image_name]),
-                        save=False
-                    )
-                else:
-                    print(f"⚠️ Image not found: {image_name} for product {name}")
-
-                product.save()
-                success_count += 1
-                print(f"✅ Saved: {product.name}")
+    def progress(self, obj):
+        if obj.rows_total:
+            return f"{obj.rows_done}/{obj.rows_total} ({obj.rows_failed} failed)"
+        return f"{obj.rows_done} ({obj.rows_failed} failed)"
+    progress.short_description = 'Rows'
 
-            except Exception as e:
-                print(f"❌ Error processing row {index}: {str(e)}")
-                continue
+    def throughput_display(self, obj):
+        return f"{obj.throughput:.0f} rows/s" if obj.throughput else '-'
+    throughput_display.short_description = 'Throughput'
 
-        print(f"Processed {success_count}/{len(df)} products successfully")
+    def eta_display(self, obj):
+        return f"{obj.eta_seconds:.0f}s" if obj.eta_seconds is not None else '-'
+    eta_display.short_description = 'ETA'
 
 
 @admin.register(MasterCategory)
@@ -119,6 +87,9 @@ class MasterCategoryAdmin(admin.ModelAdmin):
 @admin.register(MasterProduct)
 class MasterProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'brand', 'get_category', 'get_business_category', 'image_preview']
+    list_select_related = ['category']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     search_fields = ['name', 'brand', 'category__name']
     list_filter = ['category__business_category', 'category']
     readonly_fields = ['image_preview']
@@ -141,11 +112,14 @@ class MasterProductAdmin(admin.ModelAdmin):
 @admin.register(PendingProduct)
 class PendingProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'merchant_email', 'is_approved', 'category_name', 'created_at', 'admin_notes_short', 'product_image_preview']
+    list_select_related = ['merchant__profile', 'category']  # __str__ shows the business name
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_filter = ['is_approved', 'created_at']
     search_fields = ['name', 'merchant__email', 'merchant__full_name', 'admin_notes']
     # Removed is_approved from readonly_fields to allow admin to change it directly on the form
     readonly_fields = ['product_image_preview', 'created_at', 'updated_at', 'merchant', 'name', 'description', 'stock', 'original_price', 'discount_price']
-    actions = ['approve_selected_products', 'reject_selected_products']
+    actions = ['approve_selected_products', 'reject_selected_products', 'fill_suggested_categories']
     fieldsets = (
         (None, {
             'fields': (('name', 'merchant'), 'description', ('stock', 'original_price', 'discount_price'), 'product_image_preview', )
@@ -161,7 +135,7 @@ class PendingProductAdmin(admin.ModelAdmin):
     )
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('merchant', 'category')
+        return super().get_queryset(request).select_related(*self.list_select_related)
 
     def merchant_email(self, obj):
         return obj.merchant.email
@@ -221,26 +195,13 @@ class PendingProductAdmin(admin.ModelAdmin):
                         original_price=obj.original_price,
                         discount_price=obj.discount_price,
                         category=obj.category,
+                        pending_image=obj.image.name if obj.image else '',
                     )
                     logger.info(f"New Product instance created. ID: {product.id}, Name: {product.name}")
 
-                    # Copy image from pending product to new product
-                    if obj.image:
-                        try:
-                            # Re-open the file from storage to read its content
-                            with obj.image.open('rb') as f:
-                                product.image.save(
-                                    os.path.basename(obj.image.name),
-                                    ContentFile(f.read()),
-                                    save=True
-                                )
-                            logger.info(f"Image successfully copied for product {product.id}.")
-                            # After successful copy, delete the image from pending_products storage
-                            obj.image.delete(save=False)
-                            logger.info(f"Pending product image deleted for {obj.id}.")
-                        except Exception as e:
-                            logger.error(f"Failed to copy or delete image from pending product {obj.id} to approved product {product.id}: {str(e)}")
-                            messages.warning(request, f"Image for '{obj.name}' could not be copied. Product approved without image. Error: {str(e)}")
+                    # Move image from pending product to new product, off the request once this commits
+                    if product.pending_image:
+                        run_after_commit(move_pending_images, [product.pk])
                     else:
                         logger.info(f"No image found for pending product {obj.id} to copy.")
 
@@ -272,108 +233,56 @@ class PendingProductAdmin(admin.ModelAdmin):
 
     @admin.action(description="Approve selected pending products")
     def approve_selected_products(self, request, queryset):
-        approved_count = 0
-        for pending_product in queryset.filter(is_approved=False):
-            if not pending_product.category:
-                self.message_user(request, f"Product '{pending_product.name}' by {pending_product.merchant.email} cannot be approved: Category is not set. Please set a category manually.", level=messages.ERROR)
-                continue
-            
-            with transaction.atomic():
-                try:
-                    logger.info(f"Admin action: Approving pending product ID: {pending_product.id}")
-                    # Create actual Product instance
-                    product = Product.objects.create(
-                        merchant=pending_product.merchant,
-                        name=pending_product.name,
-                        description=pending_product.description,
-                        stock=pending_product.stock,
-                        original_price=pending_product.original_price,
-                        discount_price=pending_product.discount_price,
-                        category=pending_product.category, # Use the category set by admin
-                    )
-                    logger.info(f"Admin action: New Product instance created. ID: {product.id}")
-                    
-                    # Copy image from pending product to new product
-                    if pending_product.image:
-                        try:
-                            with pending_product.image.open('rb') as f:
-                                product.image.save(
-                                    os.path.basename(pending_product.image.name),
-                                    ContentFile(f.read()),
-                                    save=True
-                                )
-                            logger.info(f"Admin action: Image copied for product {product.id}.")
-                            pending_product.image.delete(save=False)
-                            logger.info(f"Admin action: Pending product image deleted for {pending_product.id}.")
-                        except Exception as e:
-                            logger.error(f"Admin action: Failed to copy or delete image for {pending_product.id}: {str(e)}")
-                            messages.warning(request, f"Image for '{pending_product.name}' could not be copied. Product approved without image. Error: {str(e)}")
-
-
-                    # Create notification for merchant
-                    try:
-                        Notification.objects.create(
-                            recipient=product.merchant,
-                            message=f"Your new product '{product.name}' has been approved under category: '{product.category.name}'.",
-                            product=product
-                        )
-                        logger.info(f"Admin action: Notification created for merchant {product.merchant.email}.")
-                    except Exception as e:
-                        logger.error(f"Admin action: Failed to create notification for merchant {product.merchant.email} for product {product.id}: {str(e)}")
-                        messages.warning(request, f"Product '{pending_product.name}' approved, but notification failed. Error: {str(e)}")
-                    
-                    pending_product.delete()
-                    logger.info(f"Admin action: Pending product {pending_product.id} successfully deleted.")
-                    approved_count += 1
-                except Exception as e:
-                    logger.exception(f"Admin action: Error approving pending product {pending_product.id}: {str(e)}")
-                    self.message_user(request, f"Failed to approve '{pending_product.name}' by {pending_product.merchant.email}: {str(e)}", level=messages.ERROR)
-        
-        if approved_count > 0:
-            self.message_user(request, f"Successfully approved {approved_count} product(s).")
-        else:
-            self.message_user(request, "No products were approved.", level=messages.INFO)
-
+        results = self._moderate(queryset, approve_pending_products)
+        self._report(request, results, 'approved')
 
     @admin.action(description="Reject selected pending products")
     def reject_selected_products(self, request, queryset):
-        rejected_count = 0
-        for pending_product in queryset.filter(is_approved=False):
-            with transaction.atomic():
-                try:
-                    logger.info(f"Admin action: Rejecting pending product ID: {pending_product.id}")
-                    # Create notification for merchant about rejection
-                    Notification.objects.create(
-                        recipient=pending_product.merchant,
-                        message=f"Your product '{pending_product.name}' was reviewed and rejected. Please contact support for more details if needed.",
-                    )
-                    logger.info(f"Admin action: Rejection notification created for merchant {pending_product.merchant.email}.")
-                    
-                    # Delete pending product image from storage if exists
-                    if pending_product.image:
-                        try:
-                            pending_product.image.delete(save=False)
-                            logger.info(f"Admin action: Pending product image deleted upon rejection for {pending_product.id}.")
-                        except Exception as e:
-                            logger.error(f"Admin action: Failed to delete pending product image {pending_product.image.name} upon rejection: {str(e)}")
-
-                    pending_product.delete()
-                    logger.info(f"Admin action: Pending product {pending_product.id} successfully deleted after rejection.")
-                    rejected_count += 1
-                except Exception as e:
-                    logger.exception(f"Admin action: Error rejecting pending product {pending_product.id}: {str(e)}")
-                    self.message_user(request, f"Failed to reject '{pending_product.name}' by {pending_product.merchant.email}: {str(e)}", level=messages.ERROR)
-        
-        if rejected_count > 0:
-            self.message_user(request, f"Successfully rejected {rejected_count} product(s).")
+        results = self._moderate(
+            queryset, reject_pending_products,
+            default_notes="Please contact support for more details if needed.",
+        )
+        self._report(request, results, 'rejected')
+
+    @admin.action(description="Set missing categories from the top suggestion")
+    def fill_suggested_categories(self, request, queryset):
+        pending = list(queryset.filter(is_approved=False, category__isnull=True))
+        suggestions = suggest_categories(pending, k=1)
+        filled = []
+        for item in pending:
+            if suggestions[item.pk]:
+                item.category_id = suggestions[item.pk][0]['category_id']
+                filled.append(item)
+        PendingProduct.objects.bulk_update(filled, ['category'])
+        self.message_user(request, f"Suggested a category for {len(filled)} of {len(pending)} product(s). Review them before approving.")
+
+    def _moderate(self, queryset, moderate, **kwargs):
+        """Run the batched moderation engine over the selection, PENDING_PRODUCT_BULK_MAX_ITEMS at a time"""
+        ids = list(queryset.filter(is_approved=False).order_by('pk').values_list('pk', flat=True))
+        size = getattr(settings, 'PENDING_PRODUCT_BULK_MAX_ITEMS', 1000)
+        results = []
+        for start in range(0, len(ids), size):
+            results += moderate([{'id': pk} for pk in ids[start:start + size]], **kwargs)
+        return results
+
+    def _report(self, request, results, done):
+        succeeded = sum(1 for result in results if result['status'] == done)
+        if succeeded:
+            self.message_user(request, f"Successfully {done} {succeeded} product(s).")
         else:
-            self.message_user(request, "No products were rejected.", level=messages.INFO)
+            self.message_user(request, f"No products were {done}.", level=messages.INFO)
+        failures = Counter(result['error'] for result in results if result['status'] == 'error')
+        for error, count in failures.items():
+            self.message_user(request, f"{count} product(s) skipped: {error}", level=messages.ERROR)
 
 
 # ---------------------- NEW: Notification Admin -------------------
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ['recipient', 'message_summary', 'is_read', 'created_at']
+    list_select_related = ['recipient']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_filter = ['is_read', 'created_at']
     search_fields = ['recipient__email', 'message']
     readonly_fields = ['recipient', 'message', 'product', 'created_at']
@@ -385,10 +294,31 @@ class NotificationAdmin(admin.ModelAdmin):
 
     @admin.action(description="Mark selected notifications as read")
     def mark_as_read(self, request, queryset):
-        updated = queryset.update(is_read=True)
+        updated = mark_read(queryset)
         self.message_user(request, f"{updated} notifications marked as read.")
 
     @admin.action(description="Mark selected notifications as unread")
     def mark_as_unread(self, request, queryset):
-        updated = queryset.update(is_read=False)
-        self.message_user(request, f"{updated} notifications marked as unread.")
\ No newline at end of file
+        updated = mark_unread(queryset)
+        self.message_user(request, f"{updated} notifications marked as unread.")
+
+
+# ---------------------- Notification Broadcast Admin -------------------
+@admin.register(NotificationBroadcast)
+class NotificationBroadcastAdmin(admin.ModelAdmin):
+    list_display = ['message_summary', 'business_category', 'city', 'status', 'sent_count', 'created_at']
+    list_filter = ['status', 'business_category']
+    search_fields = ['message', 'city']
+    readonly_fields = ['status', 'started_at', 'heartbeat_at', 'finished_at', 'sent_count', 'last_recipient_id', 'last_error']
+    actions = ['send_broadcasts']
+
+    def message_summary(self, obj):
+        return (obj.message[:100] + '...') if len(obj.message) > 100 else obj.message
+    message_summary.short_description = 'Message'
+
+    @admin.action(description="Send selected broadcasts (failed or stalled ones resume where they stopped)")
+    def send_broadcasts(self, request, queryset):
+        broadcasts = list(sendable_broadcasts(queryset).values_list('pk', flat=True))
+        for broadcast_id in broadcasts:
+            run_after_commit(send_broadcast_by_id, broadcast_id)
+        self.message_user(request, f"Sending {len(broadcasts)} broadcast(s) in the background.")
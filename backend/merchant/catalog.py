@@ -0,0 +1,96 @@
+import logging
+
+from django.db import transaction
+
+from .jobs import run_after_commit
+from .models import Product
+from .storage import attach_master_images
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------- Bulk add from the master catalog -------------------
+def products_from_master(merchant, master_products):
+    """Unsaved merchant products mirroring the given master products (categories must be loaded)"""
+    return [
+        Product(
+            merchant=merchant,
+            master_product=mp,
+            name=mp.name,
+            description=mp.description or '',
+            category=mp.category,
+            stock=0,
+            original_price=0,
+            discount_price=0,
+        )
+        for mp in master_products
+    ]
+
+
+def bulk_add_from_master(merchant, master_products, defer_images=False):
+    """
+    Insert one product per master product with a single bulk_create. Images are shared in one
+    batch, either inline or, with ``defer_images``, on a background thread after commit so the
+    caller's transaction stays short. Deferred products are flagged image_pending until then,
+    so images lost with the process are picked up by attach_pending_master_images.
+    """
+    products = products_from_master(merchant, master_products)
+    if defer_images:
+        for product in products:
+            product.image_pending = bool(product.master_product.image)
+    with transaction.atomic():
+        created = Product.objects.bulk_create(products)
+    if defer_images:
+        run_after_commit(attach_master_images_by_id, [p.pk for p in created if p.image_pending])
+    else:
+        _attach_images(created)
+    return created
+
+
+def attach_master_images_by_id(product_ids):
+    """
+    Attach the master images of the given products that are still image_pending. The rows are
+    locked and their flag cleared in the same transaction, so running twice never takes two
+    references, and rows another worker holds are left to it. A batch that fails is retried one
+    product at a time, and a product that fails on its own has its flag cleared so it is not
+    retried forever.
+    """
+    try:
+        with transaction.atomic():
+            products = list(
+                Product.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(pk__in=product_ids, image_pending=True).select_related('master_product')
+            )
+            attach_master_images(products)
+            Product.objects.filter(pk__in=[p.pk for p in products]).update(image_pending=False)
+    except Exception as e:
+        if len(product_ids) > 1:
+            logger.warning(f"Failed to attach master images to {len(product_ids)} product(s), retrying each: {str(e)}")
+            return sum(attach_master_images_by_id([pk]) for pk in product_ids)
+        logger.error(f"Failed to attach the master image to product {product_ids[0]}, giving up: {str(e)}")
+        try:
+            Product.objects.filter(pk=product_ids[0], image_pending=True).update(image_pending=False)
+        except Exception as e:
+            logger.error(f"Failed to clear image_pending on product {product_ids[0]}: {str(e)}")
+        return 0
+    return len(products)
+
+
+def attach_pending_master_images(batch_size=500):
+    """Retry every image_pending product, e.g. after a restart lost the background work; returns the count"""
+    attached, after = 0, 0
+    while True:
+        pending = Product.objects.filter(image_pending=True, pk__gt=after).order_by('pk')
+        ids = list(pending.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return attached
+        attached += attach_master_images_by_id(ids)
+        after = ids[-1]
+
+
+def _attach_images(products):
+    try:
+        with transaction.atomic():
+            attach_master_images(products)
+    except Exception as e:
+        logger.error(f"Failed to attach master images to {len(products)} product(s): {str(e)}")
@@ -0,0 +1,85 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.text import slugify
+
+from .models import MasterCategory, Merchant
+
+# ---------------------- Versioned catalog cache -------------------
+# Read-mostly master catalog payloads are cached per business category (a
+# Merchant.CATEGORY_CHOICES value). Every key embeds that category's current version,
+# so a write only has to bump the version and stale entries simply stop being read.
+# The backend is whatever CACHES[CATALOG_CACHE] configures (local memory, file based, ...).
+
+INDEX_SCOPE = '_index'  # category id -> business category map, bumped on any MasterCategory change
+
+
+def _cache():
+    return caches[getattr(settings, 'CATALOG_CACHE', 'default')]
+
+
+def _version_key(scope):
+    return f"catalog:{slugify(scope)}:version"
+
+
+def catalog_version(scope):
+    cache = _cache()
+    version = cache.get(_version_key(scope))
+    if version is None:
+        # Start from the clock so a version lost to eviction never repeats an old one
+        cache.add(_version_key(scope), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(scope))
+    return version
+
+
+def bump_catalog_version(*scopes):
+    """
+    Invalidate the scopes once the current transaction commits (at once in autocommit). Bumping
+    earlier would let a concurrent reader rebuild from pre-commit rows under the new version.
+    """
+    scopes = {scope for scope in scopes if scope}
+    if scopes:
+        transaction.on_commit(lambda: _bump(scopes))
+
+
+def _bump(scopes):
+    cache = _cache()
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            cache.set(_version_key(scope), time.time_ns(), timeout=None)
+
+
+def bump_all_catalog_versions():
+    bump_catalog_version(INDEX_SCOPE, *dict(Merchant.CATEGORY_CHOICES))
+
+
+def cached_catalog(scope, name, build):
+    """Return the cached payload ``name`` for ``scope``, building it with ``build()`` on a miss"""
+    cache = _cache()
+    key = f"catalog:{slugify(scope)}:v{catalog_version(scope)}:{name}"
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data)
+    return data
+
+
+def normalize_business_category(value):
+    """Map a case-insensitive business category to its CATEGORY_CHOICES value (None if unknown)"""
+    value = (value or '').strip().lower()
+    for choice, _ in Merchant.CATEGORY_CHOICES:
+        if choice.lower() == value:
+            return choice
+    return None
+
+
+def category_business_categories():
+    """Cached {MasterCategory id: business category} map"""
+    return cached_catalog(
+        INDEX_SCOPE, 'categories',
+        lambda: dict(MasterCategory.objects.values_list('id', 'business_category')),
+    )
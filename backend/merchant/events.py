@@ -0,0 +1,114 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW = object()  # handed to a subscriber that fell too far behind and lost messages
+
+
+# ---------------------- Notification pub/sub -------------------
+# Publishers are ordinary (sync) request or worker threads, subscribers are SSE connections on the
+# ASGI event loop. The broker is chosen by NOTIFICATION_BROKER so the in-process one can be swapped
+# for a cross-process broker (Redis pub/sub, Postgres LISTEN/NOTIFY, ...) implementing the same
+# publish(channel, message) / subscribe(channel) -> Subscription interface.
+
+class Subscription:
+    """One subscriber's bounded queue, fed thread-safely onto the event loop it was created on"""
+
+    def __init__(self, broker, channel, max_queued=100):
+        self.broker = broker
+        self.channel = channel
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=max_queued)
+
+    def put(self, message):
+        """Called from any thread"""
+        try:
+            self._loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            pass  # the subscriber's loop is gone, it unsubscribes on its way out
+
+    def _put(self, message):
+        if self._queue.full():
+            # Keep the connection cheap: drop the backlog and let the client resync
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            message = OVERFLOW
+        self._queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """The next message, or None if nothing arrived within ``timeout`` seconds"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Fan-out to the subscribers of this process only. Enough for a single ASGI process; with
+    several worker processes, point NOTIFICATION_BROKER at a cross-process broker instead.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, getattr(settings, 'NOTIFICATION_STREAM_MAX_QUEUED', 100))
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(
+                    getattr(settings, 'NOTIFICATION_BROKER', 'merchant.events.InProcessBroker')
+                )()
+    return _broker
+
+
+def merchant_channel(merchant_id):
+    return f"merchant:{merchant_id}"
+
+
+# ---------------------- Server-sent events -------------------
+def sse_event(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,94 @@
+import csv
+import tempfile
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import Product
+
+# (header, .values() column) for every exported column
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('name', 'name'),
+    ('description', 'description'),
+    ('category', 'category__name'),
+    ('master_product_id', 'master_product_id'),
+    ('stock', 'stock'),
+    ('original_price', 'original_price'),
+    ('discount_price', 'discount_price'),
+    ('image', 'image'),
+    ('created_at', 'created_at'),
+]
+
+
+# Spreadsheet applications evaluate cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+# ---------------------- Streaming inventory export -------------------
+# Rows come from .values() over a server-side cursor, one chunk at a time, and are written out
+# as they arrive: memory stays flat however many products the merchant has. Text cells that
+# would be read as a formula are prefixed with a quote (CSV/formula injection).
+
+def escape_formula(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def export_rows(merchant, request=None):
+    """Lists of cell values for every product of the merchant, header first"""
+    chunk_size = getattr(settings, 'PRODUCT_EXPORT_CHUNK_SIZE', 2000)
+    columns = [column for _, column in EXPORT_COLUMNS]
+    image = columns.index('image')
+    yield [header for header, _ in EXPORT_COLUMNS]
+    rows = Product.objects.filter(merchant=merchant).order_by('id').values_list(*columns)
+    for row in rows.iterator(chunk_size=chunk_size):
+        row = [escape_formula(value) for value in row]
+        if row[image]:
+            url = default_storage.url(row[image])
+            row[image] = request.build_absolute_uri(url) if request else url
+        yield row
+
+
+class _Echo:
+    """File-like object whose write() hands the line back, so csv.writer can feed a generator"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+async def astream_csv(rows, lines_per_chunk=500):
+    """
+    stream_csv for ASGI: Django would buffer a sync iterator whole there. The cursor reads stay
+    on the thread-sensitive sync thread, ``lines_per_chunk`` lines per hop.
+    """
+    lines = stream_csv(rows)
+    take = sync_to_async(lambda: ''.join(islice(lines, lines_per_chunk)))
+    try:
+        while chunk := await take():
+            yield chunk
+    finally:
+        await sync_to_async(lines.close)()  # releases the server-side cursor on disconnect
+
+
+def write_xlsx(rows):
+    """Spool rows into a write-only workbook on disk, returns the open temporary file"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Products')
+    for row in rows:
+        sheet.append([timezone.make_naive(v) if hasattr(v, 'tzinfo') and v.tzinfo else v for v in row])
+    spooled = tempfile.TemporaryFile()
+    workbook.save(spooled)
+    spooled.seek(0)
+    return spooled
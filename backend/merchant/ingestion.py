@@ -0,0 +1,469 @@
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import NamedTuple
+from zipfile import ZipFile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import DatabaseError, transaction
+from openpyxl import load_workbook
+
+from .catalog_cache import bump_catalog_version
+from .models import MasterCategory, MasterProduct, Merchant
+from .querycount import QueryCounter
+from .storage import link_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+def as_text(value):
+    """Normalise a spreadsheet cell to a stripped string ('' for empty cells)"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+# ---------------------- Streaming sheet reader -------------------
+class SheetRow(NamedTuple):
+    number: int  # spreadsheet row number, the header being row 1
+    values: dict
+
+
+class SheetReader:
+    """Reads .xlsx (read-only openpyxl) or .csv uploads row by row without loading the whole sheet"""
+
+    def __init__(self, file, required_columns=()):
+        self._file = file
+        self._workbook = None
+        self._text = None
+        self.estimated_rows = None
+
+        name = (getattr(file, 'name', '') or '').lower()
+        try:
+            self._rows = self._open_csv() if name.endswith('.csv') else self._open_xlsx()
+            header = next(self._rows, None)
+        except Exception as e:
+            self.close()
+            raise ValueError(f"Invalid Excel file: {str(e)}")
+        if header is None:
+            self.close()
+            raise ValueError("Invalid Excel file: sheet is empty")
+
+        self.columns = [as_text(cell).lower() for cell in header]
+        missing = set(required_columns) - set(self.columns)
+        if missing:
+            self.close()
+            raise ValueError(f"Excel missing required columns: {missing}")
+
+    def _open_xlsx(self):
+        self._workbook = load_workbook(self._file, read_only=True, data_only=True)
+        sheet = self._workbook.active
+        if sheet.max_row:
+            self.estimated_rows = max(sheet.max_row - 1, 0)
+        return sheet.iter_rows(values_only=True)
+
+    def _open_csv(self):
+        raw = getattr(self._file, 'file', self._file)
+        self._text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+        return csv.reader(self._text)
+
+    def __iter__(self):
+        for number, cells in enumerate(self._rows, start=2):
+            if not any(as_text(cell) for cell in cells):
+                continue
+            yield SheetRow(number, dict(zip(self.columns, cells)))
+
+    def batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """Yield lists of at most ``batch_size`` rows"""
+        batch = []
+        for row in self:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        if self._text is not None:
+            # Leave the underlying upload open, its owner closes it
+            self._text.detach()
+            self._text = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------------------- Lazy ZIP image provider -------------------
+class ZipImageProvider:
+    """Indexes a stored ZIP's central directory once and streams out only the members rows ask for"""
+
+    def __init__(self, field_file):
+        self._field_file = field_file
+        field_file.open('rb')
+        try:
+            self._archive = ZipFile(field_file.file, 'r')
+        except Exception:
+            field_file.close()
+            raise
+        self._index = {info.filename: info for info in self._archive.infolist() if not info.is_dir()}
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def open(self, name):
+        """Return a Django File streaming the member, or None if the archive has no such image"""
+        info = self._index.get(name)
+        if info is None:
+            return None
+        image = File(self._archive.open(info), name=name)
+        image.size = info.file_size  # avoids seeking to the end of a compressed stream
+        return image
+
+    def close(self):
+        self._archive.close()
+        self._field_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------------------- Master catalog rows -------------------
+MASTER_PRODUCT_COLUMNS = {'name', 'category', 'business_category', 'image_name'}
+
+
+class MasterProductRow(NamedTuple):
+    number: int
+    name: str
+    brand: str
+    description: str
+    category: str
+    business_category: str
+    image_name: str
+
+    @classmethod
+    def from_sheet_row(cls, row):
+        values = row.values
+        return cls(
+            number=row.number,
+            name=as_text(values.get('name')),
+            brand=as_text(values.get('brand')),
+            description=as_text(values.get('description')),
+            category=as_text(values.get('category')),
+            business_category=as_text(values.get('business_category')),
+            image_name=as_text(values.get('image_name')),
+        )
+
+
+def iter_master_product_batches(reader, batch_size=DEFAULT_BATCH_SIZE):
+    for batch in reader.batches(batch_size):
+        yield [MasterProductRow.from_sheet_row(row) for row in batch]
+
+
+def validation_message(error):
+    """One line out of a model ValidationError, e.g. "name: Ensure this value has at most 200 characters" """
+    if hasattr(error, 'error_dict'):
+        return '; '.join(f"{field}: {' '.join(messages)}" for field, messages in error.message_dict.items())
+    return ' '.join(error.messages)
+
+
+# ---------------------- Batched master catalog import -------------------
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.failed = 0
+        self.missing_images = 0
+        self.queries = 0
+        self.seconds = 0.0
+        self.errors = []  # [{'row': ..., 'name': ..., 'issue': ..., 'error': ...}], capped at MAX_REPORTED_ERRORS
+        self.errors_truncated = 0  # reported errors left out of ``errors`` by the cap
+
+    @property
+    def rows_failed(self):
+        return self.invalid + self.failed
+
+    def report(self, row, issue, error):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row.number, 'name': row.name, 'issue': issue, 'error': error})
+        else:
+            self.errors_truncated += 1
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def queries_per_1000_rows(self):
+        return self.queries * 1000 / self.rows if self.rows else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.created}/{self.rows} created, {self.duplicates} duplicates, {self.invalid} invalid, "
+            f"{self.failed} failed, {self.missing_images} missing images; "
+            f"{self.rows_per_second:.0f} rows/s, {self.queries_per_1000_rows:.1f} queries per 1,000 rows"
+        )
+
+
+class ImageWriterPool:
+    """
+    Writes images to storage on a bounded thread pool. ``submit`` blocks once ``max_pending``
+    writes are in flight, so the reader can never run ahead of storage by more than that.
+    Finished writes are collected as (pk, stored name) pairs for the caller to link in bulk.
+    """
+
+    def __init__(self, field, workers=None, max_pending=None):
+        self.field = field
+        self.workers = workers or getattr(settings, 'MASTER_UPLOAD_IMAGE_WORKERS', 4)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-writer')
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+        self._lock = threading.Lock()
+        self._saved = []
+        self._failed = []
+
+    def submit(self, instance, filename, open_image, context=None):
+        """Queue ``open_image()`` to be stored under the field's upload path for ``instance``"""
+        self._submit(instance, context, self._write, instance, filename, open_image)
+
+    def submit_link(self, instance, source, context=None):
+        """Queue linking the stored file ``source`` under the field's upload path for ``instance``"""
+        self._submit(instance, context, self._link, instance, source)
+
+    def _submit(self, instance, context, func, *args):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._finished(f, instance, context))
+
+    def _write(self, instance, filename, open_image):
+        name = self.field.generate_filename(instance, filename)
+        with open_image() as image:
+            return self.field.storage.save(name, image, max_length=self.field.max_length)
+
+    def _link(self, instance, source):
+        name = self.field.generate_filename(instance, os.path.basename(source))
+        return link_file(source, name, self.field.storage, self.field.max_length)
+
+    def _finished(self, future, instance, context):
+        self._slots.release()
+        with self._lock:
+            if future.exception() is not None:
+                self._failed.append((context, future.exception()))
+            else:
+                self._saved.append((instance.pk, future.result()))
+
+    def drain(self):
+        """Return and forget the (saved, failed) writes finished so far"""
+        with self._lock:
+            saved, self._saved = self._saved, []
+            failed, self._failed = self._failed, []
+        return saved, failed
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MasterCatalogImporter:
+    """
+    Set-based ingestion of MasterProductRow batches: categories come from a per-upload cache,
+    duplicates are checked against in-memory (name, brand) maps loaded once per category (a
+    duplicate that still has no image gets the row's image, so a re-run completes a crashed one),
+    new products are written with one bulk_create per batch and their images are stored by an
+    ImageWriterPool while later rows are parsed, then linked back with bulk_update. Rows are
+    validated against the model fields first; should a batch still be refused by the database,
+    it is retried row by row so only the offending rows fail.
+    """
+
+    def __init__(self, images=None, batch_size=None):
+        self.images = images
+        self.batch_size = batch_size or getattr(settings, 'MASTER_UPLOAD_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.stats = ImportStats()
+        self._business_categories = dict(Merchant.CATEGORY_CHOICES)
+        self._categories = None
+        self._existing = {}
+        self._pool = None
+        self._touched_catalogs = set()
+
+    def run(self, batches, on_batch=None):
+        """Import every batch, calling ``on_batch(stats)`` after each one"""
+        started = time.perf_counter()
+        with QueryCounter() as queries:
+            try:
+                with ImageWriterPool(MasterProduct._meta.get_field('image')) as self._pool:
+                    for batch in batches:
+                        self.process_batch(batch)
+                        self._link_images()
+                        if on_batch is not None:
+                            self.stats.seconds = time.perf_counter() - started
+                            on_batch(self.stats)
+            finally:
+                # Even when a batch fails: link the images already written for committed rows
+                # (the pool has waited for them) and invalidate every catalog touched so far
+                if self._pool is not None:
+                    self._link_images()
+                self._pool = None
+                bump_catalog_version(*self._touched_catalogs)
+        self.stats.queries += queries.count
+        self.stats.seconds = time.perf_counter() - started
+        logger.info(f"Master catalog import finished: {self.stats}")
+        return self.stats
+
+    def process_batch(self, rows):
+        products = []  # (product, row)
+        image_rows = []
+        for row in rows:
+            self.stats.rows += 1
+            if row.business_category not in self._business_categories:
+                self.stats.invalid += 1
+                self.stats.report(row, 'invalid', f"Invalid business category: {row.business_category}")
+                continue
+            try:
+                category = self._category(row.category, row.business_category)
+            except ValidationError as e:
+                self.stats.invalid += 1
+                self.stats.report(row, 'invalid', f"category: {validation_message(e)}")
+                continue
+            try:
+                existing = self._existing_keys(category)
+                key = (row.name, row.brand)
+                if key in existing:
+                    self.stats.duplicates += 1
+                    if existing[key] is not None and self.images is not None and row.image_name in self.images:
+                        # Created without its image, e.g. by a run that died before writing it
+                        image_rows.append((MasterProduct(pk=existing[key], category=category), row))
+                        existing[key] = None
+                        self._touched_catalogs.add(category.business_category)
+                    continue
+
+                product = MasterProduct(
+                    name=row.name,
+                    brand=row.brand or None,
+                    description=row.description,
+                    category=category,
+                )
+                try:
+                    product.clean_fields(exclude=['category', 'image', 'image_digest'])
+                except ValidationError as e:
+                    self.stats.invalid += 1
+                    self.stats.report(row, 'invalid', validation_message(e))
+                    continue
+                if self.images is not None and row.image_name in self.images:
+                    image_rows.append((product, row))
+                else:
+                    self.stats.missing_images += 1
+                    self.stats.report(row, 'missing_image', f"Image not found: {row.image_name}")
+                existing[key] = None
+                products.append((product, row))
+            except Exception as e:
+                self.stats.failed += 1
+                self.stats.report(row, 'failed', str(e))
+
+        if products:
+            try:
+                with transaction.atomic():
+                    MasterProduct.objects.bulk_create([p for p, _ in products], batch_size=self.batch_size)
+            except DatabaseError as e:
+                logger.warning(f"Master product batch refused ({str(e)}), inserting its {len(products)} rows one by one")
+                products = self._create_one_by_one(products)
+            self.stats.created += len(products)
+            # bulk writes skip model signals, so invalidate the cached catalogs per committed batch
+            touched = {p.category.business_category for p, _ in products}
+            bump_catalog_version(*touched)
+            self._touched_catalogs.update(touched)
+
+        for product, row in image_rows:
+            if product.pk is not None:
+                self._store_image(product, row)
+
+    def _create_one_by_one(self, products):
+        """Insert ``[(product, row)]`` in a savepoint each, reporting the rows that fail; returns the created ones"""
+        created = []
+        for product, row in products:
+            product.pk = None  # in case the failed bulk_create assigned some
+            try:
+                with transaction.atomic():
+                    product.save(force_insert=True)
+            except DatabaseError as e:
+                product.pk = None
+                self._existing_keys(product.category).pop((row.name, row.brand), None)
+                self.stats.failed += 1
+                self.stats.report(row, 'failed', str(e))
+                continue
+            created.append((product, row))
+        return created
+
+    def _category(self, name, business_category):
+        if self._categories is None:
+            self._categories = {c.name: c for c in MasterCategory.objects.all()}
+        category = self._categories.get(name)
+        if category is None:
+            MasterCategory._meta.get_field('name').clean(name, None)
+            category, _ = MasterCategory.objects.get_or_create(
+                name=name, defaults={'business_category': business_category}
+            )
+            self._categories[name] = category
+        return category
+
+    def _existing_keys(self, category):
+        """{(name, brand): id of the master if it still has no image, else None} for the category"""
+        keys = self._existing.get(category.pk)
+        if keys is None:
+            rows = MasterProduct.objects.filter(category=category).values_list('id', 'name', 'brand', 'image')
+            keys = {(name, brand or ''): None if image else pk for pk, name, brand, image in rows}
+            self._existing[category.pk] = keys
+        return keys
+
+    def _store_image(self, product, row):
+        open_image = partial(self.images.open, row.image_name)
+        if self._pool is None:
+            with open_image() as image:
+                product.image.save(row.image_name, image, save=False)
+            MasterProduct.objects.filter(pk=product.pk).update(image=product.image.name)
+            return
+        self._pool.submit(product, row.image_name, open_image, context=row)
+
+    def _link_images(self):
+        saved, failed = self._pool.drain()
+        for row, error in failed:
+            self.stats.missing_images += 1
+            self.stats.report(row, 'image_failed', f"Image write failed: {str(error)}")
+        if saved:
+            MasterProduct.objects.bulk_update(
+                [MasterProduct(pk=pk, image=name) for pk, name in saved], ['image'], batch_size=self.batch_size
+            )
+            bump_catalog_version(*self._touched_catalogs)
@@ -0,0 +1,169 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from rest_framework import serializers
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+BULK_UPDATE_FIELDS = ('stock', 'original_price', 'discount_price')
+
+
+# ---------------------- Bulk stock & price updates -------------------
+# A POS sync pushes thousands of {id, stock, original_price, discount_price} entries. Values are
+# coerced column by column with one shared DRF field per column, the merchant's rows are read
+# (and locked) with one query, and every valid entry is written with a single bulk_update.
+# Each entry gets its own result, invalid entries never block the valid ones.
+
+def stock_price_fields():
+    """One DRF field per column, shared by every entry (and by the spreadsheet import)"""
+    price = dict(max_digits=10, decimal_places=2)
+    return {
+        'id': serializers.IntegerField(min_value=1),
+        'stock': serializers.IntegerField(min_value=0),
+        'original_price': serializers.DecimalField(**price),
+        'discount_price': serializers.DecimalField(**price, min_value=0),
+    }
+
+
+def _coerce(items):
+    """Per entry: (cleaned values, errors) using one shared field instance per column"""
+    columns = stock_price_fields()
+    coerced = []
+    for item in items:
+        values, errors = {}, {}
+        if not isinstance(item, dict):
+            coerced.append((values, {'non_field_errors': ["Expected an object"]}))
+            continue
+        for name, field in columns.items():
+            if name not in item:
+                continue
+            try:
+                values[name] = field.run_validation(item[name])
+            except serializers.ValidationError as e:
+                errors[name] = e.detail
+        if 'id' not in item:
+            errors['id'] = ["This field is required."]
+        elif not errors and len(values) == 1:
+            errors['non_field_errors'] = [f"Provide at least one of {', '.join(BULK_UPDATE_FIELDS)}"]
+        coerced.append((values, errors))
+    return coerced
+
+
+def price_errors(original, discount):
+    """The price rules of ProductCreateFromMasterSerializer.validate, as a field -> errors dict"""
+    if original <= 0:
+        return {'original_price': ["Must be > 0"]}
+    if discount > original:
+        return {'discount_price': ["Must be ≤ original price"]}
+    return {}
+
+
+def bulk_update_products(merchant, items):
+    """
+    Apply stock/price changes to the merchant's products in one transaction. Returns one result
+    per entry, in order: ``{"id", "status": "updated" | "error", "errors"?}``.
+    """
+    limit = getattr(settings, 'PRODUCT_BULK_UPDATE_MAX_ITEMS', 5000)
+    if len(items) > limit:
+        raise serializers.ValidationError({'items': [f"At most {limit} items per request"]})
+
+    coerced = _coerce(items)
+    results = [{'id': item.get('id') if isinstance(item, dict) else None} for item in items]
+    ids = [values['id'] for values, errors in coerced if not errors]
+
+    with transaction.atomic():
+        products = Product.objects.select_for_update().filter(merchant=merchant, id__in=ids).only(
+            'id', *BULK_UPDATE_FIELDS
+        ).in_bulk()
+
+        changed, fields, seen = {}, set(), set()
+        for result, (values, errors) in zip(results, coerced):
+            product = products.get(values.get('id')) if not errors else None
+            if not errors and product is None:
+                errors = {'id': ["Product not found."]}
+            elif not errors and product.pk in seen:
+                errors = {'id': ["Product appears more than once in this request."]}
+            if not errors:
+                seen.add(product.pk)
+                # The price checks run against the merged row, so a lone discount_price is checked too
+                errors = price_errors(
+                    values.get('original_price', product.original_price),
+                    values.get('discount_price', product.discount_price),
+                )
+            if errors:
+                result.update(status='error', errors=errors)
+                continue
+
+            for name in BULK_UPDATE_FIELDS:
+                if name in values:
+                    setattr(product, name, values[name])
+                    fields.add(name)
+            changed[product.pk] = product
+            result['status'] = 'updated'
+
+        if changed:
+            Product.objects.bulk_update(changed.values(), sorted(fields), batch_size=1000)
+
+    logger.info(f"Bulk update by {merchant.email}: {len(changed)} updated, {len(items) - len(changed)} failed")
+    return results
+
+
+# ---------------------- Atomic stock adjustments -------------------
+# Stock is never read, changed in Python and written back: every change is a single
+# `UPDATE ... SET stock = stock + delta WHERE stock + delta >= 0`, so concurrent tills can't
+# lose each other's sales and a row is only locked for the duration of that one statement.
+
+class InsufficientStock(Exception):
+    pass
+
+
+def adjust_stock(merchant, product_id, delta):
+    """Add ``delta`` (negative to decrement) to a product's stock, returns the new stock"""
+    products = Product.objects.filter(merchant=merchant, pk=product_id)
+    if delta and not products.filter(stock__gte=-delta).update(stock=F('stock') + delta):
+        if not products.exists():
+            raise Product.DoesNotExist(f"Product {product_id} not found")
+        raise InsufficientStock(f"Not enough stock on product {product_id} to remove {-delta}")
+    return products.values_list('stock', flat=True).get()
+
+
+def coalesce_deltas(entries):
+    """Sum the deltas of repeated product ids: [(id, delta), ...] -> {id: delta}"""
+    deltas = {}
+    for product_id, delta in entries:
+        deltas[product_id] = deltas.get(product_id, 0) + delta
+    return deltas
+
+
+def apply_stock_deltas(merchant, deltas):
+    """
+    Apply {product id: delta} with one guarded UPDATE. If any product would go negative the
+    batch is retried one guarded UPDATE per product, so only the short ones are refused.
+    Returns {product id: "applied" | "insufficient_stock" | "not_found"} and the new stock levels.
+    """
+    products = Product.objects.filter(merchant=merchant)
+    owned = set(products.filter(pk__in=deltas).values_list('pk', flat=True))
+    outcome = {pk: 'applied' if pk in owned else 'not_found' for pk in deltas}
+    pending = {pk: delta for pk, delta in deltas.items() if pk in owned and delta}
+
+    if pending:
+        try:
+            with transaction.atomic():
+                updated = products.filter(pk__in=pending, stock__gte=Case(
+                    *[When(pk=pk, then=Value(-delta)) for pk, delta in pending.items()], default=Value(0)
+                )).update(stock=F('stock') + Case(
+                    *[When(pk=pk, then=Value(delta)) for pk, delta in pending.items()], default=Value(0)
+                ))
+                if updated != len(pending):
+                    raise InsufficientStock
+        except InsufficientStock:
+            for pk, delta in pending.items():
+                applied = products.filter(pk=pk, stock__gte=-delta).update(stock=F('stock') + delta)
+                outcome[pk] = 'applied' if applied else 'insufficient_stock'
+
+    stock = dict(products.filter(pk__in=owned).values_list('pk', 'stock'))
+    return outcome, stock
@@ -0,0 +1,130 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .ingestion import (
+    SheetReader, ZipImageProvider, MasterCatalogImporter, MASTER_PRODUCT_COLUMNS, iter_master_product_batches
+)
+from .models import MasterProductUpload
+
+logger = logging.getLogger(__name__)
+
+_background = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2), thread_name_prefix='merchant-background'
+)
+
+
+# ---------------------- In-process background tasks -------------------
+def run_after_commit(func, *args, **kwargs):
+    """Run ``func`` on a background thread once the current transaction commits (immediately in autocommit)"""
+    transaction.on_commit(lambda: _background.submit(_run_in_background, func, args, kwargs))
+
+
+def _run_in_background(func, args, kwargs):
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception as e:
+        logger.exception(f"Background task {func.__name__} failed: {str(e)}")
+    finally:
+        connection.close()
+
+
+# ---------------------- Master upload queue -------------------
+# The MasterProductUpload table is the queue: the admin marks rows as queued and
+# `manage.py process_master_uploads` claims them one at a time off the request path.
+# Workers record a heartbeat per batch; a 'processing' upload without one for
+# MASTER_UPLOAD_STALE_AFTER seconds belonged to a worker that died and is claimed again.
+# Re-running an upload from the start is safe: rows already imported count as duplicates,
+# and those still missing their image get it from the re-run (see MasterCatalogImporter).
+
+def _abandoned():
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'MASTER_UPLOAD_STALE_AFTER', 900))
+    return Q(status='processing') & (Q(heartbeat_at__lt=stale) | Q(heartbeat_at__isnull=True))
+
+
+def enqueue_uploads(queryset):
+    """Queue uploads that are not already queued or running (abandoned ones included), returns the number queued"""
+    return queryset.filter(~Q(status__in=['queued', 'processing']) | _abandoned()).update(
+        status='queued', queued_at=timezone.now(), started_at=None, heartbeat_at=None, finished_at=None,
+        rows_total=None, rows_done=0, rows_failed=0, error_report=[], last_error='',
+    )
+
+
+def claim_next_upload():
+    """
+    Atomically move the oldest queued (or abandoned) upload to processing; None when the queue
+    is empty
+    """
+    with transaction.atomic():
+        upload = (
+            MasterProductUpload.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='queued') | _abandoned())
+            .order_by('queued_at', 'id')
+            .first()
+        )
+        if upload is None:
+            return None
+        if upload.status == 'processing':
+            logger.warning(f"Reclaiming master upload {upload.pk}, its worker stopped at row {upload.rows_done}")
+        upload.status = 'processing'
+        upload.started_at = upload.heartbeat_at = timezone.now()
+        upload.rows_done = upload.rows_failed = 0
+        upload.save(update_fields=['status', 'started_at', 'heartbeat_at', 'rows_done', 'rows_failed'])
+    return upload
+
+
+def process_upload(upload):
+    """Import one claimed upload, recording progress and a per-row error report on it"""
+    # Scoped to this claim, so a worker whose upload was reclaimed cannot overwrite the new run
+    uploads = MasterProductUpload.objects.filter(pk=upload.pk, started_at=upload.started_at)
+
+    def on_batch(stats):
+        uploads.update(rows_done=stats.rows, rows_failed=stats.rows_failed, heartbeat_at=timezone.now())
+
+    importer = None
+    try:
+        with upload.excel_file.open('rb') as excel_file, \
+                SheetReader(excel_file, MASTER_PRODUCT_COLUMNS) as reader, \
+                ZipImageProvider(upload.image_zip) as images:
+            uploads.update(rows_total=reader.estimated_rows)
+            importer = MasterCatalogImporter(images=images)
+            stats = importer.run(iter_master_product_batches(reader, importer.batch_size), on_batch=on_batch)
+    except Exception as e:
+        logger.exception(f"Master upload {upload.pk} failed: {str(e)}")
+        progress = {}
+        if importer is not None:  # keep what the rows imported so far reported
+            progress = dict(
+                rows_done=importer.stats.rows, rows_failed=importer.stats.rows_failed,
+                error_report=importer.stats.errors,
+            )
+        uploads.update(status='failed', finished_at=timezone.now(), last_error=str(e), **progress)
+        return None
+
+    uploads.update(
+        status='completed', finished_at=timezone.now(), rows_total=stats.rows,
+        rows_done=stats.rows, rows_failed=stats.rows_failed, error_report=stats.errors,
+    )
+    logger.info(f"Master upload {upload.pk} processed: {stats}")
+    return stats
+
+
+def run_worker(once=False, poll_interval=5.0):
+    """Process queued uploads until interrupted (or until the queue is empty with ``once``)"""
+    processed = 0
+    while True:
+        upload = claim_next_upload()
+        if upload is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        logger.info(f"Processing master upload {upload.pk}")
+        process_upload(upload)
+        processed += 1
@@ -0,0 +1,179 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from openpyxl import Workbook
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from merchant.catalog import attach_master_images_by_id
+from merchant.ingestion import SheetReader, MASTER_PRODUCT_COLUMNS, MasterProductRow, iter_master_product_batches
+from merchant.models import MasterCategory, MasterProduct, Merchant, MerchantProfile, Product, SharedImage
+from merchant.querycount import QueryCounter, assert_max_queries
+from merchant.views import ProductViewSet, SmartAddBulkAddView
+
+# Queries an inventory page may run however many SKUs the merchant has (the page itself)
+INVENTORY_PAGE_MAX_QUERIES = 1
+
+
+def _measure(func, trace_memory=False):
+    """Run ``func`` and return (result, seconds, peak traced MiB or None)"""
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = func()
+    finally:
+        elapsed = time.perf_counter() - started
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmarks for the merchant ingestion paths"
+
+    scenarios = ['upload_reader', 'smart_add', 'inventory_page']
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=self.scenarios)
+        parser.add_argument('--rows', type=int, default=50000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--memory', action='store_true',
+                            help="Trace peak Python allocations (much slower, compare runs with the same flag)")
+
+    def handle(self, *args, **options):
+        getattr(self, f"bench_{options['scenario']}")(**options)
+
+    def report(self, label, rows, seconds, peak_mib=None, queries=None):
+        rate = rows / seconds if seconds else float('inf')
+        line = f"{label:<12} {rows:>9} rows  {seconds:8.2f}s  {rate:>10.0f} rows/s"
+        if queries is not None:
+            line += f"  {queries:>6} queries"
+        if peak_mib is not None:
+            line += f"  peak {peak_mib:8.1f} MiB"
+        self.stdout.write(line)
+
+    # ---------------------- Master upload sheet reader -------------------
+    def bench_upload_reader(self, rows, batch_size, memory, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'catalog.xlsx')
+            self._write_catalog(path, rows)
+
+            def streaming():
+                count = 0
+                with open(path, 'rb') as f, SheetReader(f, MASTER_PRODUCT_COLUMNS) as reader:
+                    for batch in iter_master_product_batches(reader, batch_size):
+                        count += len(batch)
+                return count
+
+            count, seconds, peak = _measure(streaming, memory)
+            self.report('streaming', count, seconds, peak)
+
+            try:
+                import pandas as pd
+            except ImportError:
+                self.stdout.write("pandas not installed, skipping the pandas baseline")
+                return
+
+            def pandas_path():
+                count = 0
+                df = pd.read_excel(path)
+                for index, row in df.iterrows():
+                    MasterProductRow(index + 2, *(str(row.get(c, '')).strip() for c in MasterProductRow._fields[1:]))
+                    count += 1
+                return count
+
+            count, seconds, peak = _measure(pandas_path, memory)
+            self.report('pandas', count, seconds, peak)
+
+    # ---------------------- Smart Add bulk add -------------------
+    def bench_smart_add(self, rows, **options):
+        """Add ``rows`` products from one category; everything runs in a transaction that is rolled back"""
+        if rows <= 0:
+            raise CommandError("--rows must be positive")
+        image_name = default_storage.save('bench/smart_add.jpg', ContentFile(b'bench image'))
+        try:
+            with transaction.atomic():
+                merchant, category, masters = self._smart_add_catalog(rows, image_name)
+                request = APIRequestFactory().post('/', {
+                    'category_id': category.id, 'product_ids': [mp.id for mp in masters],
+                }, format='json')
+                force_authenticate(request, merchant)
+
+                with QueryCounter() as queries:
+                    response, seconds, _ = _measure(lambda: SmartAddBulkAddView.as_view()(request))
+                if response.status_code != 201:
+                    raise CommandError(f"Bulk add failed: {response.data}")
+                self.report('request', rows, seconds, queries=queries.count)
+
+                # The post-commit image step, run inline here since the transaction never commits
+                product_ids = list(Product.objects.filter(merchant=merchant).values_list('pk', flat=True))
+                with QueryCounter() as queries:
+                    _, seconds, _ = _measure(lambda: attach_master_images_by_id(product_ids))
+                self.report('images', rows, seconds, queries=queries.count)
+                shared_names = list(SharedImage.objects.values_list('name', flat=True))
+                transaction.set_rollback(True)
+        finally:
+            default_storage.delete(image_name)
+        for name in shared_names:
+            if not SharedImage.objects.filter(name=name).exists():
+                default_storage.delete(name)
+
+    # ---------------------- Inventory listing -------------------
+    def bench_inventory_page(self, rows, **options):
+        """Fetch the first and the last inventory page of a merchant with ``rows`` SKUs, asserting the query count"""
+        if rows <= 0:
+            raise CommandError("--rows must be positive")
+        with transaction.atomic():
+            merchant, category, masters = self._smart_add_catalog(min(rows, 1000), '')
+            Product.objects.bulk_create(
+                (Product(merchant=merchant, master_product=masters[i % len(masters)], category=category,
+                         name=f"SKU {i}", original_price=10, discount_price=9) for i in range(rows)),
+                batch_size=1000,
+            )
+            view = ProductViewSet.as_view({'get': 'list'})
+            url, pages = '/', 0
+            while url:
+                request = APIRequestFactory().get(url)
+                force_authenticate(request, merchant)
+                with assert_max_queries(INVENTORY_PAGE_MAX_QUERIES) as queries:
+                    response, seconds, _ = _measure(lambda: view(request).render())
+                pages += 1
+                if pages == 1:
+                    self.report('first page', len(response.data['results']), seconds, queries=queries.count)
+                url = response.data['next']
+            self.report('last page', len(response.data['results']), seconds, queries=queries.count)
+            self.stdout.write(f"{pages} pages, each within {INVENTORY_PAGE_MAX_QUERIES} queries")
+            transaction.set_rollback(True)
+
+    def _smart_add_catalog(self, rows, image_name):
+        merchant = Merchant.objects.create_user(
+            email=f"bench-{time.time_ns()}@example.com", full_name='Bench', mobile_no='+910000000000'
+        )
+        MerchantProfile.objects.create(
+            merchant=merchant, business_name='Bench', category='Grocery', address='-', city='-',
+            pincode='000000', latitude=0, longitude=0, is_onboarded=True,
+        )
+        category = MasterCategory.objects.create(name=f"Bench {time.time_ns()}", business_category='Grocery')
+        masters = MasterProduct.objects.bulk_create(
+            MasterProduct(name=f"Bench product {i}", category=category, image=image_name) for i in range(rows)
+        )
+        return merchant, category, masters
+
+    def _write_catalog(self, path, rows):
+        if rows <= 0:
+            raise CommandError("--rows must be positive")
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(['name', 'brand', 'description', 'category', 'business_category', 'image_name'])
+        for i in range(rows):
+            sheet.append([f"Product {i}", f"Brand {i % 50}", f"Description for product {i}",
+                          f"Category {i % 20}", 'Grocery', f"img_{i}.jpg"])
+        workbook.save(path)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from merchant.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Worker that processes queued master product uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help="Seconds to wait between polls of an empty queue")
+
+    def handle(self, *args, **options):
+        processed = run_worker(once=options['once'], poll_interval=options['poll_interval'])
+        self.stdout.write(f"Processed {processed} upload(s)")
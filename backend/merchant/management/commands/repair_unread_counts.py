@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from merchant.models import Merchant
+from merchant.notifications import recompute_unread_counts
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized unread notification counters from the notifications table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', action='append', default=[], help="Only repair these merchants (repeatable)")
+
+    def handle(self, *args, **options):
+        merchants = Merchant.objects.filter(email__in=options['email']) if options['email'] else None
+        repaired = recompute_unread_counts(merchants)
+        self.stdout.write(f"Recomputed {repaired} unread counter(s)")
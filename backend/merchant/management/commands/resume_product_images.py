@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from merchant.catalog import attach_pending_master_images
+from merchant.moderation import resume_pending_image_moves
+
+
+class Command(BaseCommand):
+    help = "Finish product image work that a restart interrupted (run periodically or after a deploy)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Products handled per transaction")
+
+    def handle(self, *args, **options):
+        attached = attach_pending_master_images(batch_size=options['batch_size'])
+        moved = resume_pending_image_moves(batch_size=options['batch_size'])
+        self.stdout.write(f"Attached master images to {attached} product(s), moved {moved} approved image(s)")
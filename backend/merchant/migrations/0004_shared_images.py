@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0003_masterproductupload_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SharedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='masterproduct',
+            name='image_digest',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
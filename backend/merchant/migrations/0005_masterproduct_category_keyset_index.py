@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0004_shared_images'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='masterproduct',
+            index=models.Index(fields=['category', 'id'], name='masterproduct_category_id_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    Merchant = apps.get_model('merchant', 'Merchant')
+    Notification = apps.get_model('merchant', 'Notification')
+    NotificationCounter = apps.get_model('merchant', 'NotificationCounter')
+    unread = dict(
+        Notification.objects.filter(is_read=False).order_by().values('recipient')
+        .annotate(n=Count('pk')).values_list('recipient', 'n')
+    )
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(merchant_id=pk, unread=unread.get(pk, 0)) for pk in Merchant.objects.values_list('pk', flat=True)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0007_notification_inbox_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('merchant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
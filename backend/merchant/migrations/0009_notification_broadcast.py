@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0008_notification_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationBroadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField()),
+                ('business_category', models.CharField(blank=True, choices=[('Grocery', 'Grocery'), ('Mobile', 'Mobile'), ('Fashion', 'Fashion'), ('Food', 'Food'), ('Technology', 'Technology'), ('Home & Appliance', 'Home & Appliance')], max_length=50)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('recipient_emails', models.TextField(blank=True, help_text='Explicit recipients, one email per line or comma separated')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_count', models.PositiveIntegerField(default=0)),
+                ('last_recipient_id', models.BigIntegerField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0009_notification_broadcast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationbroadcast',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
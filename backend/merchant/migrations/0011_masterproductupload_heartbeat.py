@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0010_notificationbroadcast_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='masterproductupload',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0011_masterproductupload_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_pending',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('image_pending', True)), fields=['id'], name='product_image_pending_idx'),
+        ),
+    ]
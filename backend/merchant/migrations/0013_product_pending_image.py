@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0012_product_image_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='pending_image',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('pending_image', ''), _negated=True), fields=['id'], name='product_pending_image_idx'),
+        ),
+    ]
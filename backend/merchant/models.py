@@ -1,9 +1,14 @@
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.conf import settings
+from django.utils import timezone
 import uuid
 import os
+import logging
+
+logger = logging.getLogger(__name__)
 
 # ---------------------- Merchant Manager -----------------------
 class MerchantManager(BaseUserManager):
@@ -58,6 +63,12 @@ class Merchant(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.email
 
+    @property
+    def business_name(self):
+        """Profile business name; select_related('merchant__profile') to avoid a query per row"""
+        profile = getattr(self, 'profile', None)  # None until the merchant onboards
+        return profile.business_name if profile else 'Unknown Business'
+
 # ---------------------- Merchant Profile -----------------------
 def profile_image_upload_path(instance, filename):
     return f'merchant_profiles/{instance.merchant.id}/profile/{filename}'
@@ -98,19 +109,79 @@ class MasterProduct(models.Model):
     category = models.ForeignKey(MasterCategory, on_delete=models.SET_NULL, null=True, blank=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='master_product_images/', null=True, blank=True)
+    image_digest = models.CharField(max_length=64, blank=True, editable=False)  # sha256 of image, filled on first share
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'id'], name='masterproduct_category_id_idx'),  # keyset pages per category
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            self.image_digest = ''  # new file uploaded, recomputed the next time it is shared
+        super().save(*args, **kwargs)
 
     def __str__(self):
         category_name = self.category.name if self.category else "Uncategorized"
         return f"{self.name} ({self.brand}) - {category_name}" if self.brand else f"{self.name} - {category_name}"
 
+# ---------------------- Shared (content-addressed) images -------------------
+class SharedImage(models.Model):
+    """One stored copy of an image's bytes, referenced by every Product.image pointing at ``name``"""
+    digest = models.CharField(max_length=64, unique=True)  # sha256 of the file contents
+    name = models.CharField(max_length=255, unique=True)  # storage path
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
 class MasterProductUpload(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
     excel_file = models.FileField(upload_to="master_uploads/")
     image_zip = models.FileField(upload_to="master_uploads/")
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    # Background processing state, maintained by merchant.jobs
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    queued_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # last progress of the worker, see MASTER_UPLOAD_STALE_AFTER
+    finished_at = models.DateTimeField(null=True, blank=True)
+    rows_total = models.PositiveIntegerField(null=True, blank=True)  # estimated from the sheet dimensions
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    error_report = models.JSONField(default=list, blank=True)
+    last_error = models.TextField(blank=True)
+
     def __str__(self):
         return f"Upload @ {self.uploaded_at}"
 
+    @property
+    def elapsed_seconds(self):
+        if not self.started_at:
+            return None
+        return ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+
+    @property
+    def throughput(self):
+        """Rows processed per second"""
+        elapsed = self.elapsed_seconds
+        return self.rows_done / elapsed if elapsed else None
+
+    @property
+    def eta_seconds(self):
+        if self.status != 'processing' or not self.rows_total or not self.throughput:
+            return None
+        return max(self.rows_total - self.rows_done, 0) / self.throughput
+
 # ---------------------- Product Model --------------------------
 def product_image_upload_path(instance, filename):
     ext = filename.split('.')[-1]
@@ -130,27 +201,53 @@ class Product(models.Model):
     image = models.ImageField(upload_to=product_image_upload_path, blank=True, null=True)
     category = models.ForeignKey(MasterCategory, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Master image still to be attached off the request path, see merchant.catalog.attach_pending_master_images
+    image_pending = models.BooleanField(default=False, editable=False)
+    # Approved pending product image not yet moved under this product, see merchant.moderation.move_pending_images
+    pending_image = models.CharField(max_length=255, blank=True, editable=False)
     def copy_image_from_master(self, master_product):
-        if master_product.image:
-            try:
-                # Generate unique filename
-                filename = f"product_{self.id}_{master_product.image.name.split('/')[-1]}"
-                self.image.save(
-                    filename,
-                    ContentFile(master_product.image.read()),
-                    save=True
-                )
-                return True
-            except Exception as e:
-                logger.error(f"Error copying image: {str(e)}")
+        """Point this product at the master's shared image file, no bytes are copied"""
+        from .storage import attach_master_images
+
+        if not master_product.image:
+            return False
+        self.master_product = master_product
+        try:
+            attach_master_images([self])
+            return True
+        except Exception as e:
+            logger.error(f"Error copying image: {str(e)}")
         return False
 
     def __str__(self):
-        business_name = getattr(self.merchant.profile, 'business_name', 'Unknown Business')
-        return f"{self.name} - {business_name} ({self.get_status_display()})"
+        return f"{self.name} - {self.merchant.business_name} (stock: {self.stock})"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(image_pending=True), name='product_image_pending_idx'),
+            models.Index(fields=['id'], condition=~models.Q(pending_image=''), name='product_pending_image_idx'),
+        ]
+
+
+# ---------------------- Product Upload Model -------------------
+class ProductUpload(models.Model):
+    """A merchant's inventory spreadsheet import and its per-row error report"""
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='product_uploads')
+    file_name = models.CharField(max_length=255)
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_created = models.PositiveIntegerField(default=0)
+    rows_updated = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    error_report = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ['-uploaded_at']
+
+    def __str__(self):
+        return f"{self.file_name} @ {self.uploaded_at}"
 
 
 class SmartAddSelection(models.Model):
@@ -192,8 +289,7 @@ class PendingProduct(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        business_name = getattr(self.merchant.profile, 'business_name', 'Unknown Business')
-        return f"PENDING: {self.name} by {self.merchant.full_name} -{business_name} (Approved: {self.is_approved})"
+        return f"PENDING: {self.name} by {self.merchant.full_name} -{self.merchant.business_name} (Approved: {self.is_approved})"
 
     class Meta:
         ordering = ['-created_at']
@@ -211,7 +307,61 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # The bell dropdown: a merchant's (unread) notifications, newest first
+            models.Index(fields=['recipient', 'is_read', 'created_at'], name='notification_inbox_idx'),
+        ]
 
     def __str__(self):
         read_status = "Read" if self.is_read else "Unread"
         return f"Notification for {self.recipient.email}: {self.message[:50]}... ({read_status})"
+
+
+class NotificationCounter(models.Model):
+    """Denormalized number of unread notifications per merchant, maintained by merchant.notifications"""
+    merchant = models.OneToOneField(
+        Merchant, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter'
+    )
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.merchant_id}: {self.unread} unread"
+
+
+class NotificationBroadcast(models.Model):
+    """One message fanned out to every merchant matching the targeting fields (combined with AND)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    message = models.TextField()
+    business_category = models.CharField(max_length=50, choices=Merchant.CATEGORY_CHOICES, blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    recipient_emails = models.TextField(blank=True, help_text="Explicit recipients, one email per line or comma separated")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Fan-out state, maintained by merchant.notifications.send_broadcast
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # last sign of life of the sender, see BROADCAST_STALE_AFTER
+    finished_at = models.DateTimeField(null=True, blank=True)
+    sent_count = models.PositiveIntegerField(default=0)
+    last_recipient_id = models.BigIntegerField(null=True, blank=True)  # keyset position, a retry resumes after it
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Broadcast @ {self.created_at}: {self.message[:50]}"
+
+    @property
+    def emails(self):
+        return [email.strip().lower() for email in self.recipient_emails.replace(',', '\n').splitlines() if email.strip()]
+
+    def clean(self):
+        if not (self.business_category or self.city.strip() or self.emails):
+            raise ValidationError("Target a business category, a city or a list of merchants.")
@@ -0,0 +1,227 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from .ingestion import ImageWriterPool
+from .jobs import run_after_commit
+from .models import MasterCategory, Notification, PendingProduct, Product
+from .notifications import notifications_created
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REJECTION_NOTES = 'No specific reason provided.'
+
+
+# ---------------------- Batched pending product moderation -------------------
+# Approving or rejecting N pending products costs a constant number of statements: the pending
+# rows are locked and read together, products and notifications are written with bulk_create and
+# the pending rows are removed with one DELETE. Files are only touched after commit, on a
+# background thread, and approved images are hardlinked (see merchant.storage.link_file), not copied.
+# Every entry gets its own outcome, in the order given.
+
+def _parse_entries(entries):
+    """[(entry, pending id or None, error or None)], flagging malformed and repeated ids"""
+    limit = getattr(settings, 'PENDING_PRODUCT_BULK_MAX_ITEMS', 1000)
+    if len(entries) > limit:
+        raise serializers.ValidationError({'items': [f"At most {limit} items per request"]})
+    parsed, seen = [], set()
+    for entry in entries:
+        try:
+            pk = int(entry['id'])
+        except (KeyError, TypeError, ValueError):
+            parsed.append((entry, None, "Each entry needs an integer id"))
+            continue
+        if pk in seen:
+            parsed.append((entry, pk, "Listed more than once"))
+            continue
+        seen.add(pk)
+        parsed.append((entry, pk, None))
+    return parsed
+
+
+def _outcome(pk, status, **extra):
+    return {'id': pk, 'status': status, **extra}
+
+
+def approval_message(product, category):
+    return f"Your new product '{product.name}' has been approved under category: '{category.name}'."
+
+
+def rejection_message(pending, notes):
+    return f"Your product '{pending.name}' was reviewed and rejected. Admin notes: {notes}"
+
+
+def approve_pending_products(entries):
+    """
+    Approve ``[{"id", "category_id"?, "admin_notes"?}]``; an entry without category_id uses the
+    category already set on the pending product. Returns one outcome per entry.
+    """
+    parsed = _parse_entries(entries)
+    results = [None] * len(parsed)
+    with transaction.atomic():
+        pending = PendingProduct.objects.select_for_update().filter(
+            pk__in=[pk for _, pk, error in parsed if not error], is_approved=False
+        ).in_bulk()
+        category_ids = {p.category_id for p in pending.values() if p.category_id}
+        for entry, _, error in parsed:
+            if not error and entry.get('category_id') not in (None, ''):
+                try:
+                    category_ids.add(int(entry['category_id']))
+                except (TypeError, ValueError):
+                    pass
+        categories = MasterCategory.objects.in_bulk(category_ids)
+
+        approved = []  # (result index, pending product, new product, category, notes)
+        for index, (entry, pk, error) in enumerate(parsed):
+            item = pending.get(pk) if not error else None
+            if not error and item is None:
+                error = "Pending product not found or already reviewed"
+            category = None
+            if not error:
+                try:
+                    category_id = int(entry['category_id']) if entry.get('category_id') not in (None, '') \
+                        else item.category_id
+                except (TypeError, ValueError):
+                    category_id = None
+                category = categories.get(category_id)
+                if category is None:
+                    error = "A valid category must be selected for approval"
+            if error:
+                results[index] = _outcome(pk, 'error', error=error)
+                continue
+            product = Product(
+                merchant_id=item.merchant_id,
+                name=item.name,
+                description=item.description,
+                stock=item.stock,
+                original_price=item.original_price,
+                discount_price=item.discount_price if item.discount_price is not None else item.original_price,
+                category=category,
+                pending_image=item.image.name if item.image else '',
+            )
+            approved.append((index, item, product, category, (entry.get('admin_notes') or '').strip()))
+
+        if approved:
+            Product.objects.bulk_create([product for _, _, product, _, _ in approved])
+            notifications_created(Notification.objects.bulk_create([
+                Notification(
+                    recipient_id=item.merchant_id,
+                    message=approval_message(product, category) + (f" Admin notes: {notes}" if notes else ''),
+                    product=product,
+                )
+                for _, item, product, category, notes in approved
+            ]))
+            PendingProduct.objects.filter(pk__in=[item.pk for _, item, _, _, _ in approved]).delete()
+            moves = [product.pk for _, _, product, _, _ in approved if product.pending_image]
+            if moves:
+                run_after_commit(move_pending_images, moves)
+
+        for index, item, product, category, _ in approved:
+            results[index] = _outcome(item.pk, 'approved', product_id=product.pk, category=category.name)
+
+    logger.info(f"Bulk approval: {len(approved)} approved, {len(parsed) - len(approved)} failed")
+    return results
+
+
+def reject_pending_products(entries, default_notes=DEFAULT_REJECTION_NOTES):
+    """Reject ``[{"id", "admin_notes"?}]``, returns one outcome per entry"""
+    parsed = _parse_entries(entries)
+    results = [None] * len(parsed)
+    with transaction.atomic():
+        pending = PendingProduct.objects.select_for_update().filter(
+            pk__in=[pk for _, pk, error in parsed if not error], is_approved=False
+        ).in_bulk()
+
+        rejected = []  # (result index, pending product, notes)
+        for index, (entry, pk, error) in enumerate(parsed):
+            item = pending.get(pk) if not error else None
+            if not error and item is None:
+                error = "Pending product not found or already reviewed"
+            if error:
+                results[index] = _outcome(pk, 'error', error=error)
+                continue
+            rejected.append((index, item, (entry.get('admin_notes') or '').strip() or default_notes))
+
+        if rejected:
+            notifications_created(Notification.objects.bulk_create([
+                Notification(recipient_id=item.merchant_id, message=rejection_message(item, notes))
+                for _, item, notes in rejected
+            ]))
+            PendingProduct.objects.filter(pk__in=[item.pk for _, item, _ in rejected]).delete()
+            images = [item.image.name for _, item, _ in rejected if item.image]
+            if images:
+                run_after_commit(delete_pending_images, images)
+
+        for index, item, _ in rejected:
+            results[index] = _outcome(item.pk, 'rejected')
+
+    logger.info(f"Bulk rejection: {len(rejected)} rejected, {len(parsed) - len(rejected)} failed")
+    return results
+
+
+# ---------------------- Pending image files -------------------
+def move_pending_images(product_ids):
+    """
+    Move the pending images still recorded on ``product_ids`` (Product.pending_image) under their
+    products. The rows stay locked while an ImageWriterPool links each file under its new name,
+    the new names are recorded, clearing pending_image, with one bulk_update in the same
+    transaction, and the pending files are only deleted once that has committed. A crash at any
+    point leaves either pending_image or the new image pointing at the bytes, never neither; a
+    link that fails keeps its pending_image, so resume_pending_image_moves can retry it.
+    """
+    field = Product._meta.get_field('image')
+    linked = []
+    try:
+        with transaction.atomic():
+            products = list(
+                Product.objects.select_for_update(skip_locked=True, of=('self',)).select_related('merchant')
+                .filter(pk__in=product_ids).exclude(pending_image='')
+            )
+            with ImageWriterPool(field, workers=getattr(settings, 'MODERATION_IMAGE_WORKERS', 4)) as pool:
+                for product in products:
+                    pool.submit_link(product, product.pending_image, context=product)
+            saved, failed = pool.drain()
+            linked = [stored for _, stored in saved]
+            done = [Product(pk=pk, image=stored, pending_image='') for pk, stored in saved]
+            for product, error in failed:
+                if isinstance(error, FileNotFoundError):
+                    # Pending files are only deleted after their new name committed, so this one was
+                    # lost outside of moderation: there is nothing left to move, stop retrying it
+                    logger.error(f"Pending image {product.pending_image} of product {product.pk} is missing")
+                    done.append(Product(pk=product.pk, image=product.image.name, pending_image=''))
+                else:
+                    logger.error(f"Failed to move pending image {product.pending_image}: {str(error)}")
+            Product.objects.bulk_update(done, ['image', 'pending_image'])
+            moved = {pk for pk, _ in saved}
+            sources = [product.pending_image for product in products if product.pk in moved]
+            if sources:
+                transaction.on_commit(lambda: delete_pending_images(sources))
+    except Exception:
+        # Nothing was recorded, the pending files stay the source of truth: drop the new links
+        for name in linked:
+            field.storage.delete(name)
+        raise
+    return len(saved)
+
+
+def resume_pending_image_moves(batch_size=500):
+    """Retry the moves of every product that still records a pending image; returns the count moved"""
+    moved, after = 0, 0
+    while True:
+        pending = Product.objects.exclude(pending_image='').filter(pk__gt=after).order_by('pk')
+        ids = list(pending.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return moved
+        moved += move_pending_images(ids)
+        after = ids[-1]
+
+
+def delete_pending_images(names):
+    storage = PendingProduct._meta.get_field('image').storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception as e:
+            logger.error(f"Failed to delete pending product image {name}: {str(e)}")
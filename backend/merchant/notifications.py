@@ -0,0 +1,306 @@
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .events import OVERFLOW, get_broker, merchant_channel, sse_event
+from .models import Merchant, Notification, NotificationBroadcast, NotificationCounter
+from .serializers import NotificationSerializer
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------- Unread notification counters -------------------
+# NotificationCounter.unread mirrors COUNT(*) of a merchant's unread notifications so the
+# constantly polled unread_count endpoint is a primary key lookup. Every write that changes
+# is_read goes through a conditional UPDATE whose row count is exactly what changed, and the
+# counters move by that amount in the same transaction. `manage.py repair_unread_counts`
+# recomputes them from the notifications table.
+
+def adjust_unread_counts(deltas):
+    """Add ``deltas[merchant id]`` to each merchant's counter in one UPDATE (never below zero)"""
+    deltas = {merchant_id: delta for merchant_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    by_delta = defaultdict(list)  # one WHEN per distinct delta, a broadcast chunk is a single WHEN
+    for merchant_id, delta in deltas.items():
+        by_delta[delta].append(merchant_id)
+    NotificationCounter.objects.filter(merchant_id__in=deltas).update(unread=Greatest(
+        F('unread') + Case(
+            *[When(merchant_id__in=merchant_ids, then=Value(delta)) for delta, merchant_ids in by_delta.items()],
+            default=Value(0), output_field=IntegerField(),
+        ),
+        Value(0),
+    ))
+
+
+def notifications_created(notifications):
+    """Count and publish freshly bulk_created notifications (bulk_create sends no post_save)"""
+    adjust_unread_counts(Counter(n.recipient_id for n in notifications if not n.is_read))
+    publish_notifications(notifications)
+
+
+def _set_read(queryset, is_read):
+    with transaction.atomic():
+        # Lock the rows that will change so concurrent calls cannot count them twice
+        changed = list(
+            queryset.filter(is_read=not is_read).select_for_update().order_by().values_list('pk', 'recipient_id')
+        )
+        if not changed:
+            return 0
+        Notification.objects.filter(pk__in=[pk for pk, _ in changed]).update(is_read=is_read)
+        sign = 1 if not is_read else -1
+        adjust_unread_counts({
+            recipient_id: sign * count for recipient_id, count in Counter(r for _, r in changed).items()
+        })
+    return len(changed)
+
+
+def mark_read(queryset):
+    """Mark the unread notifications of ``queryset`` as read, returns how many changed"""
+    return _set_read(queryset, True)
+
+
+def mark_unread(queryset):
+    """Mark the read notifications of ``queryset`` as unread, returns how many changed"""
+    return _set_read(queryset, False)
+
+
+def get_unread_count(merchant):
+    unread = NotificationCounter.objects.filter(merchant=merchant).values_list('unread', flat=True).first()
+    if unread is not None:
+        return unread
+    # Merchants created before the counters existed and not repaired yet: count once, then keep it
+    try:
+        with transaction.atomic():
+            counter = NotificationCounter.objects.create(
+                merchant=merchant, unread=Notification.objects.filter(recipient=merchant, is_read=False).count()
+            )
+        return counter.unread
+    except IntegrityError:
+        return NotificationCounter.objects.get(merchant=merchant).unread
+
+
+def recompute_unread_counts(merchants=None):
+    """Rebuild the counters of ``merchants`` (all merchants by default), returns how many were written"""
+    merchants = Merchant.objects.all() if merchants is None else merchants
+    unread = (
+        Notification.objects.filter(recipient=OuterRef('pk'), is_read=False)
+        .order_by().values('recipient').annotate(n=Count('pk')).values('n')
+    )
+    with transaction.atomic():
+        counts = merchants.annotate(unread=Coalesce(Subquery(unread), 0)).values_list('pk', 'unread')
+        counters = [NotificationCounter(merchant_id=pk, unread=count) for pk, count in counts]
+        NotificationCounter.objects.bulk_create(
+            counters, batch_size=1000, update_conflicts=True,
+            unique_fields=['merchant'], update_fields=['unread'],
+        )
+    return len(counters)
+
+
+# ---------------------- Live notification stream -------------------
+def publish_notifications(notifications):
+    """Push new notifications to their recipients' streams once the current transaction commits"""
+    if not getattr(settings, 'NOTIFICATION_STREAM_ENABLED', False):
+        return  # polling only: nothing subscribes, don't serialize for nobody
+    messages = [(merchant_channel(n.recipient_id), NotificationSerializer(n).data) for n in notifications]
+    if not messages:
+        return
+
+    def publish():
+        broker = get_broker()
+        for channel, data in messages:
+            broker.publish(channel, data)
+    transaction.on_commit(publish)
+
+
+STREAM_TICKET_SALT = 'merchant.notifications.stream'
+
+
+def issue_stream_ticket(merchant):
+    """
+    A signed ticket that opens ``merchant``'s stream within NOTIFICATION_STREAM_TICKET_MAX_AGE
+    seconds. EventSource cannot send headers, so it goes in the query string instead of the JWT:
+    if it leaks through access logs it is already expired and never worked anywhere else.
+    """
+    return signing.dumps(merchant.pk, salt=STREAM_TICKET_SALT)
+
+
+def merchant_for_stream_ticket(ticket):
+    """The active merchant a ticket was issued to, or None if it is invalid or expired"""
+    try:
+        merchant_id = signing.loads(
+            ticket, salt=STREAM_TICKET_SALT, max_age=getattr(settings, 'NOTIFICATION_STREAM_TICKET_MAX_AGE', 30)
+        )
+    except signing.BadSignature:  # also raised for expired tickets
+        return None
+    return Merchant.objects.filter(pk=merchant_id, is_active=True).first()
+
+
+def _latest_notification_id(merchant):
+    return Notification.objects.filter(recipient=merchant).order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def _missed_notifications(merchant, last_event_id, limit):
+    notifications = Notification.objects.filter(recipient=merchant, pk__gt=last_event_id).select_related('product')
+    return list(NotificationSerializer(notifications.order_by('pk')[:limit], many=True).data)
+
+
+async def notification_events(merchant, last_event_id=None):
+    """
+    SSE stream for one merchant: notifications missed since ``last_event_id``, the unread count,
+    then every new notification as it is published. The broker only carries notifications created
+    by this process, so once per heartbeat interval the stream also reads the table past the
+    highest id it has confirmed there: anything created elsewhere (admin, upload worker, other
+    web workers) arrives within one heartbeat.
+    """
+    heartbeat = getattr(settings, 'NOTIFICATION_STREAM_HEARTBEAT', 15)
+    loop = asyncio.get_running_loop()
+    # Subscribe before reading the backlog so nothing created in between is lost
+    subscription = get_broker().subscribe(merchant_channel(merchant.pk))
+    try:
+        yield f"retry: {heartbeat * 1000}\n\n"
+        if last_event_id is None:
+            watermark = await sync_to_async(_latest_notification_id)(merchant)
+        else:
+            watermark = last_event_id
+        sent = set()  # ids pushed by the broker above the watermark
+
+        async def catch_up():
+            nonlocal watermark, sent
+            events = []
+            for data in await sync_to_async(_missed_notifications)(merchant, watermark, 100):
+                watermark = data['id']
+                if data['id'] not in sent:
+                    events.append(sse_event(data, event='notification', event_id=data['id']))
+            sent = {pk for pk in sent if pk > watermark}
+            return events
+
+        for event in (await catch_up() if last_event_id is not None else []):
+            yield event
+        yield sse_event({'unread_count': await sync_to_async(get_unread_count)(merchant)}, event='unread_count')
+
+        checked = loop.time()
+        while True:
+            message = await subscription.get(timeout=heartbeat)
+            if message is OVERFLOW:
+                # Fell behind: have the client refetch its list and count
+                yield sse_event({}, event='resync')
+            elif message is not None and message['id'] > watermark and message['id'] not in sent:
+                sent.add(message['id'])
+                yield sse_event(message, event='notification', event_id=message['id'])
+
+            if loop.time() - checked >= heartbeat:
+                checked = loop.time()
+                events = await catch_up()
+                for event in events:
+                    yield event
+                if events:
+                    yield sse_event(
+                        {'unread_count': await sync_to_async(get_unread_count)(merchant)}, event='unread_count'
+                    )
+                elif message is None:
+                    yield ": keepalive\n\n"
+    finally:
+        subscription.close()
+
+
+# ---------------------- Broadcasts -------------------
+def broadcast_recipients(broadcast):
+    """Active merchants matching a NotificationBroadcast's targeting fields, in primary key order"""
+    merchants = Merchant.objects.filter(is_active=True)
+    if broadcast.business_category:
+        merchants = merchants.filter(profile__category=broadcast.business_category)
+    if broadcast.city.strip():
+        merchants = merchants.filter(profile__city__iexact=broadcast.city.strip())
+    if broadcast.emails:
+        merchants = merchants.filter(email__in=broadcast.emails)
+    return merchants.order_by('pk')
+
+
+class BroadcastClaimLost(Exception):
+    """Another sender reclaimed the broadcast after this one went quiet for too long"""
+
+
+def sendable_broadcasts(queryset=None):
+    """
+    Broadcasts a sender may claim: pending or failed ones, and 'sending' ones whose sender has
+    shown no sign of life for BROADCAST_STALE_AFTER seconds (its process died mid-send)
+    """
+    queryset = NotificationBroadcast.objects.all() if queryset is None else queryset
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'BROADCAST_STALE_AFTER', 300))
+    return queryset.filter(
+        Q(status__in=['pending', 'failed']) | Q(status='sending', heartbeat_at__lt=stale) |
+        Q(status='sending', heartbeat_at__isnull=True)
+    )
+
+
+def send_broadcast(broadcast):
+    """
+    Fan a broadcast out as one Notification per recipient. Recipient ids are streamed from a
+    server-side cursor and written in chunks of BROADCAST_CHUNK_SIZE, each in its own short
+    transaction that also records the keyset position and a heartbeat, so a failed run, or one
+    whose process died (see sendable_broadcasts), resumes where it stopped.
+    Must run outside a transaction (see merchant.jobs.run_after_commit).
+    """
+    chunk_size = getattr(settings, 'BROADCAST_CHUNK_SIZE', 1000)
+    broadcasts = NotificationBroadcast.objects.filter(pk=broadcast.pk)
+    now = timezone.now()
+    if not sendable_broadcasts(broadcasts).update(status='sending', started_at=now, heartbeat_at=now, last_error=''):
+        return broadcast.sent_count  # already sent, or another worker is sending it
+    broadcast.refresh_from_db(fields=['sent_count', 'last_recipient_id'])
+    broadcasts = broadcasts.filter(started_at=now)  # this claim only, see BroadcastClaimLost
+
+    recipients = broadcast_recipients(broadcast)
+    if broadcast.last_recipient_id is not None:
+        recipients = recipients.filter(pk__gt=broadcast.last_recipient_id)
+    sent = broadcast.sent_count
+    try:
+        chunk = []
+        for recipient_id in recipients.values_list('pk', flat=True).iterator(chunk_size=chunk_size):
+            chunk.append(recipient_id)
+            if len(chunk) >= chunk_size:
+                sent += _send_chunk(broadcasts, broadcast.message, chunk, sent)
+                chunk = []
+        if chunk:
+            sent += _send_chunk(broadcasts, broadcast.message, chunk, sent)
+    except BroadcastClaimLost:
+        logger.warning(f"Broadcast {broadcast.pk} was reclaimed by another sender after {sent} notifications")
+        return sent
+    except Exception as e:
+        logger.exception(f"Broadcast {broadcast.pk} failed after {sent} notifications: {str(e)}")
+        broadcasts.update(status='failed', last_error=str(e))
+        return sent
+
+    broadcasts.update(status='sent', finished_at=timezone.now(), sent_count=sent)
+    logger.info(f"Broadcast {broadcast.pk} sent to {sent} merchant(s)")
+    return sent
+
+
+def send_broadcast_by_id(broadcast_id):
+    broadcast = NotificationBroadcast.objects.filter(pk=broadcast_id).first()
+    if broadcast is not None:
+        send_broadcast(broadcast)
+
+
+def _send_chunk(broadcasts, message, recipient_ids, sent_before):
+    with transaction.atomic():
+        # Recording the position first also locks the broadcast row against a concurrent reclaim
+        if not broadcasts.update(
+            sent_count=sent_before + len(recipient_ids), last_recipient_id=recipient_ids[-1],
+            heartbeat_at=timezone.now(),
+        ):
+            raise BroadcastClaimLost()
+        created = Notification.objects.bulk_create(
+            [Notification(recipient_id=recipient_id, message=message) for recipient_id in recipient_ids]
+        )
+        notifications_created(created)
+    return len(created)
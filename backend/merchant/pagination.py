@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+
+
+# ---------------------- Keyset (cursor) pagination -------------------
+class SmartAddProductPagination(CursorPagination):
+    """Keyset pages over master products by id, cheap at any depth of a large category"""
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class ProductCursorPagination(CursorPagination):
+    """Inventory pages ordered newest first, with id as the tie-breaker"""
+    ordering = ('-created_at', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class NotificationCursorPagination(CursorPagination):
+    """Notifications newest first, served by the (recipient, is_read, created_at) index"""
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+# ---------------------- Admin changelist pagination -------------------
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator that takes the table's row estimate (pg_class.reltuples) instead of
+    running COUNT(*) once a table holds more than ADMIN_ESTIMATED_COUNT_THRESHOLD rows. The
+    estimate only stands for an unfiltered listing: searched or filtered changelists, smaller
+    tables and other databases still get the exact count.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = self._estimated_count()
+        if estimate is not None and estimate >= getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000):
+            return estimate
+        return super().count
+
+    def _estimated_count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None or query.where or query.distinct or query.is_sliced or query.combinator:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 until the table was first vacuumed or analyzed
+        return int(row[0]) if row and row[0] >= 0 else None
@@ -0,0 +1,259 @@
+import logging
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from rest_framework import serializers
+
+from .catalog import attach_master_images_by_id
+from .ingestion import DEFAULT_BATCH_SIZE, ImportStats, as_text, validation_message
+from .inventory import price_errors, stock_price_fields
+from .jobs import run_after_commit
+from .models import MasterCategory, MasterProduct, Product
+from .querycount import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_COLUMNS = {'name', 'stock', 'original_price', 'discount_price'}  # brand, category, description are optional
+PRODUCT_UPDATE_FIELDS = ['stock', 'original_price', 'discount_price', 'description', 'category']
+# Relations are resolved in bulk, clean_fields would otherwise query each one per row
+PRODUCT_CLEAN_EXCLUDE = ['merchant', 'master_product', 'category', 'image']
+
+
+# ---------------------- Merchant inventory rows -------------------
+class ProductRow(NamedTuple):
+    number: int
+    name: str
+    brand: str
+    description: str
+    category: str
+    stock: str
+    original_price: str
+    discount_price: str
+
+    @classmethod
+    def from_sheet_row(cls, row):
+        return cls(number=row.number, **{field: as_text(row.values.get(field)) for field in cls._fields[1:]})
+
+
+def iter_product_batches(reader, batch_size=DEFAULT_BATCH_SIZE):
+    for batch in reader.batches(batch_size):
+        yield [ProductRow.from_sheet_row(row) for row in batch]
+
+
+class ProductImportStats(ImportStats):
+    def __init__(self):
+        super().__init__()
+        self.updated = 0
+
+    def __str__(self):
+        return (
+            f"{self.created} created, {self.updated} updated of {self.rows}, {self.duplicates} duplicates, "
+            f"{self.invalid} invalid, {self.failed} failed; "
+            f"{self.rows_per_second:.0f} rows/s, {self.queries_per_1000_rows:.1f} queries per 1,000 rows"
+        )
+
+
+# ---------------------- Batched merchant inventory import -------------------
+class MerchantProductImporter:
+    """
+    Upserts a merchant's inventory spreadsheet batch by batch. Each batch is matched to the master
+    catalog of the merchant's business category by (name, brand) and to the merchant's existing
+    products (by master product, else by name) with one query each, then written with one
+    bulk_create and one bulk_update. Categories are resolved from an in-memory map of the
+    business category's MasterCategory rows loaded once; a row naming any other category is
+    invalid. Rows are validated against the model fields first; should a batch still be refused
+    by the database, it is retried row by row so only the offending rows fail. Matched master
+    images are attached after commit.
+    """
+
+    def __init__(self, merchant, business_category, batch_size=None):
+        self.merchant = merchant
+        self.business_category = business_category
+        self.batch_size = batch_size or getattr(settings, 'PRODUCT_UPLOAD_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.stats = ProductImportStats()
+        self._fields = stock_price_fields()
+        self._categories = None
+        self._seen = set()
+
+    def run(self, batches):
+        started = time.perf_counter()
+        with QueryCounter() as queries:
+            for batch in batches:
+                self.process_batch(batch)
+        self.stats.queries += queries.count
+        self.stats.seconds = time.perf_counter() - started
+        logger.info(f"Product import for {self.merchant.email} finished: {self.stats}")
+        return self.stats
+
+    def process_batch(self, rows):
+        valid = []
+        for row in rows:
+            self.stats.rows += 1
+            values, errors = self._clean(row)
+            if errors:
+                self.stats.invalid += 1
+                self.stats.report(row, 'invalid', '; '.join(
+                    f"{field}: {' '.join(str(e) for e in messages)}" for field, messages in errors.items()
+                ))
+                continue
+            valid.append((row, values))
+        if not valid:
+            return
+
+        names = {row.name.lower() for row, _ in valid}
+        masters = self._match_masters(names)
+        matched = [(row, values, masters.get((row.name.lower(), row.brand.lower()))) for row, values in valid]
+        by_master, by_name = self._existing_products(
+            names, {master['id'] for _, _, master in matched if master}
+        )
+
+        created, updated = [], []
+        for row, values, master in matched:
+            category_id = master['category_id'] if master else self._category_id(row.category)
+            if not master and row.category and category_id is None:
+                self.stats.invalid += 1
+                self.stats.report(row, 'invalid', f"category: No {self.business_category} category named '{row.category}'")
+                continue
+            key = ('master', master['id']) if master else ('name', row.name.lower())
+            if key in self._seen:
+                self.stats.duplicates += 1
+                self.stats.report(row, 'duplicate', "Product appears more than once in the sheet")
+                continue
+
+            existing = by_master.get(master['id']) if master else None
+            existing = existing or by_name.get(row.name.lower())
+            if existing is not None and ('product', existing.pk) in self._seen:
+                self.stats.duplicates += 1
+                self.stats.report(row, 'duplicate', "Another row already updated this product")
+                continue
+
+            if existing is not None:
+                product = existing
+                product.stock = values['stock']
+                product.original_price = values['original_price']
+                product.discount_price = values['discount_price']
+                product.description = row.description or product.description
+                product.category_id = category_id or product.category_id
+            else:
+                product = Product(
+                    merchant=self.merchant,
+                    master_product_id=master['id'] if master else None,
+                    name=row.name,
+                    description=row.description or (master['description'] if master else ''),
+                    category_id=category_id,
+                    stock=values['stock'],
+                    original_price=values['original_price'],
+                    discount_price=values['discount_price'],
+                    image_pending=bool(master and master['image']),
+                )
+            try:
+                product.clean_fields(exclude=PRODUCT_CLEAN_EXCLUDE)
+            except ValidationError as e:
+                self.stats.invalid += 1
+                self.stats.report(row, 'invalid', validation_message(e))
+                continue
+
+            self._seen.add(key)
+            if existing is not None:
+                self._seen.add(('product', existing.pk))
+                updated.append((product, row))
+            else:
+                created.append((product, row))
+
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create([p for p, _ in created], batch_size=self.batch_size)
+                Product.objects.bulk_update([p for p, _ in updated], PRODUCT_UPDATE_FIELDS, batch_size=self.batch_size)
+        except DatabaseError as e:
+            logger.warning(f"Product import batch refused for {self.merchant.email} ({str(e)}), retrying row by row")
+            created, updated = self._write_one_by_one(created, updated)
+        image_ids = [product.pk for product, _ in created if product.image_pending]
+        if image_ids:
+            run_after_commit(attach_master_images_by_id, image_ids)
+        self.stats.created += len(created)
+        self.stats.updated += len(updated)
+
+    def _write_one_by_one(self, created, updated):
+        """Write each ``(product, row)`` in a savepoint, reporting the rows that fail; returns the written ones"""
+        written_created, written_updated = [], []
+        for product, row in created:
+            product.pk = None  # in case the failed bulk_create assigned some
+            if self._save_row(row, lambda: product.save(force_insert=True)):
+                written_created.append((product, row))
+            else:
+                product.pk = None
+        for product, row in updated:
+            if self._save_row(row, lambda: product.save(update_fields=PRODUCT_UPDATE_FIELDS)):
+                written_updated.append((product, row))
+        return written_created, written_updated
+
+    def _save_row(self, row, save):
+        try:
+            with transaction.atomic():
+                save()
+        except DatabaseError as e:
+            self.stats.failed += 1
+            self.stats.report(row, 'failed', str(e))
+            return False
+        return True
+
+    def _clean(self, row):
+        """Coerced stock and prices for a row, or the field errors"""
+        values, errors = {}, {}
+        if not row.name:
+            errors['name'] = ["This field is required."]
+        raw = {
+            'stock': row.stock or '0',
+            'original_price': row.original_price,
+            'discount_price': row.discount_price or row.original_price,  # no discount: sold at the original price
+        }
+        for field, value in raw.items():
+            try:
+                values[field] = self._fields[field].run_validation(value)
+            except serializers.ValidationError as e:
+                errors[field] = e.detail
+        if not errors:
+            errors = price_errors(values['original_price'], values['discount_price'])
+        return values, errors
+
+    def _match_masters(self, names):
+        """{(name, brand) lower-cased: master product values} for the batch's names"""
+        masters = {}
+        rows = (
+            MasterProduct.objects.filter(category__business_category=self.business_category)
+            .annotate(name_lower=Lower('name')).filter(name_lower__in=names)
+            .order_by('id').values('id', 'name', 'brand', 'description', 'category_id', 'image')
+        )
+        for master in rows:
+            masters.setdefault((master['name'].lower(), (master['brand'] or '').lower()), master)
+        return masters
+
+    def _existing_products(self, names, master_ids):
+        """The merchant's products matching the batch, by master product id and by lower-cased name"""
+        products = (
+            Product.objects.filter(merchant=self.merchant).annotate(name_lower=Lower('name'))
+            .filter(Q(master_product_id__in=master_ids) | Q(name_lower__in=names))
+            .only('id', 'name', 'master_product_id', *PRODUCT_UPDATE_FIELDS)
+        )
+        by_master, by_name = {}, {}
+        for product in products:
+            if product.master_product_id:
+                by_master.setdefault(product.master_product_id, product)
+            by_name.setdefault(product.name_lower, product)
+        return by_master, by_name
+
+    def _category_id(self, name):
+        """Id of the merchant's business category's MasterCategory called ``name`` (None if there is none)"""
+        if not name:
+            return None
+        if self._categories is None:
+            self._categories = {
+                n.lower(): pk for pk, n in
+                MasterCategory.objects.filter(business_category=self.business_category).values_list('id', 'name')
+            }
+        return self._categories.get(name.lower())
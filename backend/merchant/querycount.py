@@ -0,0 +1,44 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class QueryCounter:
+    """
+    Counts the SQL statements the current thread runs on a connection while the block is active.
+    Only the first ``keep_statements`` SQL strings are kept (none by default), so wrapping a
+    whole import costs a counter and not memory proportional to its size.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, keep_statements=0):
+        self.connection = connections[using]
+        self.keep_statements = keep_statements
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        if len(self.statements) < self.keep_statements:
+            self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.connection.execute_wrappers.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.connection.execute_wrappers.remove(self)
+
+
+class assert_max_queries(QueryCounter):
+    """Fail the block with the captured SQL if it runs more than ``limit`` statements"""
+
+    def __init__(self, limit, using=DEFAULT_DB_ALIAS):
+        super().__init__(using, keep_statements=limit + 50)  # enough to show what went over
+        self.limit = limit
+
+    def __exit__(self, exc_type, *exc):
+        super().__exit__(exc_type, *exc)
+        if exc_type is None and self.count > self.limit:
+            statements = '\n'.join(f"  {i}. {sql}" for i, sql in enumerate(self.statements, start=1))
+            if self.count > len(self.statements):
+                statements += f"\n  ... and {self.count - len(self.statements)} more"
+            raise AssertionError(f"{self.count} queries executed, at most {self.limit} expected:\n{statements}")
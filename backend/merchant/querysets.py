@@ -0,0 +1,49 @@
+from django.db import models
+from rest_framework import serializers
+
+
+# ---------------------- Serializer-driven select_related -------------------
+def related_paths(serializer, model, prefix=''):
+    """
+    select_related() paths for every forward relation a serializer reads: nested serializers
+    (recursively) and dotted sources such as ``product.name``. Write-only fields are skipped.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    paths = []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        nested = isinstance(field, serializers.BaseSerializer)
+        attrs = field.source.split('.')
+        if not nested:
+            attrs = attrs[:-1]  # the last part is the column read off the related row
+        current_model, path = model, prefix
+        for attr in attrs:
+            relation = _forward_relation(current_model, attr)
+            if relation is None:
+                break
+            path = f"{path}__{attr}" if path else attr
+            current_model = relation.related_model
+            paths.append(path)
+        else:
+            if nested and attrs:
+                paths.extend(related_paths(field, current_model, path))
+    return sorted(set(paths))
+
+
+def _forward_relation(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except Exception:
+        return None
+    if isinstance(field, (models.ForeignKey, models.OneToOneField)):
+        return field
+    return None
+
+
+def select_related_for(serializer, queryset):
+    """Apply related_paths() of a serializer (class or configured instance) to ``queryset``"""
+    if isinstance(serializer, type):
+        serializer = serializer()
+    return queryset.select_related(*related_paths(serializer, queryset.model))
@@ -1,12 +1,13 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
-from django.core.files import File
-import os
+from django.core.files.storage import default_storage
+from django.db import transaction
 
 from .models import (
     Merchant, MerchantProfile, Product, MasterCategory, MasterProduct,
-    SmartAddSelection, PendingProduct, Notification
+    SmartAddSelection, PendingProduct, Notification, NotificationBroadcast
 )
+from .storage import attach_master_images, release_shared_images
 
 # ✅ Profile Image Serializer (for dashboard)
 class MerchantProfileImageSerializer(serializers.ModelSerializer):
@@ -139,8 +140,28 @@ class MasterProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'brand', 'description', 'image', 'category', 'category_id']
 
 
+# ✅ Sparse fieldsets (?fields= / ?expand=)
+class SparseFieldsMixin:
+    """
+    Optional ``fields`` (names to render) and ``expand`` (relations rendered as nested objects)
+    arguments. When ``expand`` is given, the relations in ``expandable_fields`` it does not name
+    are rendered as their primary key, so they cost neither a join nor a nested serializer.
+    """
+    expandable_fields = ()
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if expand is not None:
+            for name in self.expandable_fields:
+                if name in self.fields and name not in expand:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+
 # ✅ Product
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     merchant = serializers.HiddenField(default=serializers.CurrentUserDefault())
     master_product = MasterProductSerializer(read_only=True)
     master_product_id = serializers.PrimaryKeyRelatedField(
@@ -154,6 +175,8 @@ class ProductSerializer(serializers.ModelSerializer):
     # Added for manual category creation (if not using master product)
     input_category_name = serializers.CharField(write_only=True, required=False, allow_blank=True) 
 
+    expandable_fields = ('master_product', 'category')
+
     class Meta:
         model = Product
         fields = [
@@ -181,16 +204,70 @@ class ProductSerializer(serializers.ModelSerializer):
                                                                defaults={'business_category': instance.merchant.profile.category}) # Assign to merchant's business category
             instance.category = category
 
+        released = None
         for attr, value in validated_data.items():
             # Exclude image from direct update here, as it's handled by specific image upload endpoints
             if attr == 'image' and value is None: # Allow clearing image, but not updating via direct patch
+                released = instance.image.name if instance.image else None
                 instance.image = None
             elif attr != 'image':
                 setattr(instance, attr, value)
 
         instance.save()
+        if released:
+            # Only once the product no longer points at the file, or a failed save would leave it dangling
+            transaction.on_commit(lambda: release_shared_images([released]))
         return instance
 
+# ✅ Product list straight from .values() rows
+class ProductValuesSerializer:
+    """
+    Renders ``Product.objects.values()`` rows in the same format as ProductSerializer, without
+    instantiating models. Only flat fields are supported, relations are rendered as their id.
+    """
+    columns = {
+        'id': 'id', 'name': 'name', 'description': 'description', 'stock': 'stock',
+        'original_price': 'original_price', 'discount_price': 'discount_price', 'image': 'image',
+        'category': 'category_id', 'master_product': 'master_product_id', 'created_at': 'created_at',
+    }
+
+    def __init__(self, fields, context=None):
+        self.fields = [name for name in self.columns if name in fields]
+        self.request = (context or {}).get('request')
+        price = serializers.DecimalField(max_digits=10, decimal_places=2)
+        self.formatters = {
+            'original_price': price.to_representation,
+            'discount_price': price.to_representation,
+            'created_at': serializers.DateTimeField().to_representation,
+            'image': self.image_url,
+        }
+
+    @classmethod
+    def supports(cls, fields, expand):
+        return fields is not None and not expand and set(fields) <= set(cls.columns)
+
+    @property
+    def value_columns(self):
+        return [self.columns[name] for name in self.fields]
+
+    def image_url(self, name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request else url
+
+    def to_representation(self, row):
+        data = {}
+        for name in self.fields:
+            value = row[self.columns[name]]
+            formatter = self.formatters.get(name)
+            data[name] = formatter(value) if formatter and value is not None else value
+        return data
+
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
 # ✅ Create Product from Master Product
 class ProductCreateFromMasterSerializer(serializers.ModelSerializer):
     master_product_id = serializers.IntegerField(write_only=True)
@@ -229,11 +306,7 @@ class ProductCreateFromMasterSerializer(serializers.ModelSerializer):
 
         if master_product.image:
             try:
-                product.image.save(
-                    os.path.basename(master_product.image.name),
-                    File(master_product.image.file),
-                    save=True
-                )
+                attach_master_images([product])
             except Exception as e:
                 print(f"Image copy failed: {e}")
 
@@ -369,4 +442,23 @@ class NotificationSerializer(serializers.ModelSerializer):
         read_only_fields = ['message', 'created_at', 'product', 'product_name']
 
 
+# ---------------------- NEW: Notification Broadcast Serializer -------------------
+class NotificationBroadcastSerializer(serializers.ModelSerializer):
+    emails = serializers.ListField(child=serializers.EmailField(), write_only=True, required=False)
+
+    class Meta:
+        model = NotificationBroadcast
+        fields = [
+            'id', 'message', 'business_category', 'city', 'emails', 'recipient_emails',
+            'status', 'sent_count', 'created_at', 'started_at', 'finished_at', 'last_error',
+        ]
+        read_only_fields = [
+            'recipient_emails', 'status', 'sent_count', 'created_at', 'started_at', 'finished_at', 'last_error',
+        ]
 
+    def validate(self, data):
+        emails = data.pop('emails', [])
+        data['recipient_emails'] = '\n'.join(emails)
+        if not (data.get('business_category') or data.get('city', '').strip() or emails):
+            raise serializers.ValidationError("Target a business category, a city or a list of merchants.")
+        return data
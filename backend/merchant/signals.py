@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .catalog_cache import bump_all_catalog_versions, bump_catalog_version, category_business_categories
+from .models import MasterCategory, MasterProduct, Merchant, Notification, NotificationCounter, Product
+from .moderation import delete_pending_images
+from .notifications import adjust_unread_counts, publish_notifications
+from .storage import release_shared_images
+
+
+@receiver(post_delete, sender=Product)
+def release_product_image(sender, instance, **kwargs):
+    if instance.image:
+        release_shared_images([instance.image.name])
+    if instance.pending_image:
+        transaction.on_commit(lambda: delete_pending_images([instance.pending_image]))
+
+
+# ---------------------- Catalog cache invalidation -------------------
+@receiver([post_save, post_delete], sender=MasterCategory)
+def invalidate_catalog_for_category(sender, instance, **kwargs):
+    # Renames and business category moves affect several catalogs, and category writes are rare
+    bump_all_catalog_versions()
+
+
+@receiver(pre_save, sender=MasterProduct)
+def remember_previous_master_category(sender, instance, **kwargs):
+    instance._previous_category_id = None
+    if instance.pk:
+        instance._previous_category_id = (
+            MasterProduct.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=MasterProduct)
+def invalidate_catalog_for_master_product(sender, instance, **kwargs):
+    business_categories = category_business_categories()
+    bump_catalog_version(
+        business_categories.get(instance.category_id),
+        business_categories.get(getattr(instance, '_previous_category_id', None)),
+    )
+
+
+# ---------------------- Unread notification counters -------------------
+@receiver(post_save, sender=Merchant)
+def create_notification_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        NotificationCounter.objects.get_or_create(merchant=instance)
+
+
+@receiver(post_init, sender=Notification)
+def remember_loaded_read_state(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred is_read is not fetched just to be remembered
+    instance._loaded_is_read = instance.__dict__.get('is_read')
+
+
+@receiver(post_save, sender=Notification)
+def count_saved_notification(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        delta = 0 if instance.is_read else 1
+        publish_notifications([instance])
+    elif instance._loaded_is_read is None or instance._loaded_is_read == instance.is_read:
+        delta = 0
+    else:
+        delta = -1 if instance.is_read else 1
+    instance._loaded_is_read = instance.is_read
+    adjust_unread_counts({instance.recipient_id: delta})
+
+
+@receiver(post_delete, sender=Notification)
+def count_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        adjust_unread_counts({instance.recipient_id: -1})
@@ -0,0 +1,209 @@
+import hashlib
+import logging
+import os
+from collections import Counter, defaultdict
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+
+from .models import MasterProduct, Product, SharedImage
+
+logger = logging.getLogger(__name__)
+
+SHARED_IMAGE_DIR = 'shared_images'
+
+
+# ---------------------- Content-addressed image storage -------------------
+# Identical image bytes are stored once under shared_images/<aa>/<sha256>.<ext> and every
+# Product.image pointing at that path holds one reference on its SharedImage row. The file
+# is deleted when the last reference is released.
+
+def file_digest(file):
+    """sha256 hex digest of a file, read in chunks"""
+    sha = hashlib.sha256()
+    for chunk in file.chunks():
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+def is_shared(name):
+    return bool(name) and name.startswith(f"{SHARED_IMAGE_DIR}/")
+
+
+def _store(digest, file, filename):
+    """Make sure a SharedImage row exists for ``digest`` (with no references taken)"""
+    shared = SharedImage.objects.filter(digest=digest).first()
+    if shared is not None:
+        return shared
+    ext = os.path.splitext(filename)[1].lower()
+    name = default_storage.save(f"{SHARED_IMAGE_DIR}/{digest[:2]}/{digest}{ext}", file)
+    try:
+        with transaction.atomic():
+            return SharedImage.objects.create(digest=digest, name=name)
+    except IntegrityError:
+        # Another request stored the same bytes first, keep theirs
+        default_storage.delete(name)
+        return SharedImage.objects.get(digest=digest)
+
+
+def _hash_masters(masters):
+    """
+    Fill image_digest on masters that were never shared, storing each new distinct file once.
+    Masters whose file is missing or unreadable are logged and left without a digest.
+    """
+    unhashed = [m for m in masters if not m.image_digest]
+    if not unhashed:
+        return
+    by_name = {}
+    for master in unhashed:
+        name = master.image.name
+        if name not in by_name:
+            try:
+                with master.image.open('rb') as f:
+                    by_name[name] = file_digest(f)
+            except OSError as e:
+                logger.warning(f"Image {name} of master product {master.pk} is unreadable, not sharing it: {e}")
+                by_name[name] = ''
+        master.image_digest = by_name[name]
+
+    known = set(SharedImage.objects.filter(digest__in=set(by_name.values())).values_list('digest', flat=True))
+    for name, digest in by_name.items():
+        if digest and digest not in known:
+            with default_storage.open(name, 'rb') as f:
+                _store(digest, f, name)
+            known.add(digest)
+    unhashed = [m for m in unhashed if m.image_digest]
+    if unhashed:
+        MasterProduct.objects.bulk_update(unhashed, ['image_digest'])
+
+
+def attach_master_images(products):
+    """
+    Point each product's image at its master product's shared file, taking one reference per
+    product. Masters are hashed only the first time they are shared, after that this costs a
+    constant number of queries however many products are given.
+    """
+    masters = {}
+    for product in products:
+        master = product.master_product
+        if master is not None and master.image:
+            masters.setdefault(master.pk, master)
+    _hash_masters(masters.values())
+    masters = {pk: master for pk, master in masters.items() if master.image_digest}
+
+    by_digest = defaultdict(list)
+    for product in products:
+        if product.master_product_id in masters:
+            by_digest[masters[product.master_product_id].image_digest].append(product)
+    if not by_digest:
+        return []
+
+    shared = SharedImage.objects.in_bulk(list(by_digest), field_name='digest')
+    for digest in set(by_digest) - set(shared):
+        # Last reference was released since the master was hashed, store the bytes again
+        _restore_master_image(digest, by_digest, shared)
+
+    counts = {digest: len(group) for digest, group in by_digest.items()}
+    updated = _add_references(counts)
+    if updated < len(counts):
+        # A concurrent release deleted some rows between the lookup and the update
+        gone = set(counts) - set(SharedImage.objects.filter(digest__in=counts).values_list('digest', flat=True))
+        for digest in gone:
+            _restore_master_image(digest, by_digest, shared)
+        _add_references({digest: counts[digest] for digest in gone if digest in by_digest})
+
+    attached = []
+    for digest, group in by_digest.items():
+        for product in group:
+            product.image.name = shared[digest].name
+            attached.append(product)
+    Product.objects.bulk_update([p for p in attached if p.pk], ['image'])
+    return attached
+
+
+def _restore_master_image(digest, by_digest, shared):
+    """Store a master's file again under ``digest``, dropping its products if the file is gone"""
+    master = by_digest[digest][0].master_product
+    try:
+        with master.image.open('rb') as f:
+            shared[digest] = _store(digest, f, master.image.name)
+    except OSError as e:
+        logger.warning(f"Image {master.image.name} of master product {master.pk} is unreadable, not sharing it: {e}")
+        del by_digest[digest]
+
+
+def _add_references(counts):
+    """Add ``counts[digest]`` references to each SharedImage in one UPDATE, returns rows updated"""
+    return SharedImage.objects.filter(digest__in=counts).update(ref_count=F('ref_count') + Case(
+        *[When(digest=digest, then=Value(count)) for digest, count in counts.items()], default=Value(0)
+    ))
+
+
+def release_shared_images(names):
+    """Drop one reference per name and delete files nobody references any more"""
+    counts = Counter(name for name in names if is_shared(name))
+    if not counts:
+        return
+    with transaction.atomic():
+        # Decrement and orphan sweep commit together, a failure in between cannot lose references
+        SharedImage.objects.filter(name__in=counts).update(ref_count=Case(
+            *[When(name=name, ref_count__gte=count, then=F('ref_count') - count) for name, count in counts.items()],
+            default=Value(0),
+        ))
+        orphans = list(
+            SharedImage.objects.select_for_update().filter(name__in=counts, ref_count=0).values_list('pk', 'name')
+        )
+        if not orphans:
+            return
+        SharedImage.objects.filter(pk__in=[pk for pk, _ in orphans]).delete()
+
+        def delete_files():
+            for _, name in orphans:
+                try:
+                    default_storage.delete(name)
+                except Exception as e:
+                    logger.error(f"Failed to delete shared image {name}: {str(e)}")
+        transaction.on_commit(delete_files)
+
+
+# ---------------------- Moving stored files -------------------
+def link_file(source, target, storage=default_storage, max_length=None):
+    """
+    Store ``source``'s bytes under ``target`` (or the next free name) within ``storage`` as well,
+    returns the stored name; ``source`` is left in place. On a local filesystem the file is
+    hardlinked, so no bytes are copied and the cost does not depend on its size; backends without
+    local paths, or a target on another device, fall back to a streamed chunked copy.
+    """
+    try:
+        source_path = storage.path(source)
+    except NotImplementedError:
+        source_path = None
+
+    if source_path is not None:
+        while True:
+            name = storage.get_available_name(target, max_length=max_length)
+            target_path = storage.path(name)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            try:
+                # Unlike rename, link never replaces an existing file
+                os.link(source_path, target_path)
+            except FileExistsError:
+                continue  # taken since get_available_name, pick another
+            except FileNotFoundError:
+                logger.error(f"Cannot link {source}: the file is missing")
+                raise  # a copy would fail the same way
+            except OSError as e:
+                logger.info(f"Cannot link {source} to {name}, copying instead: {str(e)}")
+                break
+            return name
+
+    with storage.open(source, 'rb') as f:
+        return storage.save(target, f, max_length=max_length)
+
+
+def move_file(source, target, storage=default_storage, max_length=None):
+    """Move ``source`` to ``target`` (or the next free name) within ``storage``, see link_file"""
+    name = link_file(source, target, storage, max_length)
+    storage.delete(source)
+    return name
@@ -0,0 +1,214 @@
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+from .catalog_cache import catalog_version
+from .models import MasterCategory, MasterProduct, Merchant
+
+logger = logging.getLogger(__name__)
+
+NGRAM_RANGE = (3, 5)  # character n-grams, in bytes of the normalized UTF-8 text
+FEATURE_BITS = 18  # n-grams are hashed into 2**18 columns, so the vocabulary never has to be rebuilt
+DESCRIPTION_WEIGHT = 0.5  # description n-grams count half as much as name/brand ones
+DESCRIPTION_CHARS = 300
+SCORE_CHUNK = 2048  # pending products scored per dense block
+
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+# ---------------------- Hashed character n-gram vectors -------------------
+# Every text is lower-cased, stripped to words separated by single spaces and padded with a space,
+# then cut into byte n-grams for the whole batch at once: the n-gram codes are built with shifted
+# numpy views of one concatenated buffer, hashed multiplicatively into FEATURE_BITS bits, and
+# summed into a CSR matrix. Nothing in here loops per character in Python.
+
+def _normalize_text(text):
+    return f" {_NON_WORD.sub(' ', (text or '').lower()).strip()} "
+
+
+def ngram_counts(texts):
+    """Sparse (len(texts), 2**FEATURE_BITS) counts of the hashed character n-grams of each text"""
+    shape = (len(texts), 1 << FEATURE_BITS)
+    docs = [_normalize_text(text).encode() for text in texts]
+    if not docs:
+        return sparse.csr_matrix(shape, dtype=np.float32)
+    lengths = np.fromiter(map(len, docs), dtype=np.int64, count=len(docs))
+    buffer = np.frombuffer(b''.join(docs), dtype=np.uint8).astype(np.uint64)
+    doc_of = np.repeat(np.arange(len(docs)), lengths)
+
+    rows, columns = [], []
+    for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+        count = len(buffer) - n + 1
+        if count <= 0:
+            continue
+        code = np.zeros(count, dtype=np.uint64)
+        for offset in range(n):
+            # Bytes are never zero, so codes of different lengths cannot collide
+            code = (code << np.uint64(8)) | buffer[offset:offset + count]
+        inside = doc_of[:count] == doc_of[n - 1:]  # drop n-grams spanning two texts
+        rows.append(doc_of[:count][inside])
+        columns.append((code[inside] * _HASH_MULTIPLIER) >> np.uint64(64 - FEATURE_BITS))
+
+    if not rows:  # every text shorter than the smallest n-gram
+        return sparse.csr_matrix(shape, dtype=np.float32)
+    rows, columns = np.concatenate(rows), np.concatenate(columns).astype(np.int64)
+    # Duplicate (row, column) pairs are summed on conversion to CSR
+    return sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=shape)
+
+
+def term_frequencies(names, descriptions):
+    """Sublinear (1 + log) term frequencies of name n-grams plus down-weighted description n-grams"""
+    counts = ngram_counts(names) + DESCRIPTION_WEIGHT * ngram_counts(
+        [(description or '')[:DESCRIPTION_CHARS] for description in descriptions]
+    )
+    counts = counts.tocsr()
+    counts.data = 1 + np.log(counts.data)
+    return counts
+
+
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+# ---------------------- Category index -------------------
+class CategoryIndex:
+    """
+    TF-IDF index over the master products of one business category (or of the whole catalog when
+    ``business_category`` is None), labelled with their MasterCategory. Products are scored
+    against one L2-normalized centroid per category. ``refresh`` re-reads the catalog rows in one
+    query when the catalog version changed, and only re-vectorizes rows whose text or category
+    changed since the last refresh.
+    """
+
+    def __init__(self, business_category=None):
+        self.business_category = business_category
+        self.version = None
+        self.master_ids = np.empty(0, dtype=np.int64)
+        self.category_ids = np.empty(0, dtype=np.int64)
+        self.tf = sparse.csr_matrix((0, 1 << FEATURE_BITS), dtype=np.float32)
+        self._keys = {}  # master id -> hash of the fields the row was vectorized from
+        self._model = None  # (idf, category labels, centroids), swapped in one assignment
+
+    def current_version(self):
+        scopes = [self.business_category] if self.business_category else [c for c, _ in Merchant.CATEGORY_CHOICES]
+        return tuple(catalog_version(scope) for scope in scopes)
+
+    def refresh(self):
+        version = self.current_version()
+        if version == self.version:
+            return False
+        started = time.perf_counter()
+        masters = MasterProduct.objects.filter(category__isnull=False)
+        if self.business_category:
+            masters = masters.filter(category__business_category=self.business_category)
+        rows = masters.order_by().values_list('id', 'category_id', 'name', 'brand', 'description')
+
+        position = {master_id: i for i, master_id in enumerate(self.master_ids.tolist())}
+        kept, changed, keys = [], [], {}
+        for row in rows:
+            keys[row[0]] = key = hash(row[1:])
+            if self._keys.get(row[0]) == key:
+                kept.append(position[row[0]])
+            else:
+                changed.append(row)
+
+        kept = np.array(kept, dtype=np.int64)
+        fresh = term_frequencies([f"{name} {brand or ''}" for _, _, name, brand, _ in changed],
+                                 [description for *_, description in changed])
+        self.tf = sparse.vstack([self.tf[kept], fresh], format='csr')
+        self.master_ids = np.concatenate([self.master_ids[kept], np.array([r[0] for r in changed], dtype=np.int64)])
+        self.category_ids = np.concatenate([self.category_ids[kept], np.array([r[1] for r in changed], dtype=np.int64)])
+        self._keys = keys
+        self._rebuild()
+        self.version = version
+        logger.info(
+            f"Category index {self.business_category or 'all'} refreshed: {len(changed)} of "
+            f"{len(self.master_ids)} master products vectorized in {time.perf_counter() - started:.2f}s"
+        )
+        return True
+
+    def _rebuild(self):
+        """Recompute IDF weights and category centroids from the stored term frequencies"""
+        documents = self.tf.shape[0]
+        document_frequency = np.bincount(self.tf.indices, minlength=self.tf.shape[1])
+        idf = (np.log((1 + documents) / (1 + document_frequency)) + 1).astype(np.float32)
+        vectors = normalize_rows(self.tf @ sparse.diags(idf))
+        labels, inverse = np.unique(self.category_ids, return_inverse=True)
+        membership = sparse.csr_matrix(
+            (np.ones(documents, dtype=np.float32), (inverse, np.arange(documents))),
+            shape=(len(labels), documents),
+        )
+        self._model = (idf, labels, normalize_rows(membership @ vectors).T.tocsc())
+
+    def score(self, tf, k):
+        """(category ids, scores) arrays of shape (rows, k), best first, for term frequency rows"""
+        idf, labels, centroids = self._model
+        k = min(k, len(labels))
+        top_ids = np.zeros((tf.shape[0], k), dtype=np.int64)
+        top_scores = np.zeros((tf.shape[0], k), dtype=np.float32)
+        if not k:
+            return top_ids, top_scores
+        queries = normalize_rows(tf @ sparse.diags(idf)).tocsr()
+        for start in range(0, tf.shape[0], SCORE_CHUNK):
+            scores = (queries[start:start + SCORE_CHUNK] @ centroids).toarray()
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1)
+            top_ids[start:start + SCORE_CHUNK] = labels[np.take_along_axis(best, order, axis=1)]
+            top_scores[start:start + SCORE_CHUNK] = np.take_along_axis(best_scores, order, axis=1)
+        return top_ids, top_scores
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_category_index(business_category=None):
+    """This process's index for ``business_category``, refreshed if the catalog changed"""
+    with _indexes_lock:
+        index = _indexes.get(business_category)
+        if index is None:
+            index = _indexes[business_category] = CategoryIndex(business_category)
+        index.refresh()
+    return index
+
+
+# ---------------------- Suggestions for pending products -------------------
+def suggest_categories(pending_products, k=None):
+    """
+    Top-k MasterCategory suggestions for each pending product, scored in batch against the
+    catalog of its merchant's business category (select_related('merchant__profile')).
+    Returns {pending id: [{"category_id", "category", "score"}, ...]}.
+    """
+    k = k or getattr(settings, 'CATEGORY_SUGGESTIONS_TOP_K', 3)
+    groups = {}
+    for pending in pending_products:
+        profile = getattr(pending.merchant, 'profile', None)
+        groups.setdefault(profile.category if profile else None, []).append(pending)
+
+    suggestions, ranked = {}, []
+    for business_category, group in groups.items():
+        index = get_category_index(business_category)
+        tf = term_frequencies([p.name for p in group], [p.description for p in group])
+        category_ids, scores = index.score(tf, k)
+        ranked.append((group, category_ids, scores))
+
+    names = MasterCategory.objects.in_bulk(
+        {int(c) for _, category_ids, _ in ranked for c in category_ids.ravel()}
+    )
+    for group, category_ids, scores in ranked:
+        for pending, row_ids, row_scores in zip(group, category_ids.tolist(), scores.tolist()):
+            suggestions[pending.pk] = [
+                {'category_id': category_id, 'category': names[category_id].name, 'score': round(score, 4)}
+                for category_id, score in zip(row_ids, row_scores)
+                if score > 0 and category_id in names
+            ]
+    return suggestions
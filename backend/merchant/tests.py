@@ -1,3 +1,1280 @@
-from django.test import TestCase
+import csv
+import io
+import os
+from datetime import timedelta
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DataError
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+from rest_framework.test import APIClient
+
+from . import catalog, jobs, notifications, suggestions
+from .catalog import attach_pending_master_images, bulk_add_from_master
+from .ingestion import ImageWriterPool, MasterCatalogImporter, MasterProductRow, SheetReader, ZipImageProvider
+from .models import (
+    MasterCategory, MasterProduct, MasterProductUpload, Merchant, MerchantProfile, Notification, NotificationBroadcast,
+    NotificationCounter, PendingProduct, Product, SharedImage,
+)
+from .moderation import approve_pending_products, move_pending_images, reject_pending_products
+from .notifications import (
+    BroadcastClaimLost, issue_stream_ticket, merchant_for_stream_ticket, notifications_created, send_broadcast,
+)
+from .product_import import MerchantProductImporter, ProductRow
+from .pagination import EstimatedCountPaginator
+from .querycount import QueryCounter, assert_max_queries
+from .storage import link_file, move_file
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'catalog'},
+}
+
+
+# ---------------------- Fixtures -------------------
+@override_settings(CACHES=TEST_CACHES)
+class MerchantTestCase(TestCase):
+    """An onboarded Grocery merchant with an authenticated API client; media goes to a temporary directory"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media_root = tempfile.mkdtemp()
+        cls._media = override_settings(MEDIA_ROOT=cls._media_root)
+        cls._media.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._media.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.merchant = cls.create_merchant('merchant@example.com', '+911234567890')
+        cls.category = MasterCategory.objects.create(name='Snacks', business_category='Grocery')
+
+    @staticmethod
+    def create_merchant(email, phone, category='Grocery'):
+        merchant = Merchant.objects.create_user(email, 'Merchant', phone, 'password123')
+        MerchantProfile.objects.create(
+            merchant=merchant, business_name='Shop', category=category, address='1 Main Street',
+            city='Chennai', pincode='600001', latitude=13.08, longitude=80.27, is_onboarded=True,
+        )
+        return merchant
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()  # locmem caches outlive the rolled back rows they were built from
+        self.client = APIClient()
+        self.client.force_authenticate(self.merchant)
+
+    def create_products(self, count, **fields):
+        return Product.objects.bulk_create([
+            Product(
+                merchant=self.merchant, name=f"Product {i}", stock=10, original_price=100,
+                discount_price=90, category=self.category, **fields,
+            )
+            for i in range(count)
+        ])
+
+    def create_pending(self, name, category=True, image=True):
+        pending = PendingProduct(
+            merchant=self.merchant, name=name, description='', stock=1, original_price=10,
+            category=self.category if category else None,
+        )
+        if image:
+            pending.image.save(f"{name}.jpg", ContentFile(name.encode()), save=False)
+        pending.save()
+        return pending
+
+    def create_masters(self, count, image=True, category=None):
+        masters = []
+        for i in range(count):
+            master = MasterProduct(name=f"Master {i}", brand='Brand', category=category or self.category)
+            if image:
+                master.image.save(f"master{i}.jpg", ContentFile(f"image {i}".encode()), save=False)
+            masters.append(master)
+        return MasterProduct.objects.bulk_create(masters)
+
+
+# ---------------------- List endpoint query counts -------------------
+class ListQueryCountTests(MerchantTestCase):
+    """Listing endpoints run a fixed number of queries however many rows a page holds"""
+
+    def assertListQueries(self, url, num, add_rows):
+        add_rows(3)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        add_rows(30)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_product_list(self):
+        response = self.assertListQueries('/api/merchant/products/', 1, self.create_products)
+        self.assertEqual(len(response.data['results']), 33)
+
+    def test_product_list_with_expanded_relations(self):
+        masters = iter(self.create_masters(33, image=False))
+
+        def add_rows(count):
+            self.create_products(count)
+            Product.objects.filter(master_product=None).update(master_product=next(masters))
+
+        self.assertListQueries('/api/merchant/products/?expand=category,master_product', 1, add_rows)
+
+    def test_sparse_product_list(self):
+        response = self.assertListQueries('/api/merchant/products/?fields=id,name,stock', 1, self.create_products)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'stock'})
+
+    def test_notification_list(self):
+        products = iter(self.create_products(33))
+
+        def add_rows(count):
+            Notification.objects.bulk_create([
+                Notification(recipient=self.merchant, message='Approved', product=next(products))
+                for _ in range(count)
+            ])
+
+        self.assertListQueries('/api/merchant/notifications/', 1, add_rows)
+
+    def test_smart_add_products(self):
+        self.assertListQueries(  # category check and one keyset page
+            f'/api/merchant/smart-add/products/{self.category.pk}/', 2, lambda count: self.create_masters(count)
+        )
+
+    def test_master_products_by_category(self):
+        self.create_masters(3)
+        with self.assertNumQueries(2):  # category map and master rows, cached afterwards
+            self.client.get(f'/api/merchant/master-products/?category_id={self.category.pk}')
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/merchant/master-products/?category_id={self.category.pk}')
+        self.assertEqual(len(response.data), 3)
+
+
+# ---------------------- Streaming sheet reader -------------------
+def xlsx_file(rows, name='sheet.xlsx'):
+    workbook = Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+class SheetReaderTests(SimpleTestCase):
+    def test_xlsx_is_read_in_read_only_mode(self):
+        upload = xlsx_file([[' Name ', 'STOCK', None], ['Tea', 5, None], [None, None, None], ['Coffee', 2.0, 'x']])
+        with SheetReader(upload, {'name', 'stock'}) as reader:
+            self.assertTrue(reader._workbook.read_only)
+            self.assertEqual(reader.columns, ['name', 'stock', ''])
+            self.assertEqual(reader.estimated_rows, 3)
+            rows = list(reader)
+        self.assertEqual([row.number for row in rows], [2, 4])  # blank row 3 skipped, numbers kept
+        self.assertEqual((rows[0].values['name'], rows[1].values['stock']), ('Tea', 2.0))
+        self.assertIsNone(reader._workbook)
+
+    def test_csv_header_normalisation_and_blank_rows(self):
+        upload = ContentFile('\ufeffName, Stock \nTea,5\n,\n\nCoffee,2\n'.encode(), name='sheet.CSV')
+        with SheetReader(upload, {'name', 'stock'}) as reader:
+            self.assertEqual(reader.columns, ['name', 'stock'])
+            batches = list(reader.batches(1))
+        self.assertEqual([[row.number for row in batch] for batch in batches], [[2], [5]])
+        self.assertEqual(batches[1][0].values, {'name': 'Coffee', 'stock': '2'})
+        self.assertFalse(upload.file.closed)  # the upload's owner closes it
+
+    def test_missing_columns_and_empty_sheets_are_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'missing required columns'):
+            SheetReader(ContentFile(b'name\nTea\n', name='sheet.csv'), {'name', 'stock'})
+        with self.assertRaisesMessage(ValueError, 'sheet is empty'):
+            SheetReader(ContentFile(b'', name='sheet.csv'))
+
+
+# ---------------------- Lazy ZIP image provider -------------------
+def zip_file(members, name='images.zip'):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('photos/', '')
+        for member, data in members.items():
+            archive.writestr(member, data)
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+class ZipImageProviderTests(MerchantTestCase):
+    def stored_zip(self, upload_file):
+        upload = MasterProductUpload()
+        upload.image_zip.save(upload_file.name, upload_file, save=False)
+        return upload.image_zip
+
+    def test_members_are_looked_up_by_name(self):
+        field_file = self.stored_zip(zip_file({'tea.jpg': b'tea', 'photos/coffee.jpg': b'coffee' * 100}))
+        with ZipImageProvider(field_file) as images:
+            self.assertEqual(len(images), 2)  # directories are not members
+            self.assertIn('photos/coffee.jpg', images)
+            self.assertNotIn('coffee.jpg', images)
+            self.assertIsNone(images.open('missing.jpg'))
+            image = images.open('photos/coffee.jpg')
+            self.assertEqual((image.name, image.size), ('photos/coffee.jpg', 600))
+            self.assertEqual(image.read(), b'coffee' * 100)
+        self.assertTrue(field_file.closed)
+
+    def test_invalid_archive_closes_the_file(self):
+        field_file = self.stored_zip(ContentFile(b'not a zip', name='images.zip'))
+        with self.assertRaises(zipfile.BadZipFile):
+            ZipImageProvider(field_file)
+        self.assertTrue(field_file.closed)
+
+
+# ---------------------- Master catalog import -------------------
+class MasterCatalogImportTests(MerchantTestCase):
+    def row(self, number, name, category='Snacks', business_category='Grocery', brand=''):
+        return MasterProductRow(number, name, brand, '', category, business_category, 'missing.jpg')
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        stats = MasterCatalogImporter().run([[
+            self.row(2, 'Chips'),
+            self.row(3, 'x' * 201),
+            self.row(4, ''),
+            self.row(5, 'Soap', business_category='Hardware'),
+            self.row(6, 'Nuts', category='c' * 101),
+        ]])
+        self.assertEqual((stats.created, stats.invalid), (1, 4))
+        invalid = {error['row']: error['error'] for error in stats.errors if error['issue'] == 'invalid'}
+        self.assertEqual(sorted(invalid), [3, 4, 5, 6])
+        self.assertIn('name: Ensure this value has at most 200 characters', invalid[3])
+        self.assertIn('category:', invalid[6])
+        self.assertEqual(list(MasterProduct.objects.values_list('name', flat=True)), ['Chips'])
+
+    def test_duplicates_within_and_across_uploads(self):
+        MasterCatalogImporter().run([[self.row(2, 'Chips', brand='Lays')]])
+        stats = MasterCatalogImporter().run([[
+            self.row(2, 'Chips', brand='Lays'),
+            self.row(3, 'Chips', brand='Bingo'),
+            self.row(4, 'Chips', brand='Bingo'),
+        ]])
+        self.assertEqual((stats.created, stats.duplicates), (1, 2))
+        self.assertEqual(MasterProduct.objects.count(), 2)
+
+    def test_refused_batch_is_retried_row_by_row(self):
+        save = MasterProduct.save
+
+        def failing_save(product, *args, **kwargs):
+            if product.name == 'Bad':
+                raise DataError('value too long')
+            return save(product, *args, **kwargs)
+
+        with mock.patch('django.db.models.query.QuerySet.bulk_create', side_effect=DataError('batch refused')), \
+                mock.patch.object(MasterProduct, 'save', failing_save):
+            stats = MasterCatalogImporter().run([[self.row(2, 'Good'), self.row(3, 'Bad'), self.row(4, 'Fine')]])
+        self.assertEqual((stats.created, stats.failed), (2, 1))
+        self.assertEqual(sorted(MasterProduct.objects.values_list('name', flat=True)), ['Fine', 'Good'])
+
+    def test_import_keeps_no_statements(self):
+        with QueryCounter() as queries:
+            MasterCatalogImporter().run([[self.row(2, 'Chips'), self.row(3, 'Nuts')]])
+        self.assertGreater(queries.count, 0)
+        self.assertEqual(queries.statements, [])
+
+
+class QueryCounterTests(MerchantTestCase):
+    def test_statements_are_capped(self):
+        with QueryCounter(keep_statements=2) as queries:
+            for _ in range(5):
+                Product.objects.exists()
+        self.assertEqual((queries.count, len(queries.statements)), (5, 2))
+
+    def test_assert_max_queries(self):
+        with assert_max_queries(1):
+            Product.objects.exists()
+        with self.assertRaisesMessage(AssertionError, '2 queries executed, at most 1 expected'):
+            with assert_max_queries(1):
+                Product.objects.exists()
+                Product.objects.exists()
+
+
+# ---------------------- Master upload queue -------------------
+class MasterUploadQueueTests(MerchantTestCase):
+    def create_upload(self, rows, images):
+        upload = MasterProductUpload()
+        header = ['name', 'category', 'business_category', 'image_name']
+        upload.excel_file.save('catalog.xlsx', xlsx_file([header, *rows]), save=False)
+        upload.image_zip.save('images.zip', zip_file(images), save=False)
+        upload.save()
+        return upload
+
+    def test_claims_oldest_queued_and_reclaims_abandoned_uploads(self):
+        first, second = (self.create_upload([], {}) for _ in range(2))
+        self.assertEqual(jobs.enqueue_uploads(MasterProductUpload.objects.all()), 2)
+        self.assertEqual(jobs.claim_next_upload(), first)
+        self.assertEqual(jobs.claim_next_upload(), second)
+        self.assertIsNone(jobs.claim_next_upload())
+        self.assertEqual(jobs.enqueue_uploads(MasterProductUpload.objects.all()), 0)  # both still running
+
+        stale = timezone.now() - timedelta(seconds=901)
+        MasterProductUpload.objects.filter(pk=first.pk).update(heartbeat_at=stale, rows_done=40)
+        reclaimed = jobs.claim_next_upload()
+        self.assertEqual((reclaimed, reclaimed.status, reclaimed.rows_done), (first, 'processing', 0))
+        self.assertIsNone(jobs.claim_next_upload())
+
+    def test_processing_completes_with_a_report(self):
+        upload = self.create_upload(
+            [['Chips', 'Snacks', 'Grocery', 'chips.jpg'], ['Soap', 'Snacks', 'Hardware', 'soap.jpg']],
+            {'chips.jpg': b'chips'},
+        )
+        jobs.enqueue_uploads(MasterProductUpload.objects.all())
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = jobs.process_upload(jobs.claim_next_upload())
+        upload.refresh_from_db()
+        self.assertEqual((upload.status, upload.rows_done, upload.rows_failed), ('completed', 2, 1))
+        self.assertEqual(upload.error_report[0]['row'], 3)
+        self.assertEqual(stats.created, 1)
+        self.assertTrue(MasterProduct.objects.get(name='Chips').image)
+
+    def test_failed_run_keeps_its_report(self):
+        upload = self.create_upload(
+            [['Chips', 'Snacks', 'Grocery', 'chips.jpg'], ['Soap', 'Snacks', 'Hardware', 'soap.jpg']],
+            {'chips.jpg': b'chips'},
+        )
+        batches = jobs.iter_master_product_batches
+
+        def crashing_batches(reader, batch_size):
+            yield from batches(reader, batch_size)
+            raise OSError('worker lost its disk')
+
+        jobs.enqueue_uploads(MasterProductUpload.objects.all())
+        with mock.patch('merchant.jobs.iter_master_product_batches', crashing_batches), \
+                self.assertLogs('merchant.jobs', 'ERROR'):
+            self.assertIsNone(jobs.process_upload(jobs.claim_next_upload()))
+        upload.refresh_from_db()
+        self.assertEqual((upload.status, upload.last_error), ('failed', 'worker lost its disk'))
+        self.assertEqual((upload.rows_done, upload.rows_failed, len(upload.error_report)), (2, 1, 1))
+
+    def test_rerun_attaches_images_a_crashed_run_never_wrote(self):
+        MasterProduct.objects.create(name='Chips', category=self.category)  # row written, image lost
+        self.create_upload([['Chips', 'Snacks', 'Grocery', 'chips.jpg']], {'chips.jpg': b'chips'})
+        jobs.enqueue_uploads(MasterProductUpload.objects.all())
+        stats = jobs.process_upload(jobs.claim_next_upload())
+        self.assertEqual((stats.created, stats.duplicates), (0, 1))
+        self.assertTrue(MasterProduct.objects.get(name='Chips').image)
+
+
+# ---------------------- Image writer pool -------------------
+class ImageWriterPoolTests(MerchantTestCase):
+    field = MasterProduct._meta.get_field('image')
+
+    def test_writes_and_failures_are_collected(self):
+        def broken():
+            raise OSError('truncated member')
+
+        with ImageWriterPool(self.field, workers=2) as pool:
+            pool.submit(MasterProduct(pk=1), 'tea.jpg', lambda: ContentFile(b'tea'), context='row 2')
+            pool.submit(MasterProduct(pk=2), 'bad.jpg', broken, context='row 3')
+        saved, failed = pool.drain()
+        self.assertEqual([pk for pk, _ in saved], [1])
+        self.assertTrue(saved[0][1].startswith('master_product_images/tea'))
+        self.assertEqual([(context, str(error)) for context, error in failed], [('row 3', 'truncated member')])
+        self.assertEqual(pool.drain(), ([], []))  # drained results are forgotten
+
+    def test_submit_blocks_while_max_pending_writes_are_in_flight(self):
+        release = threading.Event()
+
+        def slow_image():
+            release.wait(5)
+            return ContentFile(b'slow')
+
+        with ImageWriterPool(self.field, workers=1, max_pending=1) as pool:
+            pool.submit(MasterProduct(pk=1), 'one.jpg', slow_image)
+            second = threading.Thread(target=pool.submit, args=(MasterProduct(pk=2), 'two.jpg', slow_image))
+            second.start()
+            second.join(0.2)
+            self.assertTrue(second.is_alive())  # waiting for a free slot
+            release.set()
+            second.join(5)
+            self.assertFalse(second.is_alive())
+        self.assertEqual(len(pool.drain()[0]), 2)
+
+
+# ---------------------- Shared image reference counting -------------------
+class SharedImageTests(MerchantTestCase):
+    def test_identical_images_share_one_file(self):
+        masters = self.create_masters(2)
+        masters[1].image.save('copy.jpg', ContentFile(b'image 0'), save=True)  # same bytes as the first master
+        products = bulk_add_from_master(self.merchant, masters * 2)
+        shared = SharedImage.objects.get()
+        self.assertEqual(shared.ref_count, 4)
+        self.assertEqual({p.image.name for p in products}, {shared.name})
+
+    def test_last_release_deletes_the_file(self):
+        products = bulk_add_from_master(self.merchant, self.create_masters(1) * 2)
+        shared = SharedImage.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            products[0].delete()
+        shared.refresh_from_db()
+        self.assertEqual(shared.ref_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            products[1].delete()
+        self.assertFalse(SharedImage.objects.exists())
+        self.assertFalse(default_storage.exists(shared.name))
+
+    def test_clearing_an_image_releases_it_after_the_save(self):
+        product = bulk_add_from_master(self.merchant, self.create_masters(1))[0]
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(f'/api/merchant/products/{product.pk}/', {'image': None}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(SharedImage.objects.get().ref_count, 1)  # still held until commit
+        for callback in callbacks:
+            callback()
+        self.assertFalse(SharedImage.objects.exists())
+
+    def test_unreadable_master_image_is_skipped(self):
+        masters = self.create_masters(2)
+        default_storage.delete(masters[0].image.name)
+        with self.assertLogs('merchant.storage', 'WARNING'):
+            products = bulk_add_from_master(self.merchant, masters)
+        self.assertFalse(products[0].image)
+        self.assertEqual(products[1].image.name, SharedImage.objects.get().name)
+        self.assertEqual(MasterProduct.objects.get(pk=masters[0].pk).image_digest, '')
+
+
+# ---------------------- Deferred master images -------------------
+class PendingMasterImageTests(MerchantTestCase):
+    def test_restart_resumes_pending_images(self):
+        # The after-commit worker never runs here, as if the process died before it
+        products = bulk_add_from_master(self.merchant, self.create_masters(3), defer_images=True)
+        self.assertTrue(all(p.image_pending for p in products))
+        out = io.StringIO()
+        call_command('resume_product_images', '--batch-size', '2', stdout=out)
+        self.assertIn('Attached master images to 3 product(s)', out.getvalue())
+        self.assertFalse(Product.objects.filter(image_pending=True).exists())
+        self.assertFalse(Product.objects.filter(image='').exists())
+        self.assertEqual(SharedImage.objects.count(), 3)
+
+    def test_failing_product_does_not_hold_back_its_batch(self):
+        products = bulk_add_from_master(self.merchant, self.create_masters(3), defer_images=True)
+        real = catalog.attach_master_images
+
+        def attach(batch):
+            if any(p.pk == products[1].pk for p in batch):
+                raise DataError('bad row')
+            return real(batch)
+
+        with mock.patch.object(catalog, 'attach_master_images', side_effect=attach), \
+                self.assertLogs('merchant.catalog', 'WARNING'):
+            self.assertEqual(attach_pending_master_images(), 2)
+        self.assertFalse(Product.objects.filter(image_pending=True).exists())
+        self.assertEqual(Product.objects.filter(image='').get().pk, products[1].pk)
+
+    def test_missing_master_file_clears_its_flag(self):
+        masters = self.create_masters(2)
+        default_storage.delete(masters[0].image.name)
+        products = bulk_add_from_master(self.merchant, masters, defer_images=True)
+        with self.assertLogs('merchant.storage', 'WARNING'):
+            self.assertEqual(attach_pending_master_images(), 2)
+        self.assertFalse(Product.objects.filter(image_pending=True).exists())
+        self.assertTrue(Product.objects.get(pk=products[1].pk).image)
+
+
+# ---------------------- Catalog cache invalidation -------------------
+class CatalogCacheTests(MerchantTestCase):
+    def master_names(self, category):
+        response = self.client.get('/api/merchant/master-products/', {'category_id': category.pk})
+        self.assertEqual(response.status_code, 200)
+        return sorted(item['name'] for item in response.data)
+
+    def test_master_write_is_served_once_committed(self):
+        self.create_masters(2)
+        self.assertEqual(self.master_names(self.category), ['Master 0', 'Master 1'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            MasterProduct.objects.create(name='Master 2', brand='Brand', category=self.category)
+        # Not committed yet, so readers keep the old version
+        self.assertEqual(self.master_names(self.category), ['Master 0', 'Master 1'])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.master_names(self.category), ['Master 0', 'Master 1', 'Master 2'])
+
+    def test_moving_a_master_invalidates_both_business_categories(self):
+        phones = MasterCategory.objects.create(name='Phones', business_category='Mobile')
+        master = MasterProduct.objects.create(name='Charger', brand='Brand', category=self.category)
+        self.assertEqual(self.master_names(self.category), ['Charger'])
+        self.assertEqual(self.master_names(phones), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            master.category = phones
+            master.save()
+        self.assertEqual(self.master_names(self.category), [])
+        self.assertEqual(self.master_names(phones), ['Charger'])
+
+    def test_category_rename_invalidates_its_catalog(self):
+        url = '/api/merchant/master-categories/'
+        self.assertEqual([c['name'] for c in self.client.get(url, {'business_category': 'grocery'}).data], ['Snacks'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Chips'
+            self.category.save()
+        self.assertEqual([c['name'] for c in self.client.get(url, {'business_category': 'grocery'}).data], ['Chips'])
+
+    def test_catalog_import_invalidates_after_commit(self):
+        self.assertEqual(self.master_names(self.category), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            MasterCatalogImporter().run([[MasterProductRow(2, 'Imported', 'Brand', '', 'Snacks', 'Grocery', '')]])
+        self.assertEqual(self.master_names(self.category), ['Imported'])
+
+
+# ---------------------- Product list pagination and sparse fields -------------------
+class ProductListTests(MerchantTestCase):
+    def test_cursor_pages_cover_every_product_once(self):
+        created = self.create_products(5)
+        seen, url = [], '/api/merchant/products/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(p.pk for p in created))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_insert_between_pages_shifts_nothing(self):
+        created = self.create_products(4)
+        response = self.client.get('/api/merchant/products/?page_size=2')
+        seen = [row['id'] for row in response.data['results']]
+        self.create_products(1)  # newest first, so it sorts before the pages already read
+        seen += [row['id'] for row in self.client.get(response.data['next']).data['results']]
+        self.assertEqual(sorted(seen), sorted(p.pk for p in created))
+
+    def test_sparse_fields_and_expansion(self):
+        self.create_products(1)
+        row = self.client.get('/api/merchant/products/?fields=id,category').data['results'][0]
+        self.assertEqual(row['category'], self.category.pk)
+        row = self.client.get('/api/merchant/products/?fields=id,category&expand=category').data['results'][0]
+        self.assertEqual(row['category']['name'], 'Snacks')
+
+    def test_values_rows_render_like_the_serializer(self):
+        self.create_products(2)
+        names = ['id', 'name', 'stock', 'original_price', 'image', 'created_at']
+        full = self.client.get('/api/merchant/products/').data['results']
+        sparse = self.client.get(f"/api/merchant/products/?fields={','.join(names)}").data['results']
+        self.assertEqual(sparse, [{name: row[name] for name in names} for row in full])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/merchant/products/?fields=id,password')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/merchant/products/?expand=merchant')
+        self.assertEqual(response.status_code, 400)
+
+
+# ---------------------- Bulk stock and price updates -------------------
+class BulkUpdateTests(MerchantTestCase):
+    url = '/api/merchant/products/bulk-update/'
+
+    def test_each_entry_gets_its_own_result(self):
+        first, second, third = self.create_products(3)
+        foreign = Product.objects.create(
+            merchant=self.create_merchant('other@example.com', '+919876543210'), name='Theirs', stock=1,
+            original_price=10, discount_price=5,
+        )
+        response = self.client.post(self.url, {'items': [
+            {'id': first.pk, 'stock': 25, 'original_price': '120.00'},
+            {'id': second.pk, 'stock': -1, 'discount_price': 'abc'},
+            {'id': third.pk, 'discount_price': '150'},
+            {'id': foreign.pk, 'stock': 3},
+            {'id': first.pk, 'stock': 1},
+            {'stock': 4},
+            'not an object',
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['status'], response.data['updated_count']), ('partial', 1))
+        results = response.data['results']
+        self.assertEqual(results[0], {'id': first.pk, 'status': 'updated'})
+        self.assertEqual(sorted(results[1]['errors']), ['discount_price', 'stock'])
+        self.assertEqual(results[2]['errors'], {'discount_price': ['Must be ≤ original price']})
+        self.assertEqual(results[3]['errors'], {'id': ['Product not found.']})
+        self.assertIn('more than once', str(results[4]['errors']['id']))
+        self.assertIn('id', results[5]['errors'])
+        self.assertIn('non_field_errors', results[6]['errors'])
+
+        first.refresh_from_db()
+        self.assertEqual((first.stock, str(first.original_price)), (25, '120.00'))
+        self.assertEqual(Product.objects.get(pk=second.pk).stock, 10)
+        self.assertEqual(Product.objects.get(pk=foreign.pk).stock, 1)
+
+    def test_entry_without_changes_is_an_error(self):
+        product = self.create_products(1)[0]
+        response = self.client.post(self.url, {'items': [{'id': product.pk}]}, format='json')
+        self.assertIn('non_field_errors', response.data['results'][0]['errors'])
+
+    @override_settings(PRODUCT_BULK_UPDATE_MAX_ITEMS=2)
+    def test_oversized_and_empty_requests_are_refused(self):
+        items = [{'id': i, 'stock': 1} for i in range(1, 4)]
+        self.assertEqual(self.client.post(self.url, {'items': items}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'items': []}, format='json').status_code, 400)
+
+
+# ---------------------- Stock deltas -------------------
+class StockDeltaTests(MerchantTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product, self.other = self.create_products(2)
+
+    def adjust(self, pk, delta):
+        return self.client.post(f'/api/merchant/products/{pk}/adjust-stock/', {'delta': delta}, format='json')
+
+    def test_adjust_stock(self):
+        self.assertEqual(self.adjust(self.product.pk, -4).data, {'id': self.product.pk, 'stock': 6})
+        self.assertEqual(self.adjust(self.product.pk, -7).status_code, 409)
+        self.assertEqual(self.adjust(self.product.pk, 'x').status_code, 400)
+        self.assertEqual(self.adjust(self.product.pk, 2.9).status_code, 400)
+        self.assertEqual(self.adjust(self.product.pk, True).status_code, 400)
+        self.assertEqual(self.adjust(self.product.pk, None).status_code, 400)
+        self.assertEqual(self.adjust(self.product.pk, '-1').data['stock'], 5)
+        self.assertEqual(self.adjust('abc', 1).status_code, 404)
+        self.assertEqual(self.adjust(999999, 1).status_code, 404)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+    def test_apply_sales_coalesces_and_refuses_only_short_products(self):
+        response = self.client.post('/api/merchant/products/apply-sales/', {'sales': [
+            {'id': self.product.pk, 'quantity': 6}, {'id': self.product.pk, 'quantity': 3},
+            {'id': self.other.pk, 'quantity': 11}, {'id': 999999, 'quantity': 1},
+        ]}, format='json')
+        results = {row['id']: row for row in response.data['results']}
+        self.assertEqual(results[self.product.pk]['quantity'], 9)
+        self.assertEqual(results[self.product.pk]['stock'], 1)
+        self.assertEqual(results[self.other.pk]['status'], 'insufficient_stock')
+        self.assertEqual(results[999999]['status'], 'not_found')
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.stock, 10)
+
+    def test_apply_sales_refuses_fractional_quantities(self):
+        response = self.client.post('/api/merchant/products/apply-sales/', {'sales': [
+            {'id': self.product.pk, 'quantity': 1.5},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+
+
+# ---------------------- Inventory export -------------------
+class ExportTests(MerchantTestCase):
+    url = '/api/merchant/products/export/'
+
+    def setUp(self):
+        super().setUp()
+        self.create_products(2)
+        Product.objects.create(
+            merchant=self.merchant, name='=HYPERLINK("http://evil")', description='+cmd', stock=1,
+            original_price=10, discount_price=5,
+        )
+        Product.objects.create(
+            merchant=self.create_merchant('other@example.com', '+919876543210'), name='Theirs', stock=1,
+            original_price=10, discount_price=5,
+        )
+
+    def test_csv_streams_the_merchant_inventory(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="products-', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][:3], ['id', 'name', 'description'])
+        self.assertEqual([row[1] for row in rows[1:]], ['Product 0', 'Product 1', '\'=HYPERLINK("http://evil")'])
+        self.assertEqual(rows[3][2], "'+cmd")
+        self.assertEqual(rows[1][3], 'Snacks')
+
+    def test_xlsx_escapes_formulas(self):
+        response = self.client.get(self.url, {'type': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+        sheet = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[3][1:3], ('\'=HYPERLINK("http://evil")', "'+cmd"))
+        self.assertEqual(rows[1][5], 10)
+
+    def test_unknown_type_is_refused(self):
+        self.assertEqual(self.client.get(self.url, {'type': 'pdf'}).status_code, 400)
+
+
+# ---------------------- Bulk imports -------------------
+class MasterCatalogImportTests(MerchantTestCase):
+    def row(self, number, name, category='Snacks', business_category='Grocery', brand=''):
+        return MasterProductRow(number, name, brand, '', category, business_category, 'missing.jpg')
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        stats = MasterCatalogImporter().run([[
+            self.row(2, 'Chips'),
+            self.row(3, 'x' * 201),
+            self.row(4, ''),
+            self.row(5, 'Soap', business_category='Hardware'),
+            self.row(6, 'Nuts', category='c' * 101),
+        ]])
+        self.assertEqual((stats.created, stats.invalid), (1, 4))
+        invalid = {error['row']: error['error'] for error in stats.errors if error['issue'] == 'invalid'}
+        self.assertEqual(sorted(invalid), [3, 4, 5, 6])
+        self.assertIn('name: Ensure this value has at most 200 characters', invalid[3])
+        self.assertIn('category:', invalid[6])
+        self.assertEqual(list(MasterProduct.objects.values_list('name', flat=True)), ['Chips'])
+
+    def test_duplicates_within_and_across_uploads(self):
+        MasterCatalogImporter().run([[self.row(2, 'Chips', brand='Lays')]])
+        stats = MasterCatalogImporter().run([[
+            self.row(2, 'Chips', brand='Lays'),
+            self.row(3, 'Chips', brand='Bingo'),
+            self.row(4, 'Chips', brand='Bingo'),
+        ]])
+        self.assertEqual((stats.created, stats.duplicates), (1, 2))
+        self.assertEqual(MasterProduct.objects.count(), 2)
+
+    def test_refused_batch_is_retried_row_by_row(self):
+        save = MasterProduct.save
+
+        def failing_save(product, *args, **kwargs):
+            if product.name == 'Bad':
+                raise DataError('value too long')
+            return save(product, *args, **kwargs)
+
+        with mock.patch('django.db.models.query.QuerySet.bulk_create', side_effect=DataError('batch refused')), \
+                mock.patch.object(MasterProduct, 'save', failing_save):
+            stats = MasterCatalogImporter().run([[self.row(2, 'Good'), self.row(3, 'Bad'), self.row(4, 'Fine')]])
+        self.assertEqual((stats.created, stats.failed), (2, 1))
+        self.assertEqual(sorted(MasterProduct.objects.values_list('name', flat=True)), ['Fine', 'Good'])
+
+
+class MerchantProductImportTests(MerchantTestCase):
+    def row(self, number, name, category='', stock='5', price='100', discount=''):
+        return ProductRow(number, name, '', '', category, stock, price, discount)
+
+    def import_rows(self, *rows):
+        return MerchantProductImporter(self.merchant, 'Grocery').run([list(rows)])
+
+    def test_rows_are_created_updated_and_validated(self):
+        existing = self.create_products(1)[0]
+        stats = self.import_rows(
+            self.row(2, existing.name, stock='7'),
+            self.row(3, 'Tea', category='snacks'),
+            self.row(4, 'Coffee', price='abc'),
+            self.row(5, 'Milk', price='10', discount='20'),
+        )
+        self.assertEqual((stats.created, stats.updated, stats.invalid), (1, 1, 2))
+        existing.refresh_from_db()
+        self.assertEqual(existing.stock, 7)
+        self.assertEqual(Product.objects.get(name='Tea').category, self.category)
+
+    def test_repeated_rows_are_duplicates(self):
+        stats = self.import_rows(self.row(2, 'Tea'), self.row(3, 'tea'))
+        self.assertEqual((stats.created, stats.duplicates), (1, 1))
+
+    def test_categories_of_other_business_categories_are_rejected(self):
+        MasterCategory.objects.create(name='Tablets', business_category='Pharmacy')
+        stats = self.import_rows(self.row(2, 'Aspirin', category='Tablets'), self.row(3, 'Gum', category='Unknown'))
+        self.assertEqual((stats.created, stats.invalid), (0, 2))
+        self.assertEqual(MasterCategory.objects.count(), 2)  # nothing was created on the fly
+
+    def test_upload_reports_truncated_errors(self):
+        sheet = "name,stock,original_price,discount_price\n" + "Bad,1,-1,\n" * 3
+        with mock.patch('merchant.ingestion.MAX_REPORTED_ERRORS', 2):
+            response = self.client.post(
+                '/api/merchant/products/upload/',
+                {'file': ContentFile(sheet.encode(), name='products.csv')}, format='multipart',
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['failed_count'], len(response.data['errors'])), (3, 2))
+        self.assertEqual(response.data['errors_truncated'], 1)
+
+    def test_values_longer_than_the_columns_are_invalid(self):
+        stats = self.import_rows(self.row(2, 'x' * 256), self.row(3, 'Tea'), self.row(4, 'x' * 256))
+        self.assertEqual((stats.created, stats.invalid, stats.duplicates), (1, 2, 0))
+        self.assertIn('name: Ensure this value has at most 255 characters', stats.errors[0]['error'])
+
+    def test_refused_batch_is_retried_row_by_row(self):
+        existing = self.create_products(1)[0]
+        save = Product.save
+
+        def failing_save(product, *args, **kwargs):
+            if product.name == 'Bad':
+                raise DataError('value too long')
+            return save(product, *args, **kwargs)
+
+        with mock.patch('django.db.models.query.QuerySet.bulk_create', side_effect=DataError('batch refused')), \
+                mock.patch.object(Product, 'save', failing_save), self.assertLogs('merchant.product_import', 'WARNING'):
+            stats = self.import_rows(self.row(2, 'Good'), self.row(3, 'Bad'), self.row(4, existing.name, stock='3'))
+        self.assertEqual((stats.created, stats.updated, stats.failed), (1, 1, 1))
+        self.assertEqual([error['row'] for error in stats.errors], [3])
+        self.assertEqual(Product.objects.get(pk=existing.pk).stock, 3)
+        self.assertFalse(Product.objects.filter(name='Bad').exists())
+
+
+# ---------------------- Unread notification counters -------------------
+class UnreadCounterTests(MerchantTestCase):
+    def unread(self):
+        return self.client.get('/api/merchant/notifications/unread_count/').data['unread_count']
+
+    def test_counter_follows_every_write(self):
+        first, second, third = [Notification.objects.create(recipient=self.merchant, message=f"n{i}") for i in range(3)]
+        notifications_created(Notification.objects.bulk_create([Notification(recipient=self.merchant, message='bulk')]))
+        self.assertEqual(self.unread(), 4)
+
+        self.client.post(f'/api/merchant/notifications/{first.pk}/mark_as_read/')
+        self.client.post(f'/api/merchant/notifications/{first.pk}/mark_as_read/')  # already read, no change
+        self.assertEqual(self.unread(), 3)
+        second.is_read = True
+        second.save()
+        self.assertEqual(self.unread(), 2)
+        third.delete()
+        first.refresh_from_db()
+        first.delete()  # read, so not counted
+        self.assertEqual(self.unread(), 1)
+        self.client.post('/api/merchant/notifications/mark_all_as_read/')
+        self.assertEqual(self.unread(), 0)
+
+    def test_other_merchants_are_not_counted(self):
+        other = self.create_merchant('other@example.com', '+919876543210')
+        Notification.objects.create(recipient=other, message='theirs')
+        self.assertEqual(self.unread(), 0)
+
+    def test_repair_command_recomputes_drifted_counters(self):
+        Notification.objects.bulk_create([Notification(recipient=self.merchant, message=f"n{i}") for i in range(2)])
+        self.assertEqual(self.unread(), 0)  # bulk_create without notifications_created is not counted
+        out = io.StringIO()
+        call_command('repair_unread_counts', '--email', self.merchant.email, stdout=out)
+        self.assertIn('Recomputed 1 unread counter(s)', out.getvalue())
+        self.assertEqual(self.unread(), 2)
+
+    def test_missing_counter_is_created_from_a_count(self):
+        Notification.objects.create(recipient=self.merchant, message='n')
+        NotificationCounter.objects.filter(merchant=self.merchant).delete()
+        self.assertEqual(self.unread(), 1)
+        self.assertEqual(NotificationCounter.objects.get(merchant=self.merchant).unread, 1)
+
+
+# ---------------------- Live notification stream -------------------
+class NotificationStreamTests(MerchantTestCase):
+    stream_url = '/api/merchant/notifications/stream/'
+
+    def test_disabled_stream_is_not_offered(self):
+        self.assertEqual(self.client.post('/api/merchant/notifications/stream-ticket/').status_code, 404)
+        with mock.patch.object(notifications, 'get_broker') as get_broker, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Notification.objects.create(recipient=self.merchant, message='n')
+        self.assertEqual((callbacks, get_broker.call_count), ([], 0))
+
+    @override_settings(NOTIFICATION_STREAM_ENABLED=True)
+    def test_new_notifications_are_published_after_commit(self):
+        with mock.patch.object(notifications, 'get_broker') as get_broker:
+            with self.captureOnCommitCallbacks(execute=True):
+                notification = Notification.objects.create(recipient=self.merchant, message='n')
+                get_broker.assert_not_called()
+        channel, data = get_broker.return_value.publish.call_args.args
+        self.assertEqual(data['id'], notification.pk)
+
+    @override_settings(NOTIFICATION_STREAM_ENABLED=True, NOTIFICATION_STREAM_TICKET_MAX_AGE=30)
+    def test_ticket_is_signed_and_expires(self):
+        response = self.client.post('/api/merchant/notifications/stream-ticket/')
+        self.assertEqual((response.status_code, response.data['expires_in']), (200, 30))
+        ticket = response.data['ticket']
+        self.assertEqual(merchant_for_stream_ticket(ticket), self.merchant)
+        self.assertIsNone(merchant_for_stream_ticket(ticket + 'x'))
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 31):
+            self.assertIsNone(merchant_for_stream_ticket(ticket))
+        Merchant.objects.filter(pk=self.merchant.pk).update(is_active=False)
+        self.assertIsNone(merchant_for_stream_ticket(ticket))
+
+    @override_settings(NOTIFICATION_STREAM_ENABLED=True)
+    def test_stream_is_refused_under_wsgi(self):
+        ticket = issue_stream_ticket(self.merchant)
+        self.assertEqual(self.client.get(self.stream_url, {'ticket': ticket}).status_code, 404)
+
+    @override_settings(NOTIFICATION_STREAM_ENABLED=True)
+    async def test_stream_needs_a_valid_ticket(self):
+        client = AsyncClient()
+        self.assertEqual((await client.get(self.stream_url, {'ticket': 'junk'})).status_code, 401)
+        response = await client.get(self.stream_url, {'ticket': issue_stream_ticket(self.merchant)})
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'text/event-stream'))
+        events = response.streaming_content
+        try:
+            self.assertTrue((await anext(events)).startswith(b'retry: '))
+            self.assertIn(b'event: unread_count', await anext(events))
+        finally:
+            await events.aclose()
+
+
+# ---------------------- Broadcasts -------------------
+@override_settings(BROADCAST_CHUNK_SIZE=2)
+class BroadcastTests(MerchantTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(4):
+            cls.create_merchant(f"grocer{i}@example.com", f"+91100000000{i}")
+        cls.create_merchant('fashion@example.com', '+912000000000', category='Fashion')
+
+    def broadcast(self):
+        return NotificationBroadcast.objects.create(message='Hello', business_category='Grocery')
+
+    def assert_each_grocer_notified_once(self):
+        recipients = list(Notification.objects.values_list('recipient__email', flat=True))
+        self.assertEqual(len(recipients), 5)
+        self.assertEqual(len(set(recipients)), 5)
+        self.assertNotIn('fashion@example.com', recipients)
+
+    def test_fan_out_is_written_in_chunks(self):
+        broadcast = self.broadcast()
+        with mock.patch.object(notifications, '_send_chunk', wraps=notifications._send_chunk) as send_chunk:
+            self.assertEqual(send_broadcast(broadcast), 5)
+        self.assertEqual([len(c.args[2]) for c in send_chunk.call_args_list], [2, 2, 1])
+        self.assert_each_grocer_notified_once()
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent_count), ('sent', 5))
+        self.assertEqual(NotificationCounter.objects.get(merchant=self.merchant).unread, 1)
+        self.assertEqual(send_broadcast(broadcast), 5)  # already sent
+        self.assertEqual(Notification.objects.count(), 5)
+
+    def test_failed_run_resumes_after_the_last_chunk(self):
+        broadcast = self.broadcast()
+        real = notifications._send_chunk
+        calls = []
+
+        def failing_second_chunk(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise DataError('connection lost')
+            return real(*args)
+
+        with mock.patch.object(notifications, '_send_chunk', failing_second_chunk), \
+                self.assertLogs('merchant.notifications', 'ERROR'):
+            self.assertEqual(send_broadcast(broadcast), 2)
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent_count), ('failed', 2))
+        self.assertEqual(send_broadcast(broadcast), 5)
+        self.assert_each_grocer_notified_once()
+
+    def test_reclaimed_broadcast_resumes_from_the_keyset(self):
+        broadcast = self.broadcast()
+        real = notifications._send_chunk
+        calls = []
+
+        def reclaimed_before_second_chunk(broadcasts, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                # The sender went quiet for too long and another worker claimed the broadcast
+                NotificationBroadcast.objects.filter(pk=broadcast.pk).update(started_at=timezone.now())
+            return real(broadcasts, *args)
+
+        with mock.patch.object(notifications, '_send_chunk', reclaimed_before_second_chunk), \
+                self.assertLogs('merchant.notifications', 'WARNING'):
+            self.assertEqual(send_broadcast(broadcast), 2)
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent_count), ('sending', 2))
+
+        stale = timezone.now() - timedelta(seconds=301)
+        NotificationBroadcast.objects.filter(pk=broadcast.pk).update(heartbeat_at=stale)
+        self.assertEqual(send_broadcast(broadcast), 5)
+        self.assert_each_grocer_notified_once()
+
+    def test_lost_claim_writes_nothing(self):
+        with self.assertRaises(BroadcastClaimLost):
+            notifications._send_chunk(NotificationBroadcast.objects.none(), 'Hello', [self.merchant.pk], 0)
+        self.assertFalse(Notification.objects.exists())
+
+
+# ---------------------- Pending product moderation -------------------
+class ModerationTests(MerchantTestCase):
+    def test_approve_outcomes(self):
+        ready, uncategorized = self.create_pending('ready'), self.create_pending('uncategorized', category=False)
+        with self.captureOnCommitCallbacks():
+            results = approve_pending_products([
+                {'id': ready.pk}, {'id': uncategorized.pk}, {'id': ready.pk}, {'id': 999999}, {'id': 'x'},
+            ])
+        self.assertEqual([r['status'] for r in results], ['approved', 'error', 'error', 'error', 'error'])
+        self.assertEqual(results[2]['error'], 'Listed more than once')
+        product = Product.objects.get(pk=results[0]['product_id'])
+        self.assertEqual((product.category, product.discount_price), (self.category, 10))
+        self.assertEqual(product.pending_image, ready.image.name)
+        self.assertEqual(list(PendingProduct.objects.all()), [uncategorized])
+        self.assertEqual(Notification.objects.filter(recipient=self.merchant, product=product).count(), 1)
+
+    def test_approved_images_are_moved_and_recorded_until_then(self):
+        pending = self.create_pending('tea')
+        with self.captureOnCommitCallbacks():
+            product_id = approve_pending_products([{'id': pending.pk}])[0]['product_id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(move_pending_images([product_id]), 1)
+        product = Product.objects.get(pk=product_id)
+        self.assertEqual(product.pending_image, '')
+        self.assertTrue(default_storage.exists(product.image.name))
+        self.assertFalse(default_storage.exists(pending.image.name))
+        self.assertEqual(move_pending_images([product_id]), 0)  # nothing left to do
+
+    def test_reject_outcomes(self):
+        pending = self.create_pending('tea')
+        with self.captureOnCommitCallbacks(execute=True):
+            results = reject_pending_products([{'id': pending.pk, 'admin_notes': 'Blurry'}, {'id': pending.pk}])
+        self.assertEqual([r['status'] for r in results], ['rejected', 'error'])
+        self.assertFalse(PendingProduct.objects.exists())
+        self.assertIn('Blurry', Notification.objects.get(recipient=self.merchant).message)
+
+    def approved(self, name):
+        pending = self.create_pending(name)
+        with self.captureOnCommitCallbacks():
+            product_id = approve_pending_products([{'id': pending.pk}])[0]['product_id']
+        return pending.image.name, product_id
+
+    def test_crash_before_commit_keeps_the_pending_image(self):
+        source, product_id = self.approved('tea')
+        links = []
+
+        def link(*args):
+            links.append(link_file(*args))
+            return links[-1]
+
+        with mock.patch('merchant.ingestion.link_file', link), \
+                mock.patch.object(Product.objects, 'bulk_update', side_effect=RuntimeError('worker killed')), \
+                self.assertRaises(RuntimeError):
+            move_pending_images([product_id])
+        product = Product.objects.get(pk=product_id)
+        self.assertEqual((product.pending_image, product.image.name or ''), (source, ''))
+        self.assertTrue(default_storage.exists(source))
+        self.assertEqual(len(links), 1)
+        self.assertFalse(default_storage.exists(links[0]))  # the unrecorded link is dropped
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(move_pending_images([product_id]), 1)
+        product.refresh_from_db()
+        self.assertEqual(default_storage.open(product.image.name).read(), b'tea')
+
+    def test_crash_after_commit_loses_nothing(self):
+        source, product_id = self.approved('tea')
+        with self.captureOnCommitCallbacks():  # the process dies before deleting the pending file
+            self.assertEqual(move_pending_images([product_id]), 1)
+        product = Product.objects.get(pk=product_id)
+        self.assertEqual(product.pending_image, '')
+        self.assertEqual(default_storage.open(product.image.name).read(), b'tea')
+        self.assertTrue(default_storage.exists(source))  # left behind, never lost
+        self.assertEqual(move_pending_images([product_id]), 0)
+
+    def test_missing_pending_file_stops_retrying(self):
+        source, product_id = self.approved('tea')
+        default_storage.delete(source)
+        with self.assertLogs('merchant', 'ERROR'):
+            self.assertEqual(move_pending_images([product_id]), 0)
+        self.assertEqual(Product.objects.get(pk=product_id).pending_image, '')
+
+
+# ---------------------- Pending product admin actions -------------------
+class PendingProductAdminTests(MerchantTestCase):
+    url = '/admin/merchant/pendingproduct/'
+
+    def setUp(self):
+        super().setUp()
+        admin = Merchant.objects.create_superuser('admin@example.com', 'Admin', '+910000000000', 'password123')
+        self.client.force_login(admin)
+
+    def run_action(self, action, pending):
+        with self.captureOnCommitCallbacks():
+            response = self.client.post(
+                self.url, {'action': action, '_selected_action': [p.pk for p in pending]}, follow=True,
+            )
+        self.assertEqual(response.status_code, 200)
+        return [str(message) for message in response.context['messages']]
+
+    @override_settings(PENDING_PRODUCT_BULK_MAX_ITEMS=2)
+    def test_approve_selected_products(self):
+        pending = [self.create_pending(f"p{i}") for i in range(3)] + [self.create_pending('bare', category=False)]
+        with mock.patch('merchant.admin.approve_pending_products', wraps=approve_pending_products) as approve:
+            messages = self.run_action('approve_selected_products', pending)
+        self.assertEqual([len(c.args[0]) for c in approve.call_args_list], [2, 2])
+        self.assertEqual(messages, [
+            'Successfully approved 3 product(s).',
+            '1 product(s) skipped: A valid category must be selected for approval',
+        ])
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['p0', 'p1', 'p2'])
+        self.assertEqual(list(PendingProduct.objects.values_list('name', flat=True)), ['bare'])
+        self.assertEqual(Notification.objects.filter(recipient=self.merchant).count(), 3)
+
+    def test_reject_selected_products(self):
+        pending = [self.create_pending('tea'), self.create_pending('coffee')]
+        messages = self.run_action('reject_selected_products', pending)
+        self.assertEqual(messages, ['Successfully rejected 2 product(s).'])
+        self.assertFalse(PendingProduct.objects.exists())
+        self.assertIn('contact support', Notification.objects.filter(recipient=self.merchant).first().message)
+
+    def test_nothing_left_to_moderate(self):
+        pending = self.create_pending('tea')
+        PendingProduct.objects.filter(pk=pending.pk).update(is_approved=True)
+        self.assertEqual(self.run_action('approve_selected_products', [pending]), ['No products were approved.'])
+
+
+# ---------------------- Moving stored files -------------------
+class MoveFileTests(MerchantTestCase):
+    def test_move_by_link(self):
+        source = default_storage.save('moves/source.txt', ContentFile(b'data'))
+        target = move_file(source, 'moves/target.txt')
+        self.assertFalse(default_storage.exists(source))
+        with default_storage.open(target) as f:
+            self.assertEqual(f.read(), b'data')
+
+    def test_falls_back_to_a_copy_when_linking_fails(self):
+        source = default_storage.save('moves/source.txt', ContentFile(b'data'))
+        with mock.patch('os.link', side_effect=OSError(18, 'Invalid cross-device link')):
+            target = move_file(source, 'moves/target.txt')
+        self.assertFalse(default_storage.exists(source))
+        self.assertTrue(default_storage.exists(target))
+
+    def test_missing_source_is_not_copied(self):
+        with mock.patch.object(default_storage, 'open') as open_file, self.assertRaises(FileNotFoundError):
+            move_file('moves/missing.txt', 'moves/target.txt')
+        open_file.assert_not_called()
+
+    def test_taken_target_gets_another_name(self):
+        default_storage.save('moves/target.txt', ContentFile(b'old'))
+        source = default_storage.save('moves/source.txt', ContentFile(b'new'))
+        target = move_file(source, 'moves/target.txt')
+        self.assertNotEqual(target, 'moves/target.txt')
+        self.assertEqual(os.path.dirname(target), 'moves')
+
+    def test_link_keeps_the_source(self):
+        source = default_storage.save('moves/source.txt', ContentFile(b'data'))
+        target = link_file(source, 'moves/target.txt')
+        self.assertTrue(default_storage.exists(source))
+        with default_storage.open(target) as f:
+            self.assertEqual(f.read(), b'data')
+
+
+# ---------------------- Single product approval -------------------
+class SingleApprovalTests(MerchantTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = Merchant.objects.create_superuser('admin@example.com', 'Admin', '+910000000000', 'password123')
+        self.pending = self.create_pending('tea', category=False)
+        PendingProduct.objects.filter(pk=self.pending.pk).update(discount_price=9)
+        self.source = self.pending.image.name
+
+    def assert_move_deferred(self, callbacks):
+        product = Product.objects.get(name='tea')
+        self.assertEqual((product.pending_image, product.image.name or ''), (self.source, ''))
+        self.assertTrue(default_storage.exists(self.source))
+        self.assertEqual(len(callbacks), 1)  # the move
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(move_pending_images([product.pk]), 1)
+        product.refresh_from_db()
+        self.assertEqual(default_storage.open(product.image.name).read(), b'tea')
+        self.assertFalse(default_storage.exists(self.source))
+
+    def test_api_approval_moves_the_image_after_commit(self):
+        self.client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                f'/api/merchant/admin/pending-products/{self.pending.pk}/approve/', {'category_id': self.category.pk},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assert_move_deferred(callbacks)
+
+    def test_admin_approval_moves_the_image_after_commit(self):
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(f'/admin/merchant/pendingproduct/{self.pending.pk}/change/', {
+                'name': 'tea', 'merchant': self.merchant.pk, 'description': '', 'stock': 1, 'original_price': 10,
+                'discount_price': 9, 'is_approved': 'on', 'category': self.category.pk, 'admin_notes': '',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assert_move_deferred(callbacks)
+
+
+# ---------------------- Admin changelist pagination -------------------
+@override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+class EstimatedCountPaginatorTests(MerchantTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_products(3)
+
+    def count(self, queryset, reltuples):
+        """Paginator count with a PostgreSQL connection reporting ``reltuples`` for the table"""
+        connection = mock.MagicMock(vendor='postgresql')
+        connection.ops.quote_name.side_effect = lambda name: f'"{name}"'
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (reltuples,)
+        with mock.patch('merchant.pagination.connections', {queryset.db: connection}):
+            return EstimatedCountPaginator(queryset, 10).count, cursor
+
+    def test_large_unfiltered_table_uses_the_estimate(self):
+        count, cursor = self.count(Product.objects.all(), 250000.0)
+        self.assertEqual(count, 250000)
+        self.assertEqual(cursor.execute.call_args.args[1], ['"merchant_product"'])
+
+    def test_filtered_listing_is_counted_exactly(self):
+        count, cursor = self.count(Product.objects.filter(stock__gt=0), 250000.0)
+        self.assertEqual(count, 3)
+        cursor.execute.assert_not_called()
+
+    def test_small_or_unanalyzed_table_is_counted_exactly(self):
+        self.assertEqual(self.count(Product.objects.all(), 999.0)[0], 3)
+        self.assertEqual(self.count(Product.objects.all(), -1.0)[0], 3)
+
+    def test_other_databases_are_counted_exactly(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(EstimatedCountPaginator(Product.objects.all(), 10).count, 3)
+
+    def test_changelist_renders(self):
+        self.client.force_login(
+            Merchant.objects.create_superuser('admin@example.com', 'Admin', '+910000000000', 'password123')
+        )
+        response = self.client.get('/admin/merchant/notification/', {'q': 'x'})
+        self.assertEqual(response.status_code, 200)
+
+
+# ---------------------- Category suggestions -------------------
+class CategorySuggestionTests(MerchantTestCase):
+    def setUp(self):
+        super().setUp()
+        suggestions._indexes.clear()
+
+    def test_closest_category_ranks_first(self):
+        drinks = MasterCategory.objects.create(name='Drinks', business_category='Grocery')
+        MasterProduct.objects.bulk_create(
+            [MasterProduct(name=f"Potato chips salted {i}", category=self.category) for i in range(3)]
+            + [MasterProduct(name=f"Orange juice bottle {i}", category=drinks) for i in range(3)]
+        )
+        chips, juice = (
+            PendingProduct.objects.create(merchant=self.merchant, name=name, stock=1, original_price=10)
+            for name in ('Masala potato chips', 'Fresh orange juice')
+        )
+
+        ranked = suggestions.suggest_categories(PendingProduct.objects.select_related('merchant__profile'), k=2)
+        self.assertEqual(ranked[chips.pk][0]['category'], 'Snacks')
+        self.assertEqual(ranked[juice.pk][0]['category_id'], drinks.pk)
+        scores = [s['score'] for s in ranked[chips.pk] + ranked[juice.pk]]
+        self.assertTrue(all(0 < score <= 1 for score in scores))
+
+    def test_index_follows_catalog_writes(self):
+        MasterProduct.objects.create(name='Potato chips salted', category=self.category)
+        pending = PendingProduct.objects.create(
+            merchant=self.merchant, name='Lemon soap bar', stock=1, original_price=10,
+        )
+        queue = PendingProduct.objects.select_related('merchant__profile')
+        self.assertEqual(suggestions.suggest_categories(queue, k=1)[pending.pk], [])  # nothing alike yet
+        with self.captureOnCommitCallbacks(execute=True):
+            soaps = MasterCategory.objects.create(name='Soaps', business_category='Grocery')
+            MasterProduct.objects.create(name='Lemon soap bar', category=soaps)
+        self.assertEqual(suggestions.suggest_categories(queue, k=1)[pending.pk][0]['category_id'], soaps.pk)
+
+    def test_suggestion_endpoint(self):
+        MasterProduct.objects.create(name='Potato chips salted', category=self.category)
+        pending = PendingProduct.objects.create(merchant=self.merchant, name='Potato chips', stock=1, original_price=10)
+        self.client.force_authenticate(
+            Merchant.objects.create_superuser('admin@example.com', 'Admin', '+910000000000', 'password123')
+        )
+        url = '/api/merchant/admin/pending-products/suggest-categories/'
+        response = self.client.get(url, {'ids': str(pending.pk), 'k': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['suggestions'][0]['category'], 'Snacks')
+        self.assertEqual(self.client.get(url, {'k': 50}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'ids': 'x'}).status_code, 400)
 
-# Create your tests here.
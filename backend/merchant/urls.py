@@ -15,8 +15,9 @@ from .views import (
     MasterProductByCategory,
     MerchantProfileView,
     
-    # Excel Upload Views (to be implemented if not yet)
-    # ProductUploadView,           # Excel Upload - Merchant Products
+    # Excel Upload Views
+    ProductUploadView,           # Excel Upload - Merchant Products
+    ProductUploadErrorReportView,
     MasterProductUploadView,     # Excel Upload - Admin Master Products (optional)
 
     # Profile Image Upload
@@ -27,6 +28,8 @@ from .views import (
      # NEW: Pending Products & Notifications
     PendingProductViewSet, # For admin to manage pending products
     NotificationViewSet, # Changed from NotificationAPIView to NotificationViewSettions
+    NotificationBroadcastViewSet,  # Admin broadcasts to many merchants
+    notification_stream,  # Server-sent events (ASGI)
 )
 
 # DRF Router setup for ViewSets
@@ -35,6 +38,7 @@ router.register(r'products', ProductViewSet, basename='product')
 router.register(r'merchant-profile', MerchantProfileViewSet, basename='merchant-profile')
 router.register(r'admin/pending-products', PendingProductViewSet, basename='pending-product') # NEW for admin
 router.register(r'notifications', NotificationViewSet, basename='notification') # NEW: Register NotificationViewSet
+router.register(r'admin/notification-broadcasts', NotificationBroadcastViewSet, basename='notification-broadcast')
 
 
 urlpatterns = [
@@ -45,11 +49,9 @@ urlpatterns = [
     path('profile/', MerchantProfileView.as_view(), name='merchant-profile'), 
     path('onboarding-status/', MerchantOnboardingStatusView.as_view(), name='onboarding-status'),
 
-    # Profile images (upload, update, get) via ViewSet action
-    path('', include(router.urls)),
-
     # Excel Uploads (SmartAdd)
-    # path('products/upload/', ProductUploadView.as_view(), name='product-upload'),  # From Excel file
+    path('products/upload/', ProductUploadView.as_view(), name='product-upload'),  # From Excel file
+    path('products/upload/<int:pk>/errors/', ProductUploadErrorReportView.as_view(), name='product-upload-errors'),
     path('master-products/upload/', MasterProductUploadView.as_view(), name='master-product-upload'),  # Admin only (optional)
 
     # MasterProduct and Category utilities
@@ -60,4 +62,11 @@ urlpatterns = [
     path('smart-add/products/<int:category_id>/', SmartAddProductsView.as_view(), name='smart-add-products'),
     path('smart-add/bulk-add/', SmartAddBulkAddView.as_view(), name='smart-add-bulk'),
 
+    # Live notifications, before the router so 'stream' is not taken for a notification id
+    path('notifications/stream/', notification_stream, name='notification-stream'),
+
+    # Profile images (upload, update, get) via ViewSet action
+    # Router last, so 'products/<pk>/' does not shadow fixed paths such as 'products/create/'
+    path('', include(router.urls)),
+
 ]
\ No newline at end of file
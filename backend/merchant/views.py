@@ -1,16 +1,23 @@
-from rest_framework import generics, status, permissions, viewsets, filters, parsers
+from rest_framework import generics, mixins, status, permissions, viewsets, filters, parsers, serializers
 from rest_framework.decorators import api_view, permission_classes, action 
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.db import transaction
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.db.models import Exists, OuterRef
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import AllowAny, IsAuthenticated , IsAdminUser
 from django.contrib.auth import authenticate
 from django.core.files.base import ContentFile
 # import pandas as pd
-from django.core.exceptions import ValidationError
+from rest_framework.exceptions import ValidationError
 from .models import (Merchant, MerchantProfile, Product, MasterCategory, MasterProduct , SmartAddSelection, 
-            PendingProduct, Notification )
+            PendingProduct, Notification, NotificationBroadcast, ProductUpload )
 from .serializers import (
 MerchantProfileImageSerializer,
 MerchantProfileSerializer,
@@ -19,6 +26,7 @@ MerchantSerializer,
 MerchantDetailsSerializer,
 MerchantLoginSerializer,
 ProductSerializer,
+ProductValuesSerializer,
 MasterProductSerializer,
 ProductCreateFromMasterSerializer,
 MasterCategorySerializer,
@@ -27,8 +35,27 @@ SmartAddProductSerializer,
 BulkSmartAddSerializer,
 PendingProductSerializer, # Added new serializer
 AdminPendingProductApproveSerializer, # Added new serializer
-NotificationSerializer # Added new serializer
+NotificationSerializer, # Added new serializer
+NotificationBroadcastSerializer,
 )
+from .catalog import bulk_add_from_master
+from .ingestion import SheetReader
+from .product_import import PRODUCT_COLUMNS, MerchantProductImporter, iter_product_batches
+from .exports import astream_csv, export_rows, stream_csv, write_xlsx
+from .inventory import (
+    InsufficientStock, adjust_stock, apply_stock_deltas, bulk_update_products, coalesce_deltas
+)
+from .catalog_cache import cached_catalog, category_business_categories, normalize_business_category
+from .jobs import run_after_commit
+from .moderation import approve_pending_products, move_pending_images, reject_pending_products
+from .notifications import (
+    get_unread_count, issue_stream_ticket, mark_read, merchant_for_stream_ticket, notification_events,
+    send_broadcast_by_id,
+)
+from .pagination import NotificationCursorPagination, ProductCursorPagination, SmartAddProductPagination
+from .querysets import select_related_for
+from .suggestions import suggest_categories
+import csv
 import logging
 
 logger = logging.getLogger(__name__)
@@ -157,59 +184,111 @@ class CurrentMerchantView(APIView):
         serializer = MerchantSerializer(request.user)
         return Response(serializer.data)
 
-# class ProductUploadView(APIView):
-#     parser_classes = [parsers.MultiPartParser]
-#     permission_classes = [permissions.IsAuthenticated]
-
-#     def post(self, request):
-#         excel_file = request.FILES.get('file')
-#         if not excel_file:
-#             return Response({'error': 'No file uploaded'}, status=400)
-
-#         try:
-#             df = pd.read_excel(excel_file)
-#         except Exception as e:
-#             return Response({'error': f'Invalid Excel file: {str(e)}'}, status=400)
-
-#         created_products = []
-
-#         for _, row in df.iterrows():
-#             category_name = row.get('category', '').strip()
-#             category, _ = Category.objects.get_or_create(name=category_name)
-
-#             product = Product.objects.create(
-#                 merchant=request.user,
-#                 name=row.get('name', ''),
-#                 stock=row.get('stock', 0),
-#                 original_price=row.get('original_price', 0),
-#                 discount_price=row.get('discount_price', 0),
-#                 category=category
-#             )
-#             created_products.append(product.id)
-
-#         return Response({
-#             'status': 'success',
-#             'created_count': len(created_products),
-#             'product_ids': created_products
-#         }, status=201)
+class ProductUploadView(APIView):
+    """Import (create or update) the merchant's inventory from an .xlsx / .csv spreadsheet"""
+    parser_classes = [parsers.MultiPartParser]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        excel_file = request.FILES.get('file')
+        if not excel_file:
+            return Response({'error': 'No file uploaded'}, status=400)
+
+        try:
+            business_category = request.user.profile.category
+        except MerchantProfile.DoesNotExist:
+            return Response({"error": "Complete business onboarding first"}, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = MerchantProductImporter(request.user, business_category)
+        try:
+            with SheetReader(excel_file, PRODUCT_COLUMNS) as reader:
+                stats = importer.run(iter_product_batches(reader, importer.batch_size))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        upload = ProductUpload.objects.create(
+            merchant=request.user, file_name=excel_file.name[:255], finished_at=timezone.now(),
+            rows_total=stats.rows, rows_created=stats.created, rows_updated=stats.updated,
+            rows_failed=stats.rows_failed + stats.duplicates, error_report=stats.errors,
+        )
+        return Response({
+            'status': 'success' if not upload.rows_failed else 'partial',
+            'message': f"{stats.created} products added, {stats.updated} updated, {upload.rows_failed} rows skipped",
+            'upload_id': upload.id,
+            'rows': stats.rows,
+            'created_count': stats.created,
+            'updated_count': stats.updated,
+            'failed_count': upload.rows_failed,
+            'errors': stats.errors[:50],
+            'errors_truncated': stats.errors_truncated,  # beyond the report's cap, missing from the CSV too
+            'error_report_url': request.build_absolute_uri(
+                reverse('product-upload-errors', args=[upload.id])
+            ) if stats.errors else None,
+        }, status=201)
+
+
+class ProductUploadErrorReportView(APIView):
+    """Download the per-row error report of one of the merchant's spreadsheet imports as CSV"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        upload = ProductUpload.objects.filter(pk=pk, merchant=request.user).only('id', 'error_report').first()
+        if upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="product-upload-{upload.id}-errors.csv"'
+        writer = csv.DictWriter(response, fieldnames=['row', 'name', 'issue', 'error'])
+        writer.writeheader()
+        writer.writerows(upload.error_report)
+        return response
 
 class MasterProductByCategory(generics.ListAPIView):
     serializer_class = MasterProductSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_category_id(self):
+        category_id = self.kwargs.get('category_id') or self.request.query_params.get('category_id')
+        try:
+            return int(category_id)
+        except (TypeError, ValueError):
+            return None
+
     def get_queryset(self):
-        return MasterProduct.objects.filter(category_id=self.kwargs['category_id']).select_related('category')
+        return MasterProduct.objects.filter(category_id=self.get_category_id()).select_related('category')
+
+    def list(self, request, *args, **kwargs):
+        # Served from the versioned catalog cache of the category's business category
+        category_id = self.get_category_id()
+        business_category = category_business_categories().get(category_id)
+        if business_category is None:
+            return Response([])
+        data = cached_catalog(
+            business_category, f"master-products:{category_id}:{request.scheme}://{request.get_host()}",
+            lambda: list(self.get_serializer(self.get_queryset(), many=True).data),
+        )
+        return Response(data)
 
 class MasterCategoryList(generics.ListAPIView):
     serializer_class = MasterCategorySerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        business_category = self.request.query_params.get('business_category')
+        business_category = normalize_business_category(self.request.query_params.get('business_category'))
         if business_category:
-            return MasterCategory.objects.filter(business_category__iexact=business_category)
+            return MasterCategory.objects.filter(business_category=business_category)
         return MasterCategory.objects.none()
 
+    def list(self, request, *args, **kwargs):
+        business_category = normalize_business_category(request.query_params.get('business_category'))
+        if not business_category:
+            return Response([])
+        data = cached_catalog(
+            business_category, 'master-categories',
+            lambda: list(self.get_serializer(self.get_queryset(), many=True).data),
+        )
+        return Response(data)
+
 class MasterProductListBySubcategory(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -235,58 +314,28 @@ class ProductCreateFromMasterView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        added_products = []
-        for mp_id in master_ids:
-            try:
-                mp = MasterProduct.objects.get(id=mp_id)
-                # Verify category matches merchant's business
-                if mp.category.business_category != business_category:
-                    continue
-            except MasterProduct.DoesNotExist:
-                continue
-
-            # Create or get existing product
-            product, created = Product.objects.get_or_create(
-                merchant=request.user,
-                master_product=mp,
-                defaults={
-                    'name': mp.name,
-                    'description': mp.description or "",  # Ensure description is copied
-                    'category': mp.category,
-                    'stock': 0,
-                    'original_price': 0,
-                    'discount_price': 0
-                }
-            )
-            
-            if created:
-                added_products.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'category': product.category.name
-                })
-                
-                # Copy image if exists - UPDATED METHOD
-                if mp.image:
-                    try:
-                        # Create new file instance
-                        from django.core.files.base import ContentFile
-                        from io import BytesIO
-                        
-                        # Read original image
-                        img_data = mp.image.read()
-                        
-                        # Create new file with same content but different path
-                        product.image.save(
-                            mp.image.name,
-                            ContentFile(img_data),
-                            save=True
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to copy image for product {mp.id}: {str(e)}")
-                        # Continue without image if copy fails
-                        product.save()
+        try:
+            master_ids = list(dict.fromkeys(int(mp_id) for mp_id in master_ids))
+        except (TypeError, ValueError):
+            return Response({"error": "Product IDs must be integers"}, status=400)
+
+        # One query for the requested master products (with categories), one for what the merchant already has
+        masters = MasterProduct.objects.select_related('category').in_bulk(master_ids)
+        eligible = [
+            masters[mp_id] for mp_id in master_ids
+            if mp_id in masters and masters[mp_id].category
+            and masters[mp_id].category.business_category == business_category  # Verify category matches merchant's business
+        ]
+        existing = set(Product.objects.filter(
+            merchant=request.user, master_product_id__in=[mp.id for mp in eligible]
+        ).values_list('master_product_id', flat=True))
+
+        created = bulk_add_from_master(request.user, [mp for mp in eligible if mp.id not in existing])
 
+        added_products = [
+            {'id': product.id, 'name': product.name, 'category': product.category.name}
+            for product in created
+        ]
         return Response({
             "status": "success",
             "added_count": len(added_products),
@@ -298,9 +347,54 @@ class ProductViewSet(viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [parsers.MultiPartParser, parsers.FormParser , parsers.JSONParser] # Allow file uploads
+    pagination_class = ProductCursorPagination
 
     def get_queryset(self):
-        return Product.objects.filter(merchant=self.request.user).order_by('-created_at')
+        # Join every relation the serializer renders instead of lazily fetching them per row
+        queryset = Product.objects.filter(merchant=self.request.user).order_by('-created_at', 'id')
+        return select_related_for(self.get_serializer(), queryset)
+
+    def sparse_fieldset(self):
+        """(fields, expand) requested with ?fields= / ?expand= on reads, None when not requested"""
+        if self.action not in ('list', 'retrieve'):
+            return None, None
+        fields, expand = (
+            [name.strip() for name in value.split(',') if name.strip()] if value is not None else None
+            for value in (self.request.query_params.get('fields'), self.request.query_params.get('expand'))
+        )
+        if fields is None and expand is None:
+            return None, None
+        readable = [name for name, field in ProductSerializer().fields.items() if not field.write_only]
+        unknown = [name for name in fields or [] if name not in readable]
+        if unknown:
+            raise ValidationError({'fields': f"Unknown field(s): {', '.join(unknown)}"})
+        unknown = [name for name in expand or [] if name not in ProductSerializer.expandable_fields]
+        if unknown:
+            raise ValidationError({'expand': f"Cannot expand: {', '.join(unknown)}"})
+        # A sparse request renders relations as ids unless they are expanded explicitly
+        return fields, expand or []
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.sparse_fieldset()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        if expand is not None:
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        fields, expand = self.sparse_fieldset()
+        if not ProductValuesSerializer.supports(fields, expand):
+            return super().list(request, *args, **kwargs)
+
+        # Flat fieldsets are rendered straight from .values() rows, no model instances are built
+        serializer = ProductValuesSerializer(fields, context=self.get_serializer_context())
+        columns = dict.fromkeys([*serializer.value_columns, 'created_at', 'id'])  # cursor needs the ordering
+        rows = self.filter_queryset(self.get_queryset()).values(*columns)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.many(page))
+        return Response(serializer.many(rows))
 
     def create(self, request, *args, **kwargs):
         # Differentiate between adding from master product and adding a new, unapproved product
@@ -327,6 +421,90 @@ class ProductViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_202_ACCEPTED) # 202 Accepted as it's not yet fully created
 
 
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update(self, request):
+        """Batch stock/price update: {"items": [{"id", "stock"?, "original_price"?, "discount_price"?}, ...]}"""
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({"error": "Provide a non-empty list of items"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = bulk_update_products(request.user, items)
+        updated = sum(1 for result in results if result['status'] == 'updated')
+        return Response({
+            "status": "success" if updated == len(results) else "partial",
+            "updated_count": updated,
+            "failed_count": len(results) - updated,
+            "results": results,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], url_path='adjust-stock')
+    def adjust_stock(self, request, pk=None):
+        """Atomically add {"delta": n} to the stock (negative to decrement, never below zero)"""
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            # IntegerField refuses 2.9 and true instead of truncating them like int() would
+            delta = serializers.IntegerField().run_validation(request.data.get('delta'))
+        except serializers.ValidationError:
+            return Response({"error": "delta must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            stock = adjust_stock(request.user, pk, delta)
+        except Product.DoesNotExist:
+            return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        except InsufficientStock as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({"id": pk, "stock": stock}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='apply-sales')
+    def apply_sales(self, request):
+        """Batched sales: {"sales": [{"id", "quantity"}, ...]}, repeated ids are summed into one delta"""
+        sales = request.data.get('sales') if isinstance(request.data, dict) else request.data
+        if not isinstance(sales, list) or not sales:
+            return Response({"error": "Provide a non-empty list of sales"}, status=status.HTTP_400_BAD_REQUEST)
+        integer = serializers.IntegerField()
+        try:
+            # A sale removes stock, a negative quantity (a return) puts it back
+            deltas = coalesce_deltas(
+                (integer.run_validation(sale['id']), -integer.run_validation(sale['quantity'])) for sale in sales
+            )
+        except (KeyError, TypeError, serializers.ValidationError):
+            return Response({"error": "Each sale needs an integer id and quantity"}, status=status.HTTP_400_BAD_REQUEST)
+
+        outcome, stock = apply_stock_deltas(request.user, deltas)
+        applied = sum(1 for result in outcome.values() if result == 'applied')
+        return Response({
+            "status": "success" if applied == len(outcome) else "partial",
+            "applied_count": applied,
+            "failed_count": len(outcome) - applied,
+            "results": [
+                {"id": pk, "quantity": -delta, "status": outcome[pk], "stock": stock.get(pk)}
+                for pk, delta in deltas.items()
+            ],
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the whole inventory as ?type=csv (default) or ?type=xlsx"""
+        file_type = request.query_params.get('type', 'csv').lower()
+        if file_type not in ('csv', 'xlsx'):
+            return Response({"error": "type must be csv or xlsx"}, status=status.HTTP_400_BAD_REQUEST)
+
+        filename = f"products-{timezone.localdate():%Y%m%d}.{file_type}"
+        rows = export_rows(request.user, request)
+        if file_type == 'csv':
+            lines = astream_csv(rows) if isinstance(request._request, ASGIRequest) else stream_csv(rows)
+            response = StreamingHttpResponse(lines, content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+        # A workbook is a zip, it can only be sent once it is complete: spool it to disk, not memory
+        return FileResponse(
+            write_xlsx(rows), as_attachment=True, filename=filename,
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+
 # class AdminProductViewSet(viewsets.ReadOnlyModelViewSet):
 #     serializer_class = ProductSerializer
 #     permission_classes = [permissions.IsAdminUser]
@@ -391,11 +569,13 @@ class SmartAddCategoriesView(APIView):
     def get(self, request):
         try:
             business_category = request.user.profile.category
-            categories = MasterCategory.objects.filter(
-                business_category=business_category
+            data = cached_catalog(
+                business_category, 'smart-add-categories',
+                lambda: list(SmartAddCategorySerializer(
+                    MasterCategory.objects.filter(business_category=business_category), many=True
+                ).data),
             )
-            serializer = SmartAddCategorySerializer(categories, many=True)
-            return Response(serializer.data)
+            return Response(data)
         except AttributeError:
             return Response(
                 {"error": "Complete business onboarding first"},
@@ -419,14 +599,19 @@ class SmartAddProductsView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Get products not already added by merchant
-        products = MasterProduct.objects.filter(
-            category=category
-        ).exclude(
-            smartaddselection__merchant=request.user
-        )
-        serializer = SmartAddProductSerializer(products, many=True, context={'request': request})
-        return Response(serializer.data)
+        # Get products not already added by merchant, as a NOT EXISTS anti-join on the
+        # (merchant, master_product) unique index of SmartAddSelection
+        already_added = SmartAddSelection.objects.filter(merchant=request.user, master_product=OuterRef('pk'))
+        products = MasterProduct.objects.filter(category=category).filter(~Exists(already_added))
+
+        query = request.query_params.get('q', '').strip()
+        if query:
+            products = products.filter(name__icontains=query)
+
+        paginator = SmartAddProductPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = SmartAddProductSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
 class SmartAddBulkAddView(APIView):
     permission_classes = [IsAuthenticated]
@@ -447,43 +632,12 @@ class SmartAddBulkAddView(APIView):
             category=category
         ).select_related('category')
 
-        # Create SmartAddSelection records
-        selections = [
+        # Create SmartAddSelection and Product records in bulk, images are attached after commit
+        SmartAddSelection.objects.bulk_create([
             SmartAddSelection(merchant=merchant, master_product=mp)
             for mp in master_products
-        ]
-        SmartAddSelection.objects.bulk_create(selections)
-
-        # Create Product records one by one to handle images properly
-        created_products = []
-        for mp in master_products:
-            product = Product(
-                merchant=merchant,
-                master_product=mp,
-                name=mp.name,
-                description=mp.description or '',
-                category=mp.category,
-                stock=0,
-                original_price=0,
-                discount_price=0
-            )
-            product.save()  # Save first to get an ID
-            
-            # Copy image if exists
-            if mp.image:
-                try:
-                    # Create new file name to avoid conflicts
-                    new_filename = f"merchant_{merchant.id}_product_{product.id}_{mp.image.name.split('/')[-1]}"
-                    product.image.save(
-                        new_filename,
-                        ContentFile(mp.image.read()),
-                        save=True
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to copy image for product {product.id}: {str(e)}")
-                    # Continue even if image fails to copy
-            
-            created_products.append(product)
+        ])
+        created_products = bulk_add_from_master(merchant, master_products, defer_images=True)
 
         return Response({
             "status": "success",
@@ -607,28 +761,16 @@ class PendingProductViewSet(viewsets.ModelViewSet):
                     original_price=pending_product.original_price,
                     discount_price=pending_product.discount_price,
                     category=pending_product.category,
+                    pending_image=pending_product.image.name if pending_product.image else '',
                 )
                 logger.info(f"New Product instance created. ID: {product.id}, Name: {product.name}")
             except Exception as e:
                 logger.error(f"Failed to create actual Product instance for pending product {pk}: {str(e)}")
                 raise # Re-raise to trigger transaction rollback if product creation failed
 
-            # Copy image from pending product to new product
-            if pending_product.image:
-                try:
-                    with pending_product.image.open('rb') as f:
-                        product.image.save(
-                            os.path.basename(pending_product.image.name),
-                            ContentFile(f.read()),
-                            save=True
-                        )
-                    logger.info(f"Image successfully copied for product {product.id}.")
-                    # After successful copy, delete the image from pending_products storage
-                    pending_product.image.delete(save=False)
-                    logger.info(f"Pending product image deleted for {pending_product.id}.")
-                except Exception as e:
-                    logger.error(f"Failed to copy or delete image from pending product {pending_product.id} to approved product {product.id}: {str(e)}")
-                    # Continue even if image copy fails, but log the error
+            # Move image from pending product to new product, off the request once this commits
+            if product.pending_image:
+                run_after_commit(move_pending_images, [product.pk])
             else:
                 logger.info(f"No image found for pending product {pending_product.id} to copy.")
 
@@ -707,31 +849,130 @@ class PendingProductViewSet(viewsets.ModelViewSet):
             logger.exception(f"An unexpected error occurred during rejection process for pending product {pk}: {str(e)}")
             return Response({"detail": f"An unexpected error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def _bulk_moderate(self, request, moderate, done):
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({"error": "Provide a non-empty list of items"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = moderate(items)
+        succeeded = sum(1 for result in results if result['status'] == done)
+        return Response({
+            "status": "success" if succeeded == len(results) else "partial",
+            f"{done}_count": succeeded,
+            "failed_count": len(results) - succeeded,
+            "results": results,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='suggest-categories')
+    def category_suggestions(self, request):
+        """Top-k category suggestions for the queue, or for ?ids=1,2,3 (?k= overrides the default)"""
+        pending = self.get_queryset().select_related('merchant__profile')
+        try:
+            if request.query_params.get('ids'):
+                pending = pending.filter(pk__in=[int(pk) for pk in request.query_params['ids'].split(',')])
+            k = int(request.query_params['k']) if request.query_params.get('k') else None
+        except ValueError:
+            return Response({"error": "ids and k must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if k is not None and not 1 <= k <= 20:
+            return Response({"error": "k must be between 1 and 20"}, status=status.HTTP_400_BAD_REQUEST)
+
+        pending = list(pending.only('id', 'name', 'description', 'merchant__profile__category'))
+        suggestions = suggest_categories(pending, k)
+        return Response({
+            "results": [{"id": p.id, "name": p.name, "suggestions": suggestions[p.id]} for p in pending],
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk-approve', parser_classes=[parsers.JSONParser])
+    def bulk_approve(self, request):
+        """Approve many: {"items": [{"id", "category_id"?, "admin_notes"?}, ...]}"""
+        return self._bulk_moderate(request, approve_pending_products, 'approved')
+
+    @action(detail=False, methods=['post'], url_path='bulk-reject', parser_classes=[parsers.JSONParser])
+    def bulk_reject(self, request):
+        """Reject many: {"items": [{"id", "admin_notes"?}, ...]}"""
+        return self._bulk_moderate(request, reject_pending_products, 'rejected')
+
 
 class NotificationViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
-        notifications = Notification.objects.filter(recipient=request.user).order_by('-created_at')
-        serializer = NotificationSerializer(notifications, many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        notifications = select_related_for(
+            NotificationSerializer, Notification.objects.filter(recipient=request.user)
+        )
+        is_read = request.query_params.get('is_read')
+        if is_read is not None:
+            notifications = notifications.filter(is_read=is_read.lower() in ('1', 'true'))
+
+        paginator = NotificationCursorPagination()
+        page = paginator.paginate_queryset(notifications, request, view=self)
+        serializer = NotificationSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-        return Response({"unread_count": count}, status=status.HTTP_200_OK)
+        # Served from the maintained counter, a primary key lookup instead of a COUNT(*)
+        return Response({"unread_count": get_unread_count(request.user)}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
-        try:
-            notification = Notification.objects.get(pk=pk, recipient=request.user)
-            notification.is_read = True
-            notification.save()
-            return Response({"message": "Notification marked as read."}, status=status.HTTP_200_OK)
-        except Notification.DoesNotExist:
+        notifications = Notification.objects.filter(pk=pk, recipient=request.user)
+        if not mark_read(notifications) and not notifications.exists():
             return Response({"detail": "Notification not found or not authorized."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"message": "Notification marked as read."}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'])
     def mark_all_as_read(self, request):
-        Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+        mark_read(Notification.objects.filter(recipient=request.user))
         return Response({"message": "All notifications marked as read."}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='stream-ticket')
+    def stream_ticket(self, request):
+        """Short-lived ticket for notifications/stream/, or 404 when this deployment only supports polling"""
+        if not getattr(settings, 'NOTIFICATION_STREAM_ENABLED', False):
+            return Response({"detail": "Live notifications are not enabled on this server."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "ticket": issue_stream_ticket(request.user),
+            "expires_in": getattr(settings, 'NOTIFICATION_STREAM_TICKET_MAX_AGE', 30),
+        }, status=status.HTTP_200_OK)
+
+
+
+class NotificationBroadcastViewSet(mixins.CreateModelMixin, mixins.ListModelMixin,
+                                   mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Admin broadcasts: POST queues the fan-out in the background, GET reports its progress"""
+    queryset = NotificationBroadcast.objects.all()
+    serializer_class = NotificationBroadcastSerializer
+    permission_classes = [IsAdminUser]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        broadcast = serializer.save()
+        run_after_commit(send_broadcast_by_id, broadcast.pk)
+        logger.info(f"Broadcast {broadcast.pk} queued by {request.user.email}")
+        return Response(self.get_serializer(broadcast).data, status=status.HTTP_202_ACCEPTED)
+
+# ---------------------- Notification stream (ASGI) -------------------
+async def notification_stream(request):
+    """
+    Server-sent events pushing the merchant's new notifications, replacing unread_count polling.
+    Only served when NOTIFICATION_STREAM_ENABLED and running under ASGI: a WSGI worker would be
+    held by the endless response forever, so clients fall back to polling instead.
+    """
+    if not getattr(settings, 'NOTIFICATION_STREAM_ENABLED', False) or not isinstance(request, ASGIRequest):
+        return JsonResponse({"detail": "Live notifications are not enabled on this server."}, status=404)
+    merchant = await sync_to_async(merchant_for_stream_ticket)(request.GET.get('ticket', ''))
+    if merchant is None:
+        return JsonResponse({"detail": "Stream ticket missing, invalid or expired."}, status=401)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    response = StreamingHttpResponse(notification_events(merchant, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # keep reverse proxies from buffering the stream
+    return response
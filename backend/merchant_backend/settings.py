@@ -161,3 +161,55 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Master catalog uploads (rows read and bulk-inserted per batch)
+MASTER_UPLOAD_BATCH_SIZE = 1000
+MASTER_UPLOAD_IMAGE_WORKERS = 4  # threads writing catalog images to storage
+MASTER_UPLOAD_STALE_AFTER = 900  # seconds without progress before a 'processing' upload counts as abandoned
+BACKGROUND_WORKERS = 2  # threads running post-commit work such as attaching images to new products
+
+# Versioned master catalog cache (see merchant/catalog_cache.py). The file based backend is
+# shared by every worker process on the host; LocMemCache is only safe with a single process,
+# since invalidation would otherwise reach just the process that made the write.
+CATALOG_CACHE = 'catalog'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'catalog',
+        'TIMEOUT': 24 * 60 * 60,
+    },
+    # 'catalog': {
+    #     'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    #     'LOCATION': 'merchant-catalog',
+    # },
+}
+
+# Largest batch accepted by POST /api/merchant/products/bulk-update/
+PRODUCT_BULK_UPDATE_MAX_ITEMS = 5000
+PRODUCT_EXPORT_CHUNK_SIZE = 2000  # rows fetched per server-side cursor round trip by the inventory export
+PRODUCT_UPLOAD_BATCH_SIZE = 1000  # rows per bulk write of the merchant spreadsheet import
+PENDING_PRODUCT_BULK_MAX_ITEMS = 1000  # largest batch accepted by pending-products/bulk-approve/ and bulk-reject/
+MODERATION_IMAGE_WORKERS = 4  # threads moving approved product images out of pending storage
+CATEGORY_SUGGESTIONS_TOP_K = 3  # categories suggested per pending product by merchant.suggestions
+
+# Live notification stream (GET /api/merchant/notifications/stream/). Off by default: the endless
+# response would pin a WSGI worker (runserver, gunicorn sync workers) forever, so only enable it
+# when the app is served through merchant_backend.asgi by an ASGI server (uvicorn, daphne, ...).
+# While it is off, or the request did not come through ASGI, the dashboard keeps polling unread_count.
+NOTIFICATION_STREAM_ENABLED = False
+NOTIFICATION_STREAM_TICKET_MAX_AGE = 30  # seconds a notifications/stream-ticket/ ticket can open a stream
+# InProcessBroker pushes only the notifications created by the serving process itself. Those created
+# elsewhere (admin, upload worker, other web workers) are read from the table once per heartbeat,
+# so they arrive up to NOTIFICATION_STREAM_HEARTBEAT seconds late unless NOTIFICATION_BROKER points
+# at a cross-process implementation of merchant.events.InProcessBroker's interface.
+NOTIFICATION_BROKER = 'merchant.events.InProcessBroker'
+NOTIFICATION_STREAM_HEARTBEAT = 15  # seconds between table catch-ups and keepalive comments (also the client retry delay)
+NOTIFICATION_STREAM_MAX_QUEUED = 100  # undelivered events per connection before it is told to resync
+BROADCAST_CHUNK_SIZE = 1000  # notifications written per transaction when a broadcast fans out
+BROADCAST_STALE_AFTER = 300  # seconds without a chunk before a 'sending' broadcast may be claimed again
+
+# Admin changelists on tables with more rows than this show the planner's estimate instead of COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
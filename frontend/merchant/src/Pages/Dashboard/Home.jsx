@@ -16,6 +16,7 @@ const Home = () => {
   const [merchant, setMerchant] = useState(null);
   const [unreadNotificationCount, setUnreadNotificationCount] = useState(0);
   const [notifications, setNotifications] = useState([]);
+  const [nextNotificationsPage, setNextNotificationsPage] = useState(null);
   const [showNotificationsDropdown, setShowNotificationsDropdown] = useState(false);
   const navigate = useNavigate();
 
@@ -52,10 +53,11 @@ const Home = () => {
     }
   };
 
-  const fetchNotifications = async () => {
+  const fetchNotifications = async (pageUrl = null) => {
     try {
-      const response = await api.get('/notifications/');
-      setNotifications(response.data);
+      const response = await api.get(pageUrl || '/notifications/'); // newest first, one cursor page at a time
+      setNotifications(prev => (pageUrl ? [...prev, ...response.data.results] : response.data.results));
+      setNextNotificationsPage(response.data.next);
     } catch (error) {
       console.error('Error fetching notifications:', error);
     }
@@ -63,8 +65,65 @@ const Home = () => {
 
   useEffect(() => {
     fetchUnreadNotificationCount();
-    const interval = setInterval(fetchUnreadNotificationCount, 30000);
-    return () => clearInterval(interval);
+
+    // Live updates over server-sent events; poll only while the stream is not connected.
+    // The stream is opened with a short-lived ticket (EventSource cannot send the JWT header), and a
+    // 404 for the ticket means the server only supports polling.
+    let source = null;
+    let reconnect = null;
+    let closed = false;
+    let lastEventId = null;
+
+    const openStream = async () => {
+      if (typeof EventSource === 'undefined') return;
+      let ticket;
+      try {
+        ticket = (await api.post('/notifications/stream-ticket/')).data.ticket;
+      } catch (error) {
+        if (error.response?.status !== 404) {
+          reconnect = setTimeout(openStream, 60000);
+        }
+        return;
+      }
+      if (closed) return;
+      const params = new URLSearchParams({ ticket });
+      if (lastEventId) params.set('last_event_id', lastEventId);
+      source = new EventSource(`${api.defaults.baseURL}/notifications/stream/?${params}`);
+      source.addEventListener('unread_count', (event) => {
+        setUnreadNotificationCount(JSON.parse(event.data).unread_count);
+      });
+      source.addEventListener('notification', (event) => {
+        const notification = JSON.parse(event.data);
+        lastEventId = event.lastEventId || lastEventId;
+        setNotifications(prev => (prev.some(n => n.id === notification.id) ? prev : [notification, ...prev]));
+        if (!notification.is_read) {
+          setUnreadNotificationCount(prev => prev + 1);
+        }
+      });
+      source.addEventListener('resync', () => {
+        fetchUnreadNotificationCount();
+        fetchNotifications();
+      });
+      source.onerror = () => {
+        // Tickets expire within seconds: reconnect with a fresh one instead of letting EventSource retry the old URL
+        source.close();
+        source = null;
+        if (!closed) reconnect = setTimeout(openStream, 15000);
+      };
+    };
+    openStream();
+
+    const interval = setInterval(() => {
+      if (!source || source.readyState !== EventSource.OPEN) {
+        fetchUnreadNotificationCount();
+      }
+    }, 30000);
+    return () => {
+      closed = true;
+      clearInterval(interval);
+      clearTimeout(reconnect);
+      if (source) source.close();
+    };
   }, []);
 
   const handleNotificationBellClick = () => {
@@ -202,6 +261,11 @@ const Home = () => {
                         </div>
                       </Dropdown.Item>
                     ))}
+                    {nextNotificationsPage && (
+                      <Dropdown.Item onClick={() => fetchNotifications(nextNotificationsPage)} className="text-center">
+                        Load older notifications
+                      </Dropdown.Item>
+                    )}
                     <Dropdown.Divider />
                     <Dropdown.Item onClick={markAllNotificationsAsRead} className="notification-mark-all-read-btn">
                       Mark all as read
@@ -7,6 +7,7 @@ import '../Products/Allproduct.css'; // Ensure this path is correct
 import 'react-toastify/dist/ReactToastify.css'; 
 const AllProducts = () => {
   const [products, setProducts] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [isFormOpen, setIsFormOpen] = useState(false);
   const [currentProduct, setCurrentProduct] = useState(null); // Used for editing existing approved products
   const [isLoading, setIsLoading] = useState(false);
@@ -29,11 +30,11 @@ const AllProducts = () => {
     fetchProducts();
   }, []);
 
-  const fetchProducts = async () => {
+  const fetchProducts = async (pageUrl = null) => {
     try {
-      const res = await api.get('/products/'); // This fetches only APPROVED products
+      const res = await api.get(pageUrl || '/products/'); // This fetches only APPROVED products, one cursor page at a time
       // Ensure image URLs are complete and handle relative vs. absolute paths
-      const productsWithFullImageUrls = res.data.map(product => {
+      const productsWithFullImageUrls = res.data.results.map(product => {
         let imageUrl = product.image;
         // Check if the image path is already a full URL (starts with http or https)
         if (imageUrl && !imageUrl.startsWith('http://') && !imageUrl.startsWith('https://')) {
@@ -45,7 +46,8 @@ const AllProducts = () => {
           image: imageUrl
         };
       });
-      setProducts(productsWithFullImageUrls);
+      setProducts(prev => (pageUrl ? [...prev, ...productsWithFullImageUrls] : productsWithFullImageUrls));
+      setNextPage(res.data.next);
     } catch (error) {
       toast.error('Failed to fetch products');
       console.error("Error fetching products:", error); // Log the error for debugging
@@ -621,6 +623,11 @@ const AllProducts = () => {
                 ))}
               </tbody>
             </table>
+            {nextPage && (
+              <button className="btn btn-outline-primary mt-3" onClick={() => fetchProducts(nextPage)}>
+                Load more
+              </button>
+            )}
           </div>
         ) : (
           <div className="no-products-message">
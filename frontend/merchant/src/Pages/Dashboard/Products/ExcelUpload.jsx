@@ -35,20 +35,46 @@ const  ExcelUpload = () => {
     }
   };
 
+  // The error report needs the auth header, so fetch it as a blob instead of linking to it
+  const downloadErrorReport = async () => {
+    try {
+      const token = localStorage.getItem('access_token');
+      const res = await axios.get(response.error_report_url, {
+        headers: { 'Authorization': `Bearer ${token}` },
+        responseType: 'blob'
+      });
+      const url = window.URL.createObjectURL(res.data);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = `product-upload-${response.upload_id}-errors.csv`;
+      link.click();
+      window.URL.revokeObjectURL(url);
+    } catch (err) {
+      setError('Could not download the error report');
+    }
+  };
+
   return (
     <div className="p-4 border rounded bg-light shadow-sm">
       <h4>Upload Products via Excel</h4>
-      <input type="file" accept=".xlsx" onChange={handleFileChange} className="form-control my-2" />
+      <input type="file" accept=".xlsx,.csv" onChange={handleFileChange} className="form-control my-2" />
       <button className="btn btn-primary" onClick={handleUpload}>Upload</button>
 
       {response && (
         <div className="alert alert-success mt-3">
           <p>{response.message}</p>
-          <ul>
-            {response.products.map((prod, index) => (
-              <li key={index}>{prod}</li>
-            ))}
-          </ul>
+          {response.errors.length > 0 && (
+            <ul>
+              {response.errors.map((item, index) => (
+                <li key={index}>Row {item.row}{item.name ? ` (${item.name})` : ''}: {item.error}</li>
+              ))}
+            </ul>
+          )}
+          {response.error_report_url && (
+            <button className="btn btn-outline-secondary btn-sm" onClick={downloadErrorReport}>
+              Download error report
+            </button>
+          )}
         </div>
       )}
 
@@ -10,6 +10,7 @@ const SmartAddProduct = () => {
   const [categories, setCategories] = useState([]);
   const [selectedCategoryId, setSelectedCategoryId] = useState(null);
   const [products, setProducts] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [selectedProducts, setSelectedProducts] = useState([]);
 
   useEffect(() => {
@@ -22,7 +23,19 @@ const SmartAddProduct = () => {
     setSelectedCategoryId(id);
     setSelectedProducts([]);
     api.get(`/smart-add/products/${id}/`)
-      .then((res) => setProducts(res.data))
+      .then((res) => {
+        setProducts(res.data.results);
+        setNextPage(res.data.next);
+      })
+      .catch(() => toast.error('Failed to load products'));
+  };
+
+  const loadMoreProducts = () => {
+    api.get(nextPage)
+      .then((res) => {
+        setProducts((prev) => [...prev, ...res.data.results]);
+        setNextPage(res.data.next);
+      })
       .catch(() => toast.error('Failed to load products'));
   };
 
@@ -45,6 +58,7 @@ const SmartAddProduct = () => {
       .then((res) => {
         toast.success(`Successfully added ${res.data.added_count} products`);
         setProducts([]);
+        setNextPage(null);
         setSelectedProducts([]);
       })
       .catch((err) => {
@@ -104,6 +118,12 @@ const SmartAddProduct = () => {
         ))}
       </div>
 
+      {nextPage && (
+        <div className={styles.submitContainer}>
+          <Button onClick={loadMoreProducts}>Load more</Button>
+        </div>
+      )}
+
       {products.length > 0 && (
         <div className={styles.submitContainer}>
           <Button 